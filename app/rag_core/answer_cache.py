@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import List, Dict, Optional, Iterable
+
+# Add current directory to path for module imports
+sys.path.append(os.path.dirname(__file__))
+from embedding_cache import normalize_query
+
+# Persistent cache of RAGEngine answers. An entry is keyed by
+# (chat model, prompt version, normalized question, ordered chunk ids), so a
+# repeated question only skips the LLM when it retrieved exactly the same context.
+ANSWER_CACHE_FILE = "answers.sqlite"
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+MAX_ANSWERS = 20000
+
+
+def chunk_id(chunk: Dict) -> str:
+    """Content-addressed chunk id: stable across compaction, changes whenever the text does."""
+    digest = hashlib.sha1(chunk["text"].encode('utf-8')).hexdigest()
+    return f"{chunk.get('path') or chunk['source']}#{digest}"
+
+
+def answer_key(model: str, prompt_version: int, question: str, chunks: List[Dict]) -> str:
+    payload = json.dumps([model, prompt_version, normalize_query(question), [chunk_id(c) for c in chunks]])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AnswerCache:
+    """
+    SQLite answer store with TTL expiry and LRU eviction. `answer_sources` maps each
+    entry to the files it cited so re-ingesting a file drops every answer built on it.
+    """
+    def __init__(self, db_path: str, ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS,
+                 max_items: int = MAX_ANSWERS):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self.stats_counts = {"hits": 0, "misses": 0, "expired": 0, "invalidated": 0}
+        self.lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, answer TEXT, created REAL, last_used REAL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS answer_sources (key TEXT, path TEXT)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_answer_last_used ON answers(last_used)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_answer_sources_path ON answer_sources(path)")
+        self.conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT answer, created FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats_counts["misses"] += 1
+                return None
+            answer, created = row
+            if self.ttl_seconds is not None and now - created > self.ttl_seconds:
+                self._delete_keys([key])
+                self.conn.commit()
+                self.stats_counts["expired"] += 1
+                self.stats_counts["misses"] += 1
+                return None
+            self.conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.stats_counts["hits"] += 1
+            return answer
+
+    def put(self, key: str, answer: str, chunks: List[Dict]):
+        now = time.time()
+        paths = {c.get("path") or c["source"] for c in chunks}
+        with self.lock:
+            self._delete_keys([key])
+            self.conn.execute("INSERT INTO answers VALUES (?, ?, ?, ?)", (key, answer, now, now))
+            self.conn.executemany("INSERT INTO answer_sources VALUES (?, ?)", [(key, p) for p in paths])
+            self._evict()
+            self.conn.commit()
+
+    def invalidate_paths(self, paths: Iterable[str]) -> int:
+        """Drop every answer that cited a chunk from any of `paths`. Returns the count."""
+        paths = list(paths)
+        if not paths:
+            return 0
+        with self.lock:
+            keys = set()
+            for i in range(0, len(paths), 500):
+                batch = paths[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                keys.update(row[0] for row in self.conn.execute(
+                    f"SELECT key FROM answer_sources WHERE path IN ({placeholders})", batch
+                ))
+            keys = list(keys)
+            self._delete_keys(keys)
+            self.conn.commit()
+            self.stats_counts["invalidated"] += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM answers")
+            self.conn.execute("DELETE FROM answer_sources")
+            self.conn.commit()
+
+    def _delete_keys(self, keys: List[str]):
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            self.conn.execute(f"DELETE FROM answers WHERE key IN ({placeholders})", batch)
+            self.conn.execute(f"DELETE FROM answer_sources WHERE key IN ({placeholders})", batch)
+
+    def _evict(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        if count <= self.max_items:
+            return
+        # Drop the least recently used ~10% at once so eviction isn't paid on every insert
+        excess = count - self.max_items + self.max_items // 10
+        keys = [row[0] for row in self.conn.execute(
+            "SELECT key FROM answers ORDER BY last_used LIMIT ?", (excess,)
+        )]
+        self._delete_keys(keys)
+
+    def stats(self) -> Dict:
+        total = self.stats_counts["hits"] + self.stats_counts["misses"]
+        items = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        return {
+            **self.stats_counts,
+            "items": items,
+            "hit_rate": round(self.stats_counts["hits"] / total, 3) if total else 0.0,
+        }
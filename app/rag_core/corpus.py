@@ -0,0 +1,23 @@
+from typing import Dict, Iterable
+
+# Unified Chroma corpus: each book is chunked, embedded and HNSW-indexed once,
+# no matter how many domain folders it sits in. Chroma metadata values are
+# scalars, so domain membership is one boolean flag per domain
+# (`domain_code: True`), and a domain-scoped search is a `where` filter on its flag.
+CORPUS_COLLECTION = "rag_corpus"
+DOMAIN_FLAG_PREFIX = "domain_"
+
+
+def domain_flag(domain: str) -> str:
+    return f"{DOMAIN_FLAG_PREFIX}{domain}"
+
+
+def domain_filter(domain: str) -> Dict:
+    """Chroma `where` clause selecting the chunks of books in `domain`."""
+    return {domain_flag(domain): True}
+
+
+def membership_metadata(domains: Iterable[str], all_domains: Iterable[str]) -> Dict:
+    """Flags for every known domain (explicit False, so an update also clears stale membership)."""
+    domains = set(domains)
+    return {domain_flag(d): d in domains for d in all_domains}
@@ -0,0 +1,93 @@
+import os
+import re
+from typing import Dict, Iterator, Tuple, Optional
+import pandas as pd
+
+# Try importing pypdf, handle if missing
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+# Streaming document readers shared by RAGEngine and tools/admin/ingest_books.py.
+# A document is a stream of (text, location) segments, so it is never held whole
+# in memory: PDFs yield one page at a time ({"page": n}), CSVs one row group at a
+# time ({"row_start", "row_end"}), and text/markdown blocks ({}).
+SUPPORTED_EXTENSIONS = ('.txt', '.md', '.csv', '.pdf')
+TEXT_READ_BLOCK = 1024 * 1024  # Characters per read for .txt/.md
+CSV_ROWS_PER_GROUP = 500       # Rows rendered together for .csv
+
+# Text blocks end just before a " word" that follows a letter. That is always a
+# pre-token boundary for the GPT tokenizers, so tokenizing block by block gives
+# exactly the tokens of the whole text.
+SAFE_SPLIT = re.compile(r"[A-Za-z](?= [A-Za-z])")
+SAFE_SPLIT_WINDOW = 4096       # Trailing characters searched for a split point
+
+
+def read_text_blocks(file_path: str, block_size: int = TEXT_READ_BLOCK) -> Iterator[str]:
+    """Yield the file's text in ~block_size pieces, each ending at a tokenizer-safe boundary."""
+    carry = ""
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        for block in iter(lambda: f.read(block_size), ''):
+            text = carry + block
+            split = None
+            for match in SAFE_SPLIT.finditer(text, max(0, len(text) - SAFE_SPLIT_WINDOW)):
+                split = match.end()
+            if split is None:
+                if len(text) < max(block_size, SAFE_SPLIT_WINDOW):
+                    # No boundary near the end (unusual text): carry the block over
+                    carry = text
+                    continue
+                # Still none after a full block (digits, tables, CJK): hard split so the
+                # carry stays bounded; only this cut may differ from whole-text tokens
+                carry = ""
+                yield text
+                continue
+            carry = text[split:]
+            yield text[:split]
+    if carry:
+        yield carry
+
+
+def read_csv_groups(file_path: str) -> Iterator[Tuple[str, Dict]]:
+    row = 1
+    try:
+        for df in pd.read_csv(file_path, chunksize=CSV_ROWS_PER_GROUP):
+            yield df.to_string(index=False) + "\n", {"row_start": row, "row_end": row + len(df) - 1}
+            row += len(df)
+    except Exception:
+        if row > 1:
+            raise
+        # Not parseable as a table: index the raw text
+        for block in read_text_blocks(file_path):
+            yield block, {}
+
+
+def pdf_page_count(file_path: str) -> int:
+    if not PdfReader:
+        return 0
+    return len(PdfReader(file_path).pages)
+
+
+def read_pdf_pages(file_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[str, Dict]]:
+    """Pages [start, stop) (0-based), each as (text, {"page": 1-based number}); empty pages are skipped."""
+    if not PdfReader:
+        return
+    reader = PdfReader(file_path)
+    stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+    for index in range(start, stop):
+        extracted = reader.pages[index].extract_text()
+        if extracted:
+            yield extracted + "\n", {"page": index + 1}
+
+
+def read_segments(file_path: str) -> Iterator[Tuple[str, Dict]]:
+    """Stream any supported document as (text, location) segments."""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == '.txt' or ext == '.md':
+        for block in read_text_blocks(file_path):
+            yield block, {}
+    elif ext == '.csv':
+        yield from read_csv_groups(file_path)
+    elif ext == '.pdf':
+        yield from read_pdf_pages(file_path)
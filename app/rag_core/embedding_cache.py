@@ -0,0 +1,224 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple, Callable
+
+# Shared by RAGEngine, RAGAgent and rag_chat so a repeated question never pays
+# for a second embeddings round trip, even across processes/restarts.
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), '.tmp')
+DEFAULT_CACHE_PATH = os.path.join(CACHE_DIR, 'query_embeddings.sqlite')
+MAX_MEMORY_ITEMS = 1024
+MAX_DISK_ITEMS = 50000
+# Chunk (document) embeddings, keyed by exact content so re-ingests and the same
+# book in several domain collections never pay for identical text twice.
+DEFAULT_CONTENT_CACHE_PATH = os.path.join(CACHE_DIR, 'chunk_embeddings.sqlite')
+
+
+def normalize_query(query: str) -> str:
+    """Case/whitespace-insensitive key so trivially different phrasings share an entry."""
+    return " ".join(query.split()).lower()
+
+
+class QueryEmbeddingCache:
+    """
+    Two-tier cache of query embeddings keyed by (embedding model, normalized query):
+    an in-process LRU in front of a SQLite store of float32 blobs.
+    """
+    def __init__(self, db_path: str = DEFAULT_CACHE_PATH,
+                 max_memory_items: int = MAX_MEMORY_ITEMS, max_disk_items: int = MAX_DISK_ITEMS):
+        self.db_path = db_path
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.memory: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self.stats_counts = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self.lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings ("
+            "model TEXT, query TEXT, embedding BLOB, last_used REAL, PRIMARY KEY (model, query))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_query_last_used ON query_embeddings(last_used)")
+        self.conn.commit()
+
+    def get(self, model: str, query: str) -> Optional[List[float]]:
+        key = (model, normalize_query(query))
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.stats_counts["memory_hits"] += 1
+                return self.memory[key]
+
+            row = self.conn.execute(
+                "SELECT embedding FROM query_embeddings WHERE model = ? AND query = ?", key
+            ).fetchone()
+            if row is None:
+                self.stats_counts["misses"] += 1
+                return None
+
+            self.conn.execute(
+                "UPDATE query_embeddings SET last_used = ? WHERE model = ? AND query = ?",
+                (time.time(), *key),
+            )
+            self.conn.commit()
+            embedding = np.frombuffer(row[0], dtype='float32').tolist()
+            self.stats_counts["disk_hits"] += 1
+            self._remember(key, embedding)
+            return embedding
+
+    def put(self, model: str, query: str, embedding: List[float]):
+        key = (model, normalize_query(query))
+        blob = np.asarray(embedding, dtype='float32').tobytes()
+        with self.lock:
+            self._remember(key, list(embedding))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?)",
+                (*key, blob, time.time()),
+            )
+            self._evict_disk()
+            self.conn.commit()
+
+    def _remember(self, key: Tuple[str, str], embedding: List[float]):
+        self.memory[key] = embedding
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_items:
+            self.memory.popitem(last=False)
+
+    def _evict_disk(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+        if count <= self.max_disk_items:
+            return
+        # Drop the least recently used ~10% at once so eviction isn't paid on every insert
+        excess = count - self.max_disk_items + self.max_disk_items // 10
+        self.conn.execute(
+            "DELETE FROM query_embeddings WHERE rowid IN "
+            "(SELECT rowid FROM query_embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+
+    def get_or_embed(self, client, model: str, query: str) -> List[float]:
+        return self.get_or_embed_many(client, model, [query])[0]
+
+    def get_or_embed_many(self, client, model: str, queries: List[str]) -> List[List[float]]:
+        """
+        Return embeddings for queries, sending only cache misses to the API (one request).
+        `client` is an OpenAI client or an EmbeddingProvider (anything with .embed()).
+        """
+        results: List[Optional[List[float]]] = [self.get(model, q) for q in queries]
+        missing = {}
+        for i, q in enumerate(queries):
+            if results[i] is None:
+                missing.setdefault(normalize_query(q), []).append(i)
+
+        if missing:
+            texts = [queries[idxs[0]] for idxs in missing.values()]
+            if hasattr(client, "embed"):
+                embeddings = client.embed(texts)
+            else:
+                embeddings = [data.embedding for data in client.embeddings.create(input=texts, model=model).data]
+            for idxs, text, embedding in zip(missing.values(), texts, embeddings):
+                self.put(model, text, embedding)
+                for i in idxs:
+                    results[i] = embedding
+        return results
+
+    def stats(self) -> Dict:
+        hits = self.stats_counts["memory_hits"] + self.stats_counts["disk_hits"]
+        total = hits + self.stats_counts["misses"]
+        return {
+            **self.stats_counts,
+            "memory_items": len(self.memory),
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+        }
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ContentEmbeddingCache:
+    """
+    Chunk embeddings keyed by (embedding model, SHA-256 of the exact text), stored as
+    float32 blobs in SQLite. Unlike the query cache there is no normalization and no
+    eviction: an entry is valid for as long as the model is.
+    """
+    def __init__(self, db_path: str = DEFAULT_CONTENT_CACHE_PATH):
+        self.db_path = db_path
+        self.stats_counts = {"hits": 0, "misses": 0, "duplicates": 0}
+        self.lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_embeddings ("
+            "model TEXT, text_hash TEXT, embedding BLOB, PRIMARY KEY (model, text_hash))"
+        )
+        self.conn.commit()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self.lock:
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                cursor = self.conn.execute(
+                    f"SELECT text_hash, embedding FROM chunk_embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model] + batch,
+                )
+                for text_hash, blob in cursor:
+                    found[text_hash] = np.frombuffer(blob, dtype='float32').tolist()
+        return found
+
+    def put_many(self, model: str, items: List[Tuple[str, List[float]]]):
+        rows = [(model, text_hash, np.asarray(emb, dtype='float32').tobytes()) for text_hash, emb in items]
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO chunk_embeddings VALUES (?, ?, ?)", rows)
+            self.conn.commit()
+
+    def embed(self, embed_fn: Callable[[List[str]], List[List[float]]], model: str,
+              texts: List[str]) -> List[List[float]]:
+        """
+        Embeddings for texts in input order. Duplicate texts are embedded once and
+        only texts never seen for this model are passed to embed_fn.
+        """
+        hashes = [content_hash(t) for t in texts]
+        unique = list(dict.fromkeys(hashes))
+        found = self.get_many(model, unique)
+        missing = [h for h in unique if h not in found]
+        if missing:
+            text_by_hash = dict(zip(hashes, texts))
+            new_embeddings = embed_fn([text_by_hash[h] for h in missing])
+            # Persist before returning so an interrupted ingest keeps what it paid for
+            self.put_many(model, list(zip(missing, new_embeddings)))
+            found.update(zip(missing, new_embeddings))
+        self.stats_counts["hits"] += len(unique) - len(missing)
+        self.stats_counts["misses"] += len(missing)
+        self.stats_counts["duplicates"] += len(texts) - len(unique)
+        return [found[h] for h in hashes]
+
+    def stats(self) -> Dict:
+        lookups = self.stats_counts["hits"] + self.stats_counts["misses"]
+        return {
+            **self.stats_counts,
+            "hit_rate": round(self.stats_counts["hits"] / lookups, 3) if lookups else 0.0,
+        }
+
+
+_default_cache: Optional[QueryEmbeddingCache] = None
+
+
+def get_query_cache() -> QueryEmbeddingCache:
+    """Process-wide cache instance shared by every retriever."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = QueryEmbeddingCache()
+    return _default_cache
@@ -0,0 +1,181 @@
+import re
+import time
+import zlib
+import random
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+# Embedding backends for RAGEngine. Every provider shares the same batching engine:
+# token-aware batch sizing, bounded concurrent requests, a token-bucket rate limiter
+# and exponential backoff. Subclasses only implement _embed_batch().
+MAX_BATCH_TOKENS = 100000   # Per-request token budget (API hard limit is ~300k)
+MAX_BATCH_ITEMS = 2048      # Per-request input limit
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0          # Seconds; doubled per retry, with jitter
+BACKOFF_MAX = 60.0
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` units per second, bursts up to `capacity`."""
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0):
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait = (amount - self.available) / self.rate
+            time.sleep(wait)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying."""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    name = type(error).__name__
+    return any(x in name for x in ("RateLimit", "Timeout", "Connection", "InternalServer"))
+
+
+class EmbeddingProvider:
+    def __init__(self, model: str, dim: int, max_concurrency: int = 1,
+                 max_batch_tokens: int = MAX_BATCH_TOKENS, max_batch_items: int = MAX_BATCH_ITEMS,
+                 requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None,
+                 max_retries: int = MAX_RETRIES):
+        self.model = model
+        self.dim = dim
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_items = max_batch_items
+        self.max_retries = max_retries
+        self.request_limiter = TokenBucket(requests_per_minute / 60.0, requests_per_minute) if requests_per_minute else None
+        self.token_limiter = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute else None
+        self.encoder = None
+        if tiktoken is not None:
+            try:
+                self.encoder = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                # BPE file unavailable (offline); fall back to a character estimate
+                self.encoder = None
+
+    def count_tokens(self, text: str) -> int:
+        if self.encoder is not None:
+            return len(self.encoder.encode(text, disallowed_special=()))
+        return len(text) // 4 + 1
+
+    def plan_batches(self, texts: List[str]) -> List[Tuple[List[int], int]]:
+        """Group text indices into (indices, token_count) requests under both the token and item limits."""
+        batches, current, current_tokens = [], [], 0
+        for i, text in enumerate(texts):
+            tokens = self.count_tokens(text)
+            if current and (current_tokens + tokens > self.max_batch_tokens or len(current) >= self.max_batch_items):
+                batches.append((current, current_tokens))
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append((current, current_tokens))
+        return batches
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def _embed_with_retry(self, texts: List[str], tokens: int) -> List[List[float]]:
+        attempt = 0
+        while True:
+            if self.request_limiter:
+                self.request_limiter.acquire(1)
+            if self.token_limiter:
+                self.token_limiter.acquire(tokens)
+            try:
+                return self._embed_batch(texts)
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries or not is_retryable(e):
+                    raise
+                wait = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                print(f"    - Embedding request failed ({e}). Retry {attempt}/{self.max_retries} in {wait:.1f}s...")
+                time.sleep(wait)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, running up to max_concurrency requests at once. Output order matches input."""
+        if not texts:
+            return []
+        batches = self.plan_batches(texts)
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        def run(batch):
+            indices, tokens = batch
+            embeddings = self._embed_with_retry([texts[i] for i in indices], tokens)
+            for i, emb in zip(indices, embeddings):
+                results[i] = emb
+
+        if self.max_concurrency == 1 or len(batches) == 1:
+            for batch in batches:
+                run(batch)
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+                # list() re-raises the first failure after in-flight requests finish
+                list(pool.map(run, batches))
+        return results
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    DIMS = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072, "text-embedding-ada-002": 1536}
+
+    def __init__(self, client, model: str, max_concurrency: int = 4, **kwargs):
+        super().__init__(model, self.DIMS.get(model, 1536), max_concurrency=max_concurrency, **kwargs)
+        self.client = client
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(input=texts, model=self.model)
+        return [data.embedding for data in response.data]
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Offline, deterministic embeddings: signed feature hashing of words and
+    character trigrams. No network, stable across processes and machines, so
+    ingestion/retrieval can be benchmarked locally. Not a semantic model.
+    """
+    TOKEN_RE = re.compile(r"\w+")
+
+    def __init__(self, dim: int = 1536, **kwargs):
+        super().__init__(f"hashing-ngram-{dim}", dim, **kwargs)
+
+    def _features(self, text: str) -> List[int]:
+        features = []
+        for word in self.TOKEN_RE.findall(text.lower()):
+            features.append(zlib.crc32(word.encode('utf-8')))
+            padded = f"<{word}>"
+            features.extend(zlib.crc32(padded[i:i + 3].encode('utf-8')) for i in range(len(padded) - 2))
+        return features
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        vectors = np.zeros((len(texts), self.dim), dtype='float32')
+        for row, text in enumerate(texts):
+            hashes = np.array(self._features(text), dtype='uint32')
+            if not len(hashes):
+                continue
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype('float32')
+            np.add.at(vectors[row], hashes % self.dim, signs)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return (vectors / norms).tolist()
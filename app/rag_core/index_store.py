@@ -0,0 +1,763 @@
+import os
+import sys
+import glob
+import json
+import pickle
+import hashlib
+import sqlite3
+import time
+import zlib
+import numpy as np
+from typing import List, Dict, Iterable, Iterator, Optional, Set, Tuple, Any
+
+# Add current directory to path for module imports
+sys.path.append(os.path.dirname(__file__))
+from ivf_index import IVFIndex, IVF_FILE, IVF_DELTA_PATTERN, DEFAULT_NPROBE, TRAIN_POINTS_PER_LIST, default_n_lists
+
+# On-disk layout of an index directory:
+#   base_<id>.npy           - float32 (N, D) base matrix of L2-normalized vectors, opened with mmap_mode='r'
+#   delta_<start_row>.npy   - append-only segments written by ingestion, merged into the base by compact()
+#   ivf.npz                 - optional IVF centroids + per-row list assignments (see ivf_index.py)
+#   ivf_delta_*.npy         - list assignments of rows appended since ivf.npz was written
+#   chunks.sqlite           - chunk text + metadata keyed by global row id, the per-file
+#                             manifest (size, mtime, content hash), row tombstones and the
+#                             segment manifest (file, start row, rows, crc32, size, mtime_ns)
+# Segment files are immutable: written to a temp file, fsynced and renamed into place, then
+# published by the same SQLite transaction that inserts their chunk records. A crash at any
+# point leaves the previous committed state; unreferenced files are swept by compact().
+# A segment's CRC32 is verified once (when written or adopted); later loads trust a file
+# whose size and mtime still match the manifest and only re-checksum files that changed.
+# The matrices are shared across processes through the OS page cache and are never
+# copied into Python objects; text is only fetched for the rows a query returns.
+EMBEDDING_DIM = 1536
+MATRIX_FILE = "embeddings.npy"  # Pre-manifest base matrix; adopted on first load
+BASE_PATTERN = "base_*.npy"
+DELTA_PATTERN = "delta_*.npy"
+CHUNKS_DB = "chunks.sqlite"
+CORE_FIELDS = ("text", "source", "path")
+# Upper bound on the (queries x rows) score block held in memory at once (~64MB float32)
+SCORE_BLOCK_ELEMENTS = 16 * 1024 * 1024
+# Upper bound on the float32 rows converted from the quantized matrix (or gathered) per block
+VECTOR_BLOCK_BYTES = 64 * 1024 * 1024
+# Quantized rows are widened to float32 in cache-sized steps through one reused buffer
+WIDEN_BLOCK_BYTES = 4 * 1024 * 1024
+# Optional low-precision first pass; candidates are rescored against the float32 mmap
+QUANTIZATION_MODES = ("float16", "int8")
+RESCORE_FACTOR = 4  # First-pass candidates per requested result
+
+
+def file_sha256(path: str) -> str:
+    """Streaming content hash of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_crc32(path: str) -> int:
+    """Streaming CRC32 of a file (segment checksum)."""
+    crc = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            crc = zlib.crc32(block, crc)
+    return crc
+
+
+class _ChecksumWriter:
+    """File wrapper that checksums bytes as np.save writes them, so segments are never re-read."""
+    def __init__(self, f):
+        self.f = f
+        self.crc = 0
+
+    def write(self, data):
+        self.crc = zlib.crc32(data, self.crc)
+        return self.f.write(data)
+
+
+def text_sha1(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row so that dot product == cosine similarity."""
+    matrix = np.asarray(matrix, dtype='float32')
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    # Avoid divide by zero
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+class GrowableMatrix:
+    """Row-appendable matrix with amortized capacity doubling."""
+    def __init__(self, dim: int, capacity: int = 1024, dtype: str = 'float32'):
+        self.dim = dim
+        self.size = 0
+        self.buffer = np.empty((capacity, dim), dtype=dtype)
+
+    def append(self, rows: np.ndarray):
+        needed = self.size + len(rows)
+        if needed > self.buffer.shape[0]:
+            new_capacity = max(self.buffer.shape[0] * 2, needed)
+            new_buffer = np.empty((new_capacity, self.dim), dtype=self.buffer.dtype)
+            new_buffer[:self.size] = self.buffer[:self.size]
+            self.buffer = new_buffer
+        self.buffer[self.size:needed] = rows
+        self.size = needed
+
+    @property
+    def view(self) -> np.ndarray:
+        return self.buffer[:self.size]
+
+
+def quantize_rows(vectors: np.ndarray, mode: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """float16 cast, or int8 codes with a per-row scale (row ~= codes * scale)."""
+    vectors = np.asarray(vectors, dtype='float32')
+    if mode == "float16":
+        return vectors.astype('float16'), None
+    if mode == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1
+        codes = np.round(vectors / scales[:, None]).astype('int8')
+        return codes, scales.astype('float32')
+    raise ValueError(f"Unknown quantization mode '{mode}'. Use one of {QUANTIZATION_MODES}.")
+
+
+class QuantizedMatrix:
+    """In-RAM low-precision copy of every row, used for the first scoring pass."""
+    def __init__(self, mode: str, dim: int):
+        self.mode = mode
+        self.codes = GrowableMatrix(dim, dtype='float16' if mode == "float16" else 'int8')
+        self.scales = GrowableMatrix(1) if mode == "int8" else None
+
+    def append(self, vectors: np.ndarray):
+        codes, scales = quantize_rows(vectors, self.mode)
+        self.codes.append(codes)
+        if self.scales is not None:
+            self.scales.append(scales[:, None])
+
+    def block(self) -> tuple:
+        scales = self.scales.view[:, 0] if self.scales is not None else None
+        return (0, self.codes.view, scales)
+
+    @property
+    def nbytes(self) -> int:
+        total = self.codes.view.nbytes
+        if self.scales is not None:
+            total += self.scales.view.nbytes
+        return total
+
+
+def _merge_top_k(best_ids: np.ndarray, best_scores: np.ndarray, ids: np.ndarray, scores: np.ndarray, k: int):
+    """Fold a (Q, b) score block with row ids (b,) into the running (Q, <=k) candidates."""
+    cand_scores = np.concatenate([best_scores, scores], axis=1)
+    cand_ids = np.concatenate([best_ids, np.broadcast_to(ids, scores.shape)], axis=1)
+    if cand_scores.shape[1] > k:
+        part = np.argpartition(-cand_scores, k - 1, axis=1)[:, :k]
+        cand_scores = np.take_along_axis(cand_scores, part, axis=1)
+        cand_ids = np.take_along_axis(cand_ids, part, axis=1)
+    return cand_ids, cand_scores
+
+
+def _rank(ids: np.ndarray, scores: np.ndarray):
+    """Sort each row by descending score; equal scores order by row id so results are reproducible."""
+    order = np.lexsort((ids, -scores), axis=-1)
+    return np.take_along_axis(ids, order, axis=-1), np.take_along_axis(scores, order, axis=-1)
+
+
+class IndexStore:
+    def __init__(self, index_dir: str, dim: int = EMBEDDING_DIM, quantization: Optional[str] = None):
+        self.index_dir = index_dir
+        self.dim = dim
+        # "float16" / "int8": score a compact in-RAM copy first, rescore with float32 from disk
+        self.quantization = quantization
+        self.quantized: Optional[QuantizedMatrix] = None
+        # Optional approximate index; kept in step with appends and compaction
+        self.ivf: Optional[IVFIndex] = None
+        # field -> {value: sorted row ids}; built lazily per filtered field, extended on append
+        self.postings: Dict[str, Dict[Any, np.ndarray]] = {}
+        self.matrix_path = os.path.join(index_dir, MATRIX_FILE)
+        self.db_path = os.path.join(index_dir, CHUNKS_DB)
+        # (start_row, matrix) blocks: mmapped base + mmapped deltas, including this session's appends
+        self.segments: List[tuple] = []
+        # Sorted row ids whose chunks were replaced/deleted; excluded from search until compact()
+        self.dead = np.empty(0, dtype='int64')
+
+        if not os.path.exists(index_dir):
+            os.makedirs(index_dir)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "row_id INTEGER PRIMARY KEY, source TEXT, path TEXT, text TEXT, meta TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_path ON chunks(path)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime REAL, content_hash TEXT)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS tombstones (row_id INTEGER PRIMARY KEY)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS segments ("
+            "file TEXT PRIMARY KEY, start_row INTEGER, rows INTEGER, checksum INTEGER, size INTEGER, mtime_ns INTEGER)"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(segments)")}
+        for column in ("size", "mtime_ns"):
+            if column not in columns:
+                # Manifests from before stat tracking: their segments are checksummed once on the next load
+                self.conn.execute(f"ALTER TABLE segments ADD COLUMN {column} INTEGER")
+        self.conn.commit()
+
+    def __len__(self) -> int:
+        if self.segments:
+            start, matrix = self.segments[-1]
+            return start + matrix.shape[0]
+        return 0
+
+    def live_count(self) -> int:
+        return len(self) - len(self.dead)
+
+    def _delta_paths(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.index_dir, DELTA_PATTERN)))
+
+    def _manifest(self) -> List[tuple]:
+        """Committed (file, start_row, rows, checksum) segments in row order."""
+        return list(self.conn.execute("SELECT file, start_row, rows, checksum FROM segments ORDER BY start_row"))
+
+    def exists(self) -> bool:
+        return bool(self._manifest()) or os.path.exists(self.matrix_path) or bool(self._delta_paths())
+
+    def _adopt_legacy_segments(self) -> List[tuple]:
+        """Register segment files written before the manifest existed (checksummed as found)."""
+        paths = ([self.matrix_path] if os.path.exists(self.matrix_path) else []) + self._delta_paths()
+        manifest = []
+        total = 0
+        for path in paths:
+            name = os.path.basename(path)
+            start = 0 if name == MATRIX_FILE else int(name[len("delta_"):-len(".npy")])
+            if start != total:
+                print(f"Warning: skipping out-of-sequence segment {name} (expected row {total}).")
+                continue
+            rows = np.load(path, mmap_mode='r').shape[0]
+            manifest.append((name, start, rows, file_crc32(path)))
+            total += rows
+        for name, start, rows, checksum in manifest:
+            self._register_segment(name, start, rows, checksum)
+        self.conn.commit()
+        if manifest:
+            print(f"Registered {len(manifest)} existing segments in the manifest.")
+        return manifest
+
+    def _register_segment(self, name: str, start: int, rows: int, checksum: int):
+        """Manifest entry for a segment whose checksum is known to match (caller commits)."""
+        stat = os.stat(os.path.join(self.index_dir, name))
+        self.conn.execute(
+            "INSERT OR REPLACE INTO segments (file, start_row, rows, checksum, size, mtime_ns) VALUES (?, ?, ?, ?, ?, ?)",
+            (name, start, rows, checksum, stat.st_size, stat.st_mtime_ns),
+        )
+
+    def _unchanged_since_verified(self, name: str, path: str) -> bool:
+        row = self.conn.execute("SELECT size, mtime_ns FROM segments WHERE file = ?", (name,)).fetchone()
+        if row is None or row[0] is None:
+            return False
+        stat = os.stat(path)
+        return (stat.st_size, stat.st_mtime_ns) == tuple(row)
+
+    def _open_segment(self, name: str, start: int, rows: int, checksum: Optional[int],
+                      verify: bool) -> Optional[np.ndarray]:
+        """
+        Memory-map a segment, or None if it is missing, truncated or fails its checksum.
+        The checksum is only recomputed with `verify` or when the file's size/mtime changed.
+        """
+        path = os.path.join(self.index_dir, name)
+        try:
+            if checksum is not None and (verify or not self._unchanged_since_verified(name, path)):
+                if file_crc32(path) != checksum:
+                    return None
+                # Verified: trust this size/mtime from now on
+                self._register_segment(name, start, rows, checksum)
+                self.conn.commit()
+            matrix = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        if matrix.ndim != 2 or matrix.shape[0] != rows:
+            return None
+        return matrix
+
+    def _quarantine(self, name: str, start: int, rows: int):
+        """
+        Tombstone the rows of a damaged segment and forget the files they came from,
+        so the next ingest re-embeds just those files. Rows keep their ids until compact().
+        """
+        end = start + rows - 1
+        paths = [row[0] for row in self.conn.execute(
+            "SELECT DISTINCT path FROM chunks WHERE row_id BETWEEN ? AND ? AND path IS NOT NULL", (start, end)
+        )]
+        self.conn.execute("DELETE FROM chunks WHERE row_id BETWEEN ? AND ?", (start, end))
+        self.conn.executemany("INSERT OR IGNORE INTO tombstones VALUES (?)", ((r,) for r in range(start, end + 1)))
+        self.conn.executemany("DELETE FROM files WHERE path = ?", ((p,) for p in paths))
+        self.conn.commit()
+        self.dead = np.union1d(self.dead, np.arange(start, end + 1, dtype='int64'))
+        print(f"Warning: segment {name} is damaged; skipped its {rows} rows. "
+              f"{len(paths)} files will be re-embedded on the next ingest.")
+
+    def load(self, verify: bool = False):
+        """
+        Memory-map the base matrix and every delta segment (no copy). A segment whose
+        size or mtime changed since it was written is checksummed; `verify` re-checksums
+        every segment (explicit integrity check, reads the whole index). A damaged segment
+        is skipped on its own (its rows become tombstones) instead of discarding the whole index.
+        """
+        self.segments = []
+        self.postings = {}
+        self.dead = np.array(
+            [row[0] for row in self.conn.execute("SELECT row_id FROM tombstones ORDER BY row_id")],
+            dtype='int64',
+        )
+        manifest = self._manifest() or self._adopt_legacy_segments()
+        total = 0
+        for name, start, rows, checksum in manifest:
+            if start != total:
+                raise ValueError(f"Segment manifest is not contiguous at {name} (expected row {total}).")
+            matrix = self._open_segment(name, start, rows, checksum, verify)
+            if matrix is None:
+                self._quarantine(name, start, rows)
+                # Zero-stride placeholder keeps row ids aligned without allocating
+                matrix = np.broadcast_to(np.zeros(self.dim, dtype='float32'), (rows, self.dim))
+            else:
+                self.dim = matrix.shape[1]
+            self.segments.append((start, matrix))
+            total += rows
+        if self.quantization:
+            self.enable_quantization(self.quantization)
+        self._load_ivf()
+
+    def _load_ivf(self):
+        self.ivf = IVFIndex.load(self.index_dir)
+        if self.ivf is None:
+            return
+        assigned = len(self.ivf.assignments)
+        if assigned > len(self):
+            print(f"Warning: IVF index covers {assigned} rows but the store has {len(self)}; ignoring it.")
+            self.ivf = None
+        elif assigned < len(self):
+            # Rows appended after the last IVF save (e.g. interrupted ingest)
+            self.ivf.add(self.take(range(assigned, len(self))))
+            self.ivf.save_appended(self.index_dir)
+
+    def build_ivf(self, n_lists: Optional[int] = None, nprobe: int = DEFAULT_NPROBE):
+        """Train k-means centroids on a sample of live rows and assign every row to a list."""
+        n_lists = n_lists or default_n_lists(self.live_count())
+        live_ids = np.setdiff1d(np.arange(len(self)), self.dead)
+        rng = np.random.default_rng(0)
+        sample_size = min(len(live_ids), n_lists * TRAIN_POINTS_PER_LIST)
+        sample_ids = np.sort(rng.choice(live_ids, sample_size, replace=False))
+        print(f"Training IVF with {n_lists} lists on {sample_size} sampled rows...")
+        ivf = IVFIndex.train(self.take(sample_ids), n_lists, nprobe=nprobe)
+        for _, matrix in self.blocks():
+            ivf.add(matrix)
+        ivf.save(self.index_dir)
+        self.ivf = ivf
+
+    def enable_quantization(self, mode: str):
+        """Build the low-precision first-pass matrix by streaming over the segments."""
+        quantized = QuantizedMatrix(mode, self.dim)
+        rows_per_step = 65536
+        for _, matrix in self.blocks():
+            for offset in range(0, matrix.shape[0], rows_per_step):
+                quantized.append(matrix[offset:offset + rows_per_step])
+        self.quantization = mode
+        self.quantized = quantized
+
+    def blocks(self) -> List[tuple]:
+        """All (start_row, matrix) blocks in row order."""
+        return list(self.segments)
+
+    def top_k(self, query_matrix: np.ndarray, k: int, max_block_elements: int = SCORE_BLOCK_ELEMENTS,
+              rescore_factor: int = RESCORE_FACTOR, exact: bool = False, filters: Optional[Dict] = None):
+        """
+        Top-k row ids and scores for each normalized query (Q, D).
+        Rows are scored in blocks so the (Q, block) score matrix stays bounded,
+        and candidates are merged with argpartition instead of a full sort.
+        With quantization enabled, k * rescore_factor candidates come from the
+        low-precision matrix and are rescored exactly against the float32 rows.
+        If an IVF index is built and `exact` is False, only the nprobe nearest lists are scored.
+        `filters` ({field: value or [values]}) restricts scoring to the matching rows only.
+        Returns (ids, scores), each (Q, k) sorted by descending score.
+        """
+        query_matrix = np.atleast_2d(np.asarray(query_matrix, dtype='float32'))
+        if filters:
+            return self._subset_top_k(query_matrix, k, self.filter_rows(filters), max_block_elements)
+        k = min(k, self.live_count())
+        if self.ivf is not None and not exact and k > 0:
+            return self._ivf_top_k(query_matrix, k)
+        if self.quantized is None or k <= 0:
+            exact_blocks = [(start, matrix, None) for start, matrix in self.blocks()]
+            return self._select(query_matrix, k, exact_blocks, max_block_elements)
+
+        n_candidates = min(k * rescore_factor, self.live_count())
+        cand_ids, _ = self._select(query_matrix, n_candidates, [self.quantized.block()], max_block_elements)
+        rescored = np.empty(cand_ids.shape, dtype='float32')
+        for q in range(len(query_matrix)):
+            rescored[q] = self.take(cand_ids[q]) @ query_matrix[q]
+        ids, scores = _rank(cand_ids, rescored)
+        return ids[:, :k], scores[:, :k]
+
+    def _ivf_top_k(self, query_matrix: np.ndarray, k: int):
+        """Approximate top-k: exact scores over the rows of the probed lists only. Short rows pad with -1."""
+        ids = np.full((len(query_matrix), k), -1, dtype='int64')
+        scores = np.full((len(query_matrix), k), -np.inf, dtype='float32')
+        for q, query_vec in enumerate(query_matrix):
+            cand = np.sort(self.ivf.candidates(query_vec))
+            if len(self.dead):
+                cand = cand[~np.isin(cand, self.dead)]
+            if not len(cand):
+                continue
+            cand_scores = self.take(cand) @ query_vec
+            n = min(k, len(cand))
+            top = np.argpartition(-cand_scores, n - 1)[:n]
+            ids[q, :n], scores[q, :n] = _rank(cand[top], cand_scores[top])
+        return ids, scores
+
+    def _block_rows(self, n_queries: int, max_block_elements: int) -> int:
+        """Rows per scoring block: bounds both the (Q, rows) scores and the (rows, D) float32 vectors."""
+        by_scores = max_block_elements // max(n_queries, 1)
+        by_vectors = VECTOR_BLOCK_BYTES // (self.dim * 4)
+        return max(1, min(by_scores, by_vectors))
+
+    def _select(self, query_matrix: np.ndarray, k: int, blocks: List[tuple], max_block_elements: int):
+        n_queries = query_matrix.shape[0]
+        block_rows = self._block_rows(n_queries, max_block_elements)
+
+        best_ids = np.empty((n_queries, 0), dtype='int64')
+        best_scores = np.empty((n_queries, 0), dtype='float32')
+        if k <= 0:
+            return best_ids, best_scores
+
+        # BLAS has no float16/int8 matmul: quantized rows are widened into one reused float32 buffer
+        widen_rows = max(1, min(block_rows, WIDEN_BLOCK_BYTES // (self.dim * 4)))
+        widened = None
+        for start, matrix, scales in blocks:
+            step = block_rows if matrix.dtype == np.float32 else widen_rows
+            for offset in range(0, matrix.shape[0], step):
+                block = matrix[offset:offset + step]
+                if block.dtype != np.float32:
+                    if widened is None:
+                        widened = np.empty((widen_rows, block.shape[1]), dtype='float32')
+                    np.copyto(widened[:block.shape[0]], block)
+                    block = widened[:block.shape[0]]
+                scores = query_matrix @ block.T
+                if scales is not None:
+                    scores *= scales[offset:offset + step]
+                lo, hi = np.searchsorted(self.dead, [start + offset, start + offset + block.shape[0]])
+                if hi > lo:
+                    scores[:, self.dead[lo:hi] - (start + offset)] = -np.inf
+                ids = np.arange(start + offset, start + offset + block.shape[0])
+                best_ids, best_scores = _merge_top_k(best_ids, best_scores, ids, scores, k)
+
+        return _rank(best_ids, best_scores)
+
+    def _subset_top_k(self, query_matrix: np.ndarray, k: int, row_ids: np.ndarray, max_block_elements: int):
+        """Exact top-k over the given rows only; cost is proportional to the subset, not the corpus."""
+        if len(self.dead):
+            row_ids = row_ids[~np.isin(row_ids, self.dead)]
+        n_queries = query_matrix.shape[0]
+        k = min(k, len(row_ids))
+        # Each block gathers (rows, D) float32 vectors, so a broad filter never copies the whole subset
+        block_rows = self._block_rows(n_queries, max_block_elements)
+
+        best_ids = np.empty((n_queries, 0), dtype='int64')
+        best_scores = np.empty((n_queries, 0), dtype='float32')
+        if k <= 0:
+            return best_ids, best_scores
+        for offset in range(0, len(row_ids), block_rows):
+            ids = row_ids[offset:offset + block_rows]
+            scores = query_matrix @ self.take(ids).T
+            best_ids, best_scores = _merge_top_k(best_ids, best_scores, ids, scores, k)
+
+        return _rank(best_ids, best_scores)
+
+    def _postings(self, field: str) -> Dict[Any, np.ndarray]:
+        """Inverted index value -> sorted row ids for one metadata field (built on first use)."""
+        if field not in self.postings:
+            if field == "text":
+                raise ValueError("Cannot filter on chunk text.")
+            if field in CORE_FIELDS:
+                cursor = self.conn.execute(f"SELECT row_id, {field} FROM chunks ORDER BY row_id")
+            else:
+                cursor = self.conn.execute(
+                    "SELECT row_id, json_extract(meta, ?) FROM chunks ORDER BY row_id", (f'$."{field}"',)
+                )
+            groups: Dict[Any, List[int]] = {}
+            for row_id, value in cursor:
+                if value is not None:
+                    groups.setdefault(value, []).append(row_id)
+            self.postings[field] = {v: np.array(ids, dtype='int64') for v, ids in groups.items()}
+        return self.postings[field]
+
+    def filter_rows(self, filters: Dict) -> np.ndarray:
+        """Sorted row ids matching every field (any of the listed values per field)."""
+        result = None
+        for field, values in filters.items():
+            if not isinstance(values, (list, tuple, set)):
+                values = [values]
+            postings = self._postings(field)
+            parts = [postings[v] for v in values if v in postings]
+            ids = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype='int64')
+            result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+        return result if result is not None else np.arange(len(self), dtype='int64')
+
+    def take(self, row_ids: Iterable[int]) -> np.ndarray:
+        """Gather vectors for global row ids (in the given order)."""
+        row_ids = np.asarray(row_ids if isinstance(row_ids, np.ndarray) else list(row_ids), dtype='int64')
+        out = np.empty((len(row_ids), self.dim), dtype='float32')
+        for start, matrix in self.blocks():
+            mask = (row_ids >= start) & (row_ids < start + matrix.shape[0])
+            if not mask.any():
+                continue
+            local = row_ids[mask] - start
+            if local[-1] - local[0] == len(local) - 1 and np.all(np.diff(local) == 1):
+                # Contiguous run (e.g. one source's chunks): plain slice, no fancy-index gather
+                out[mask] = matrix[local[0]:local[-1] + 1]
+            else:
+                out[mask] = matrix[local]
+        return out
+
+    def clear(self):
+        """Drop all rows (used for rebuild_index)."""
+        self.segments = []
+        self.quantized = None
+        self.ivf = None
+        self.postings = {}
+        self.dead = np.empty(0, dtype='int64')
+        segment_files = (glob.glob(os.path.join(self.index_dir, BASE_PATTERN)) + self._delta_paths()
+                         + glob.glob(os.path.join(self.index_dir, IVF_DELTA_PATTERN)))
+        for path in [self.matrix_path, os.path.join(self.index_dir, IVF_FILE)] + segment_files:
+            if os.path.exists(path):
+                os.remove(path)
+        self.conn.execute("DELETE FROM segments")
+        self.conn.execute("DELETE FROM chunks")
+        self.conn.execute("DELETE FROM files")
+        self.conn.execute("DELETE FROM tombstones")
+        self.conn.commit()
+
+    def append(self, vectors: np.ndarray, records: List[Dict]) -> List[int]:
+        """
+        Append normalized vectors and their chunk records. Returns the new row ids.
+        Only the new rows are written (as a delta segment), so ingestion stays linear.
+        """
+        vectors = np.asarray(vectors, dtype='float32')
+        if len(vectors) != len(records):
+            raise ValueError(f"Got {len(vectors)} vectors for {len(records)} records.")
+        if not len(records):
+            return []
+
+        start = len(self)
+        self.dim = vectors.shape[1]
+        if self.quantization and self.quantized is None:
+            self.quantized = QuantizedMatrix(self.quantization, self.dim)
+
+        name = f"delta_{start:010d}.npy"
+        checksum = self._write_npy(os.path.join(self.index_dir, name), vectors)
+        # Records and the manifest entry commit together: the segment exists only once both do
+        self._insert_records(start, records)
+        self._register_segment(name, start, len(records), checksum)
+        self.conn.commit()
+        # Serve the new rows from the committed file, so appended vectors are not also held in RAM
+        self.segments.append((start, np.load(os.path.join(self.index_dir, name), mmap_mode='r')))
+        if self.quantized is not None:
+            self.quantized.append(vectors)
+        if self.ivf is not None:
+            self.ivf.add(vectors)
+            self.ivf.save_appended(self.index_dir)
+        for field, postings in self.postings.items():
+            new_ids: Dict[Any, List[int]] = {}
+            for i, rec in enumerate(records):
+                if rec.get(field) is not None:
+                    new_ids.setdefault(rec[field], []).append(start + i)
+            for value, ids in new_ids.items():
+                postings[value] = np.concatenate([postings.get(value, np.empty(0, dtype='int64')), ids])
+        return list(range(start, start + len(records)))
+
+    def compact(self):
+        """
+        Merge the base matrix and all delta segments into a single base file,
+        physically dropping tombstoned rows and renumbering the survivors.
+        Rows are streamed block by block, so the index is never loaded into RAM.
+        """
+        old_files = [name for name, _, _, _ in self._manifest()]
+        if len(old_files) <= 1 and not len(self.dead):
+            return
+        print(f"Compacting {len(old_files)} segments ({len(self.dead)} dead rows) in {self.index_dir}...")
+        total = len(self)
+        live = np.ones(total, dtype=bool)
+        live[self.dead[self.dead < total]] = False
+        old_ids = np.flatnonzero(live)
+
+        # Write the merged base under a fresh name; nothing references it until the commit below
+        base_name = f"base_{time.time_ns()}.npy"
+        checksum = self._write_live_rows(os.path.join(self.index_dir, base_name), live)
+
+        # Renumber chunk rows and swap the manifest in one transaction
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS id_map (old INTEGER PRIMARY KEY, new INTEGER)")
+        self.conn.execute("DELETE FROM id_map")
+        self.conn.executemany("INSERT INTO id_map VALUES (?, ?)", ((int(o), n) for n, o in enumerate(old_ids)))
+        self.conn.execute("CREATE TABLE chunks_compacted AS SELECT * FROM chunks WHERE 0")
+        self.conn.execute(
+            "INSERT INTO chunks_compacted SELECT m.new, c.source, c.path, c.text, c.meta "
+            "FROM chunks c JOIN id_map m ON c.row_id = m.old"
+        )
+        self.conn.execute("DELETE FROM chunks")
+        self.conn.execute("INSERT INTO chunks SELECT * FROM chunks_compacted")
+        self.conn.execute("DROP TABLE chunks_compacted")
+        self.conn.execute("DELETE FROM tombstones")
+        self.conn.execute("DELETE FROM segments")
+        self._register_segment(base_name, 0, len(old_ids), checksum)
+        self.conn.commit()
+
+        # Release our mappings before deleting files (required on Windows)
+        self.segments = []
+        if self.ivf is not None:
+            self.ivf.keep_rows(live)
+            self.ivf.save(self.index_dir)
+        self._remove_orphans()
+        self.load()
+
+    def _remove_orphans(self):
+        """Delete segment and temp files the manifest no longer references (superseded or from a crash)."""
+        referenced = {name for name, _, _, _ in self._manifest()}
+        candidates = (glob.glob(os.path.join(self.index_dir, BASE_PATTERN)) + self._delta_paths()
+                      + glob.glob(os.path.join(self.index_dir, "*.tmp")) + [self.matrix_path])
+        for path in candidates:
+            if os.path.exists(path) and os.path.basename(path) not in referenced:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    print(f"Warning: could not remove {os.path.basename(path)}: {e}")
+
+    def _write_npy(self, path: str, matrix: np.ndarray) -> int:
+        """Write an immutable segment via temp file + fsync + rename. Returns its CRC32."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            writer = _ChecksumWriter(f)
+            np.save(writer, np.ascontiguousarray(matrix, dtype='float32'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return writer.crc
+
+    def _write_live_rows(self, path: str, live: np.ndarray) -> int:
+        """Stream the `live` rows of every segment into a new segment file (temp + fsync + rename). Returns its CRC32."""
+        tmp_path = path + ".tmp"
+        merged = np.lib.format.open_memmap(tmp_path, mode='w+', dtype='float32', shape=(int(live.sum()), self.dim))
+        rows_per_step = max(1, VECTOR_BLOCK_BYTES // (self.dim * 4))
+        written = 0
+        for start, matrix in self.blocks():
+            for offset in range(0, matrix.shape[0], rows_per_step):
+                block = matrix[offset:offset + rows_per_step]
+                block = block[live[start + offset:start + offset + block.shape[0]]]
+                merged[written:written + len(block)] = block
+                written += len(block)
+        merged.flush()
+        del merged
+        with open(tmp_path, 'rb+') as f:
+            os.fsync(f.fileno())
+        # One sequential read of the new file; the page cache still holds most of it
+        checksum = file_crc32(tmp_path)
+        os.replace(tmp_path, path)
+        return checksum
+
+    def _insert_records(self, start: int, records: List[Dict]):
+        rows = []
+        for i, rec in enumerate(records):
+            extra = {k: v for k, v in rec.items() if k not in CORE_FIELDS and k != "embedding"}
+            rows.append((
+                start + i,
+                rec.get("source"),
+                rec.get("path"),
+                rec.get("text", ""),
+                json.dumps(extra) if extra else None,
+            ))
+        self.conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?)", rows)
+
+    def delete_rows(self, row_ids: Iterable[int]):
+        """Tombstone rows: they stop matching immediately and are purged by compact()."""
+        row_ids = [int(r) for r in row_ids]
+        if not row_ids:
+            return
+        placeholders = ",".join("?" * len(row_ids))
+        self.conn.execute(f"DELETE FROM chunks WHERE row_id IN ({placeholders})", row_ids)
+        self.conn.executemany("INSERT OR IGNORE INTO tombstones VALUES (?)", ((r,) for r in row_ids))
+        self.conn.commit()
+        self.dead = np.union1d(self.dead, np.asarray(row_ids, dtype='int64'))
+
+    def rows_for_path(self, path: str) -> Iterator[tuple]:
+        """(row_id, text) of every live chunk that came from `path`, streamed from the database."""
+        return self.conn.execute("SELECT row_id, text FROM chunks WHERE path = ?", (path,))
+
+    def file_state(self, path: str) -> Optional[Dict]:
+        row = self.conn.execute(
+            "SELECT size, mtime, content_hash FROM files WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"size": row[0], "mtime": row[1], "content_hash": row[2]}
+
+    def set_file_state(self, path: str, size: int, mtime: float, content_hash: str):
+        self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (path, size, mtime, content_hash))
+        self.conn.commit()
+
+    def tracked_files(self) -> Set[str]:
+        """Paths known to the index (manifest entries plus any chunk paths from migrated data)."""
+        tracked = {row[0] for row in self.conn.execute("SELECT path FROM files")}
+        return tracked | self.paths()
+
+    def delete_file(self, path: str):
+        """Drop every chunk of `path` and its manifest entry."""
+        self.delete_rows(row_id for row_id, _ in self.rows_for_path(path))
+        self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+        self.conn.commit()
+
+    def get_records(self, row_ids: Iterable[int]) -> List[Dict]:
+        """Fetch chunk records for the given row ids, preserving order."""
+        row_ids = [int(r) for r in row_ids]
+        if not row_ids:
+            return []
+        placeholders = ",".join("?" * len(row_ids))
+        cursor = self.conn.execute(
+            f"SELECT row_id, source, path, text, meta FROM chunks WHERE row_id IN ({placeholders})",
+            row_ids,
+        )
+        by_id = {}
+        for row_id, source, path, text, meta in cursor:
+            rec = {"text": text, "source": source, "path": path}
+            if meta:
+                rec.update(json.loads(meta))
+            by_id[row_id] = rec
+        return [by_id[r] for r in row_ids if r in by_id]
+
+    def paths(self) -> Set[str]:
+        cursor = self.conn.execute("SELECT DISTINCT path FROM chunks WHERE path IS NOT NULL")
+        return {row[0] for row in cursor}
+
+
+def migrate_pickle(pkl_path: str, index_dir: str, dim: int = EMBEDDING_DIM) -> IndexStore:
+    """
+    One-shot migration from the legacy pickled list-of-dicts (rag_cache.pkl)
+    to the columnar store. Malformed items (missing/short embeddings) are dropped.
+    """
+    print(f"Migrating {pkl_path} -> {index_dir}...")
+    with open(pkl_path, 'rb') as f:
+        items = pickle.load(f)
+
+    valid_items = [item for item in items if "embedding" in item and len(item["embedding"]) == dim]
+    skipped = len(items) - len(valid_items)
+
+    store = IndexStore(index_dir, dim=dim)
+    store.clear()
+    if valid_items:
+        vectors = normalize_rows(np.array([item["embedding"] for item in valid_items], dtype='float32'))
+        store.append(vectors, valid_items)
+        store.compact()
+
+    print(f"Migrated {len(valid_items)} chunks ({skipped} malformed skipped).")
+    return store
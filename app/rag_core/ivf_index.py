@@ -0,0 +1,135 @@
+import os
+import glob
+import time
+import numpy as np
+from typing import List, Optional
+
+# Inverted-file (IVF) approximate index over the normalized embeddings.
+# Rows are assigned to the nearest of `n_lists` k-means centroids; a query only
+# scores the rows in its `nprobe` nearest lists. Pure NumPy, persisted as ivf.npz
+# (centroids + assignments) plus one small ivf_delta_<generation>_<start>.npy per
+# append, so ingestion never rewrites the whole index. Sidecars of another
+# generation (an older ivf.npz) are ignored and swept by the next full save.
+IVF_FILE = "ivf.npz"
+IVF_DELTA_PATTERN = "ivf_delta_*.npy"
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 20
+TRAIN_POINTS_PER_LIST = 64
+ASSIGN_BLOCK_ROWS = 65536
+
+
+def default_n_lists(n_rows: int) -> int:
+    """~4 * sqrt(N) lists, the usual IVF rule of thumb."""
+    return max(1, min(n_rows, int(4 * np.sqrt(n_rows))))
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (matrix / norms).astype('float32')
+
+
+class IVFIndex:
+    def __init__(self, centroids: np.ndarray, assignments: Optional[np.ndarray] = None,
+                 nprobe: int = DEFAULT_NPROBE):
+        self.centroids = np.asarray(centroids, dtype='float32')
+        self.assignments = np.empty(0, dtype='int32') if assignments is None else np.asarray(assignments, dtype='int32')
+        self.nprobe = nprobe
+        self.generation = 0  # Identifies the ivf.npz the appended sidecars belong to
+        self.saved_rows = len(self.assignments)  # Assignments already on disk
+        self._order = None  # row ids grouped by list (lazy, rebuilt after add)
+        self._offsets = None
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def train(cls, sample: np.ndarray, n_lists: int, nprobe: int = DEFAULT_NPROBE,
+              iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> "IVFIndex":
+        """Spherical k-means on a sample of normalized vectors."""
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(sample, dtype='float32')
+        n_lists = min(n_lists, len(sample))
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=n_lists)
+            empty = counts == 0
+            if empty.any():
+                # Re-seed empty lists with random points so every list stays useful
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+            centroids = _normalize(sums)
+        return cls(centroids, nprobe=nprobe)
+
+    def add(self, vectors: np.ndarray):
+        """Assign rows appended to the store (in row order) to their nearest list."""
+        labels = [
+            np.argmax(vectors[i:i + ASSIGN_BLOCK_ROWS] @ self.centroids.T, axis=1)
+            for i in range(0, len(vectors), ASSIGN_BLOCK_ROWS)
+        ]
+        if labels:
+            self.assignments = np.concatenate([self.assignments] + [l.astype('int32') for l in labels])
+        self._order = None
+
+    def keep_rows(self, live: np.ndarray):
+        """Drop rows removed by compaction (`live` is the boolean mask over old row ids)."""
+        self.assignments = self.assignments[live[:len(self.assignments)]]
+        self._order = None
+
+    def candidates(self, query_vec: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Row ids in the `nprobe` lists nearest to the query."""
+        if self._order is None:
+            self._order = np.argsort(self.assignments, kind='stable')
+            self._offsets = np.searchsorted(self.assignments[self._order], np.arange(self.n_lists + 1))
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        centroid_scores = self.centroids @ query_vec
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        parts: List[np.ndarray] = [self._order[self._offsets[c]:self._offsets[c + 1]] for c in probe]
+        return np.concatenate(parts).astype('int64') if parts else np.empty(0, dtype='int64')
+
+    def save(self, index_dir: str):
+        """Rewrite the whole index (after training or compaction) and drop the appended sidecars."""
+        path = os.path.join(index_dir, IVF_FILE)
+        tmp_path = path + ".tmp"
+        generation = time.time_ns()
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, centroids=self.centroids, assignments=self.assignments, nprobe=self.nprobe,
+                     generation=generation)
+        os.replace(tmp_path, path)
+        self.generation = generation
+        self.saved_rows = len(self.assignments)
+        for sidecar in glob.glob(os.path.join(index_dir, IVF_DELTA_PATTERN)):
+            os.remove(sidecar)
+
+    def save_appended(self, index_dir: str):
+        """Persist only the assignments added since the last save (O(new rows) I/O)."""
+        if self.saved_rows >= len(self.assignments):
+            return
+        path = os.path.join(index_dir, f"ivf_delta_{self.generation}_{self.saved_rows:010d}.npy")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, self.assignments[self.saved_rows:])
+        os.replace(tmp_path, path)
+        self.saved_rows = len(self.assignments)
+
+    @classmethod
+    def load(cls, index_dir: str) -> Optional["IVFIndex"]:
+        path = os.path.join(index_dir, IVF_FILE)
+        if not os.path.exists(path):
+            return None
+        data = np.load(path)
+        generation = int(data["generation"]) if "generation" in data else 0
+        parts = [data["assignments"]]
+        total = len(parts[0])
+        for sidecar in sorted(glob.glob(os.path.join(index_dir, f"ivf_delta_{generation}_*.npy"))):
+            start = int(os.path.basename(sidecar)[:-len(".npy")].rsplit("_", 1)[1])
+            if start != total:
+                break
+            parts.append(np.load(sidecar))
+            total += len(parts[-1])
+        ivf = cls(data["centroids"], np.concatenate(parts), int(data["nprobe"]))
+        ivf.generation = generation
+        return ivf
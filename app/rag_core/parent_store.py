@@ -0,0 +1,88 @@
+import os
+import zlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Iterable, Tuple
+
+# Parent chunk texts for the Chroma parent/child collections, kept out of the
+# child metadata: children carry only `parent_id`, and RAGAgent fetches the few
+# winning parents after ranking. Texts are zlib-compressed; shared by every domain
+# collection (a book in several domains has the same parent ids and text).
+PARENT_DB_FILE = "parents.sqlite"
+PARENT_CACHE_ITEMS = 512
+COMPRESSION_LEVEL = 6
+
+
+class ParentStore:
+    """SQLite key-value store parent_id -> text, with an in-process LRU in front."""
+    def __init__(self, db_path: str, cache_items: int = PARENT_CACHE_ITEMS):
+        self.db_path = db_path
+        self.cache_items = cache_items
+        self.memory: "OrderedDict[str, str]" = OrderedDict()
+        self.stats_counts = {"memory_hits": 0, "disk_reads": 0, "missing": 0}
+        self.lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS parents (parent_id TEXT PRIMARY KEY, source TEXT, text BLOB)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_parents_source ON parents(source)")
+        self.conn.commit()
+
+    def put_many(self, parents: Iterable[Tuple[str, str, str]]):
+        """Store (parent_id, source, text) rows, replacing existing ids."""
+        rows = [(pid, source, zlib.compress(text.encode('utf-8'), COMPRESSION_LEVEL)) for pid, source, text in parents]
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO parents VALUES (?, ?, ?)", rows)
+            self.conn.commit()
+            for pid, _, _ in rows:
+                self.memory.pop(pid, None)
+
+    def get_many(self, parent_ids: List[str]) -> Dict[str, str]:
+        """Texts for the given ids (one SELECT for all cache misses). Unknown ids are omitted."""
+        found = {}
+        with self.lock:
+            missing = []
+            for pid in dict.fromkeys(parent_ids):
+                if pid in self.memory:
+                    self.memory.move_to_end(pid)
+                    found[pid] = self.memory[pid]
+                    self.stats_counts["memory_hits"] += 1
+                else:
+                    missing.append(pid)
+
+            for i in range(0, len(missing), 500):
+                batch = missing[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                cursor = self.conn.execute(
+                    f"SELECT parent_id, text FROM parents WHERE parent_id IN ({placeholders})", batch
+                )
+                for pid, blob in cursor:
+                    text = zlib.decompress(blob).decode('utf-8')
+                    found[pid] = text
+                    self._remember(pid, text)
+                    self.stats_counts["disk_reads"] += 1
+            self.stats_counts["missing"] += len(missing) - sum(1 for pid in missing if pid in found)
+        return found
+
+    def delete_source(self, source: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM parents WHERE source = ?", (source,))
+            self.conn.commit()
+            self.memory.clear()
+
+    def _remember(self, pid: str, text: str):
+        self.memory[pid] = text
+        self.memory.move_to_end(pid)
+        while len(self.memory) > self.cache_items:
+            self.memory.popitem(last=False)
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM parents").fetchone()[0]
+
+    def stats(self) -> Dict:
+        return {**self.stats_counts, "memory_items": len(self.memory)}
@@ -14,6 +14,10 @@ from openai import OpenAI
 sys.path.append(os.path.dirname(__file__))
 from calc_tools import SafeCalculator
 from demand_session import DemandSession
+from embedding_cache import get_query_cache
+from parent_store import ParentStore, PARENT_DB_FILE
+from corpus import CORPUS_COLLECTION, domain_filter
+from sections import query_section_filter, UNKNOWN_SECTION
 
 import argparse
 
@@ -22,6 +26,8 @@ CHROMA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file
 EMBEDDING_MODEL = "text-embedding-3-large"
 CHAT_MODEL = "gpt-4o"
 
+# Domains are views over the unified CORPUS_COLLECTION; "collection" is the
+# per-domain collection from before the corpus, used when the corpus lacks the domain.
 DOMAIN_MAP = {
     "healthcare": {"collection": "rag_healthcare", "desc": "Healthcare (FGI + NFPA + FBC)"},
     "code": {"collection": "rag_code_only", "desc": "Code Books Only (NFPA Standards)"},
@@ -65,10 +71,14 @@ CRITICAL CONSTRAINTS:
 """
 
 class RAGAgent:
-    def __init__(self, collection_name):
+    def __init__(self, collection_name: Optional[str] = None, domain: Optional[str] = None):
         self.load_environment()
         self.client = OpenAI()
         self.calculator = SafeCalculator()
+        self.query_cache = get_query_cache()
+        self.parent_store = None
+        # Chroma `where` clause scoping every search to the selected domain
+        self.where = None
         
         if not os.path.exists(CHROMA_DIR):
             print(f"Warning: ChromaDB directory not found at {CHROMA_DIR}. Run ingest_books.py first.")
@@ -76,17 +86,40 @@ class RAGAgent:
         else:
             try:
                 self.chroma_client = chromadb.PersistentClient(path=CHROMA_DIR)
-                # Check if collection exists
-                try:
-                    self.collection = self.chroma_client.get_collection(name=collection_name)
-                    print(f"RAG Agent initialized. Connected to '{collection_name}' ({self.collection.count()} chunks).")
-                except Exception:
-                    print(f"Error: Collection '{collection_name}' does not exist. Run ingest_books.py --domain <name> first.")
-                    self.collection = None
+                self.parent_store = ParentStore(os.path.join(CHROMA_DIR, PARENT_DB_FILE))
+                self.collection = self.connect_collection(collection_name, domain)
             except Exception as e:
                 print(f"Error connecting to ChromaDB: {e}")
                 self.collection = None
 
+    def connect_collection(self, collection_name: Optional[str], domain: Optional[str]):
+        """
+        Prefer the unified corpus filtered to `domain`. A per-domain collection name
+        maps to its domain, and is used directly if the corpus has no chunks for it yet.
+        """
+        if domain is None:
+            domain = next((d for d, cfg in DOMAIN_MAP.items() if cfg["collection"] == collection_name), None)
+        if domain is not None:
+            collection_name = collection_name or DOMAIN_MAP[domain]["collection"]
+            try:
+                corpus = self.chroma_client.get_collection(name=CORPUS_COLLECTION)
+                if corpus.get(where=domain_filter(domain), limit=1)["ids"]:
+                    self.where = domain_filter(domain)
+                    print(f"RAG Agent initialized. Connected to '{CORPUS_COLLECTION}' ({corpus.count()} chunks), "
+                          f"filtered to domain '{domain}'.")
+                    return corpus
+            except Exception:
+                pass
+
+        # Check if collection exists
+        try:
+            collection = self.chroma_client.get_collection(name=collection_name)
+            print(f"RAG Agent initialized. Connected to '{collection_name}' ({collection.count()} chunks).")
+            return collection
+        except Exception:
+            print(f"Error: Collection '{collection_name}' does not exist. Run ingest_books.py first.")
+            return None
+
     def load_environment(self):
         """Load environment variables."""
         dotenv_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), '.env')
@@ -151,26 +184,44 @@ class RAGAgent:
         Retrieves top `k_children` *Child* chunks.
         Groups them by Parent.
         Ranks Parents by score.
-        Returns top `k_parents` full Parent texts.
+        Returns top `k_parents` full Parent texts, fetched from the ParentStore
+        only for the winners (each distinct parent once).
         """
         if not self.collection:
             return []
 
-        # 1. Embed Query
+        # 1. Embed Query (cached: repeated questions skip the API round trip)
         try:
-            query_emb = self.client.embeddings.create(input=[query], model=EMBEDDING_MODEL).data[0].embedding
+            query_emb = self.query_cache.get_or_embed(self.client, EMBEDDING_MODEL, query)
         except Exception as e:
             print(f"Error embedding query: {e}")
             return []
 
-        # 2. Query Chroma (Child Chunks)
+        # 2. Query Chroma (Child Chunks). A question naming a table, article or
+        # section only searches the chunks tagged with it (see sections.py)
+        section_where = query_section_filter(query)
+        where = self.where
+        if section_where:
+            where = {"$and": [self.where, section_where]} if self.where else section_where
+            print(f"  - Section filter: {section_where}")
         print(f"  - Searching for top {k_children} child chunks...")
         results = self.collection.query(
             query_embeddings=[query_emb],
             n_results=k_children, 
-            include=["metadatas", "documents", "distances"]
+            where=where,
+            include=["metadatas", "distances"]
         )
         
+        if section_where and (not results['ids'] or not results['ids'][0]):
+            # Not in the library, or books ingested before section metadata existed
+            print("  - No chunks tagged with that section; searching without the filter.")
+            results = self.collection.query(
+                query_embeddings=[query_emb],
+                n_results=k_children,
+                where=self.where,
+                include=["metadatas", "distances"]
+            )
+        
         if not results['ids'] or not results['ids'][0]:
             return []
             
@@ -194,21 +245,33 @@ class RAGAgent:
             if parent_id not in parents_map:
                 parents_map[parent_id] = {
                     "parent_id": parent_id,
-                    "text": meta.get("parent_text", ""),
+                    # Only collections ingested before the ParentStore carry parent_text
+                    "text": meta.get("parent_text"),
                     "source": meta.get("source", "Unknown"),
                     "domain": meta.get("domain", "unknown"),
+                    "section_path": meta.get("section_path", UNKNOWN_SECTION),
                     "child_scores": [],
-                    "child_count": 0
+                    "child_count": 0,
+                    # Pages of the matching children (PDF sources only)
+                    "page_start": None,
+                    "page_end": None
                 }
             
-            parents_map[parent_id]["child_scores"].append(score)
-            parents_map[parent_id]["child_count"] += 1
+            parent = parents_map[parent_id]
+            parent["child_scores"].append(score)
+            parent["child_count"] += 1
+            if meta.get("page_start") is not None:
+                parent["page_start"] = min(p for p in (parent["page_start"], meta["page_start"]) if p is not None)
+                parent["page_end"] = max(p for p in (parent["page_end"], meta["page_end"]) if p is not None)
 
         # 4. Rank Parents
         sorted_parents = self.rank_parents(parents_map)
         
-        # 5. Return Top k_parents
+        # 5. Return Top k_parents, loading their texts once
         final_parents = sorted_parents[:k_parents]
+        stored = self.parent_store.get_many([p["parent_id"] for p in final_parents]) if self.parent_store else {}
+        for parent in final_parents:
+            parent["text"] = stored.get(parent["parent_id"]) or parent["text"] or ""
         print(f"  - Collapsed {len(parents_map)} parents. Returning top {len(final_parents)}.")
         
         return final_parents
@@ -237,6 +300,11 @@ class RAGAgent:
         citation_sources = set()
         for i, doc in enumerate(docs):
             src = f"{doc['source']} ({doc.get('domain','?')})"
+            if doc.get("page_start") is not None:
+                pages = doc["page_start"] if doc["page_start"] == doc["page_end"] else f"{doc['page_start']}-{doc['page_end']}"
+                src += f", p. {pages}"
+            if doc.get("section_path", UNKNOWN_SECTION) != UNKNOWN_SECTION:
+                src += f", {doc['section_path']}"
             context_str += f"\n--- Source: {src} ---\n{doc['text']}\n"
             citation_sources.add(src)
             
@@ -324,6 +392,8 @@ class RAGAgent:
                 "intent": intent,
                 "domain": domain,
                 "sources_count": len(docs),
+                "embedding_cache": self.query_cache.stats(),
+                "parent_store": self.parent_store.stats() if self.parent_store else None,
                 "duration": time.time() - start_time
             })
             
@@ -356,10 +426,9 @@ def chat_loop():
              print("Invalid selection.")
              return
              
-    col_name = DOMAIN_MAP[selected_domain]["collection"]
     print(f"\nStarting {selected_domain.upper()} Agent...")
     
-    agent = RAGAgent(collection_name=col_name)
+    agent = RAGAgent(domain=selected_domain)
     if not agent.collection:
         return
 
@@ -1,17 +1,31 @@
 import os
+import sys
 import glob
 import pickle
 import numpy as np
-from typing import List, Dict
+from typing import List, Dict, Tuple, Callable, Optional
 from dotenv import load_dotenv
 from openai import OpenAI
 
+# Add current directory to path for module imports
+sys.path.append(os.path.dirname(__file__))
+from embedding_cache import get_query_cache
+from index_store import normalize_rows
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
 # Configuration
 BOOKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'Books')
 CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), '.tmp')
 CACHE_FILE = os.path.join(CACHE_DIR, 'rag_cache.pkl')
 EMBEDDING_MODEL = "text-embedding-3-small"
 CHAT_MODEL = "gpt-4o"
+SUMMARY_MODEL = "gpt-4o-mini"   # Cheap model that folds old turns into the rolling summary
+HISTORY_TOKEN_BUDGET = 3000     # Prior-turn tokens re-sent each turn (system prompt and context excluded)
+SUMMARY_MAX_TOKENS = 300
 
 def load_environment():
     """Load environment variables."""
@@ -94,8 +108,21 @@ def get_embeddings(client: OpenAI, texts: List[str]) -> List[List[float]]:
             
     return all_embeddings
 
-def cosine_similarity(v1: np.ndarray, v2: np.ndarray) -> float:
-    return np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2))
+class ChatIndex:
+    """
+    Chunk records plus all their embeddings as one L2-normalized float32 matrix,
+    built once at load time so each query is a single matrix-vector product.
+    """
+    def __init__(self, items: List[Dict]):
+        items = [item for item in items if item.get("embedding")]
+        self.chunks = [{k: v for k, v in item.items() if k != "embedding"} for item in items]
+        if items:
+            self.matrix = normalize_rows(np.array([item["embedding"] for item in items], dtype='float32'))
+        else:
+            self.matrix = np.empty((0, 0), dtype='float32')
+
+    def __len__(self) -> int:
+        return len(self.chunks)
 
 def build_index(client: OpenAI):
     """Read, chunk, and index books."""
@@ -132,24 +159,30 @@ def load_index(client: OpenAI):
     if os.path.exists(CACHE_FILE):
         print("Loading index from cache...")
         with open(CACHE_FILE, 'rb') as f:
-            return pickle.load(f)
+            items = pickle.load(f)
     else:
-        return build_index(client)
+        items = build_index(client)
+    if not items:
+        return None
+    return ChatIndex(items)
+
+def top_k_chunks(query_vec: np.ndarray, index: ChatIndex, k: int = 5) -> List[Tuple[float, Dict]]:
+    """(score, chunk) for the k rows most similar to query_vec, best first."""
+    if not len(index):
+        return []
+    query_vec = np.asarray(query_vec, dtype='float32')
+    norm = np.linalg.norm(query_vec)
+    scores = index.matrix @ (query_vec / norm if norm else query_vec)
+    k = min(k, len(scores))
+    # O(N) selection, then sort only the k winners
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [(float(scores[i]), index.chunks[i]) for i in top]
 
-def retrieve(query: str, index: List[Dict], client: OpenAI, k: int = 5):
+def retrieve(query: str, index: ChatIndex, client: OpenAI, k: int = 5):
     """Retrieve top k chunks for query."""
-    query_emb = client.embeddings.create(input=[query], model=EMBEDDING_MODEL).data[0].embedding
-    query_vec = np.array(query_emb)
-    
-    scored_chunks = []
-    for item in index:
-        item_vec = np.array(item["embedding"])
-        score = cosine_similarity(query_vec, item_vec)
-        scored_chunks.append((score, item))
-        
-    # Sort descending
-    scored_chunks.sort(key=lambda x: x[0], reverse=True)
-    return scored_chunks[:k]
+    query_emb = get_query_cache().get_or_embed(client, EMBEDDING_MODEL, query)
+    return top_k_chunks(np.array(query_emb), index, k)
 
 SYSTEM_PROMPT = """You are a helpful expert assistant for NFPA codes and standards. 
 Use the provided Context to answer the user's question. 
@@ -160,9 +193,82 @@ CRITICAL INSTRUCTIONS:
 4. If the answer is not in the context, strictly state that the information is not available in the current library.
 """
 
-def ask_rag_question(query: str, index: List[Dict], client: OpenAI, history: List[Dict] = None) -> str:
-    """Reusable function to ask a question to the RAG system."""
-    
+_encoder = None
+
+def count_tokens(text: str) -> int:
+    """Tokens for CHAT_MODEL (tiktoken), or a ~4 chars/token estimate when tiktoken is unavailable."""
+    global _encoder
+    if _encoder is None:
+        try:
+            _encoder = tiktoken.encoding_for_model(CHAT_MODEL)
+        except Exception:
+            _encoder = False
+    if _encoder:
+        return len(_encoder.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+def message_tokens(messages: List[Dict]) -> int:
+    # ~4 tokens of framing per message on top of its content
+    return sum(count_tokens(m["content"]) + 4 for m in messages)
+
+def trim_history(turns: List[Dict], budget: int = HISTORY_TOKEN_BUDGET) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Split user/assistant turns into (evicted, kept): the newest pairs that fit in
+    `budget` tokens are kept. The latest pair is always kept, even if it alone is over.
+    """
+    kept_tokens = 0
+    cut = len(turns)
+    for i in range(len(turns) - 2, -1, -2):
+        pair_tokens = message_tokens(turns[i:i + 2])
+        if cut < len(turns) and kept_tokens + pair_tokens > budget:
+            break
+        kept_tokens += pair_tokens
+        cut = i
+    return turns[:cut], turns[cut:]
+
+def summarize_turns(client: OpenAI, summary: str, evicted: List[Dict]) -> str:
+    """Fold evicted turns into the rolling summary (falls back to truncated excerpts if the call fails)."""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in evicted)
+    try:
+        response = client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[{"role": "user", "content": (
+                "Update the running summary of this conversation about codes and standards. "
+                "Keep the questions asked, the answers' key numbers, sources and section numbers. "
+                f"Be brief (under {SUMMARY_MAX_TOKENS} tokens).\n\n"
+                f"Current summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"
+            )}],
+            max_tokens=SUMMARY_MAX_TOKENS,
+            temperature=0.0,
+        )
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"(Summary update failed: {e}; keeping excerpts)")
+        excerpts = [f"{m['role']}: {m['content'][:200]}" for m in evicted]
+        return "\n".join(([summary] if summary else []) + excerpts)[-SUMMARY_MAX_TOKENS * 4:]
+
+def build_history(summary: str, turns: List[Dict]) -> List[Dict]:
+    """System prompt, then the rolling summary of older turns, then the recent turns verbatim."""
+    history = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if summary:
+        history.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    return history + turns
+
+def stream_completion(client: OpenAI, messages: List[Dict], on_token: Callable[[str], None]) -> str:
+    """Stream a chat completion, passing each text delta to on_token. Returns the full answer."""
+    stream = client.chat.completions.create(model=CHAT_MODEL, messages=messages, stream=True)
+    parts = []
+    for event in stream:
+        if not event.choices:
+            continue
+        delta = event.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            on_token(delta)
+    return "".join(parts)
+
+def build_messages(query: str, index: ChatIndex, client: OpenAI, history: List[Dict] = None) -> List[Dict]:
+    """Retrieve context for the query and assemble the chat messages."""
     # 1. Retrieve
     # Increase k to ensure we catch relevant sections if they are spread out
     top_chunks = retrieve(query, index, client, k=8)
@@ -189,9 +295,17 @@ def ask_rag_question(query: str, index: List[Dict], client: OpenAI, history: Lis
              messages.insert(0, {"role": "system", "content": SYSTEM_PROMPT})
         
     messages.append({"role": "user", "content": user_message_content})
+    return messages
+
+def ask_rag_question(query: str, index: ChatIndex, client: OpenAI, history: List[Dict] = None,
+                     on_token: Optional[Callable[[str], None]] = None) -> str:
+    """Reusable function to ask a question to the RAG system. Pass on_token to stream the answer."""
+    messages = build_messages(query, index, client, history)
     
     # 4. Call LLM
     try:
+        if on_token is not None:
+            return stream_completion(client, messages, on_token)
         response = client.chat.completions.create(
             model=CHAT_MODEL,
             messages=messages,
@@ -201,13 +315,12 @@ def ask_rag_question(query: str, index: List[Dict], client: OpenAI, history: Lis
     except Exception as e:
         return f"Error: {e}"
 
-def chat_loop(client: OpenAI, index: List[Dict]):
+def chat_loop(client: OpenAI, index: ChatIndex):
     print("\n--- RAG Chat Ready (Type 'exit' to quit) ---")
     
-    # Basic history for CLI execution
-    history = [
-        {"role": "system", "content": SYSTEM_PROMPT}
-    ]
+    # Recent turns are re-sent verbatim; older ones live on in a rolling summary
+    turns: List[Dict] = []
+    summary = ""
     
     while True:
         user_input = input("\nUser: ").strip()
@@ -218,17 +331,35 @@ def chat_loop(client: OpenAI, index: List[Dict]):
             continue
             
         print(f"(Searching...)", end="\r")
+        start = time.perf_counter()
+        history = build_history(summary, turns)
+        messages = build_messages(user_input, index, client, history)
+        retrieval_seconds = time.perf_counter() - start
+        prompt_tokens = message_tokens(messages)
         
-        # We pass a copy of history so we don't double append inside the function, 
-        # but for CLI simple loop we actually want to maintain state.
-        # The helper function is stateless regarding history updates to keep it pure.
+        first_token = []
+        def on_token(text: str):
+            if not first_token:
+                first_token.append(time.perf_counter() - start)
+                print("AI: ", end="")
+            print(text, end="", flush=True)
         
-        answer = ask_rag_question(user_input, index, client, history)
-        print(f"AI: {answer}")
+        try:
+            answer = stream_completion(client, messages, on_token)
+        except Exception as e:
+            answer = f"Error: {e}"
+            print(f"AI: {answer}", end="")
+        print()
+        ttft = f"{first_token[0]:.2f}s" if first_token else "n/a"
+        print(f"  [ttft {ttft} | retrieval {retrieval_seconds:.2f}s | prompt {prompt_tokens} tokens, "
+              f"history {message_tokens(history)} | total {time.perf_counter() - start:.2f}s]")
         
-        # Update history for next turn (store pure query/answer to save context window)
-        history.append({"role": "user", "content": user_input})
-        history.append({"role": "assistant", "content": answer})
+        # Store pure query/answer (not the retrieved context), then enforce the history budget
+        turns.append({"role": "user", "content": user_input})
+        turns.append({"role": "assistant", "content": answer})
+        evicted, turns = trim_history(turns)
+        if evicted:
+            summary = summarize_turns(client, summary, evicted)
 
 import argparse
 
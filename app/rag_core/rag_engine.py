@@ -1,34 +1,194 @@
 import os
+import sys
 import glob
-import pickle
 import numpy as np
-import pandas as pd
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple, Union
 from dotenv import load_dotenv
 from openai import OpenAI
 import time
-# Try importing pypdf, handle if missing
-try:
-    from pypdf import PdfReader
-except ImportError:
-    PdfReader = None
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Add current directory to path for module imports
+sys.path.append(os.path.dirname(__file__))
+from index_store import IndexStore, normalize_rows, migrate_pickle, file_sha256, text_sha1
+from embedding_cache import get_query_cache
+from ivf_index import DEFAULT_NPROBE
+from embedding_providers import EmbeddingProvider, OpenAIEmbeddingProvider
+from answer_cache import AnswerCache, ANSWER_CACHE_FILE, DEFAULT_TTL_SECONDS, answer_key
+from document_readers import read_segments, read_pdf_pages, pdf_page_count, SUPPORTED_EXTENSIONS
 
 # Configuration
 CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.tmp')
 EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_CONCURRENCY = 4  # Embedding requests in flight during ingestion
 CHAT_MODEL = "gpt-4o-mini"
+PROMPT_VERSION = 1  # Bump whenever the answer prompt changes; cached answers are keyed on it
+QUERY_BATCH_SIZE = 256  # Queries per embeddings request in retrieve_many
+EXTRACT_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # Processes for PDF text extraction
+EXTRACT_PAGES_PER_TASK = 25  # PDF pages per extraction task
+INDEX_WINDOW_CHUNKS = 512    # Chunks embedded and appended to the index together
+
+class ExtractionError(Exception):
+    """A document could not be read; only that document is skipped."""
+
+def extract_pages(path: str, start: int, stop: int) -> Dict:
+    """Process-pool entry point: text of PDF pages [start, stop), timed. Never raises."""
+    started = time.perf_counter()
+    try:
+        segments, error = list(read_pdf_pages(path, start, stop)), None
+    except Exception as e:
+        segments, error = [], str(e)
+    return {"segments": segments, "seconds": time.perf_counter() - started, "error": error}
+
+class PageExtractor:
+    """
+    Extracts PDF page windows in worker processes, in the order the indexer
+    consumes them, with at most `max_in_flight` windows pending: a few windows
+    of text are held at a time, never a whole document.
+    A worker that dies (e.g. on a pathological PDF) breaks the whole pool, so
+    the pool is recreated and the oldest window rerun alone: only the document
+    that really kills its worker fails.
+    """
+    def __init__(self, pending: List[Dict], workers: int, max_in_flight: int):
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.pages: Dict[str, int] = {}   # PDF path -> page count, known once its windows are planned
+        self.errors: Dict[str, str] = {}  # PDF path -> why it could not be planned
+        self.skipped = set()
+        self.tasks = self._plan(pending)
+        self.queue = deque()              # ((path, start, stop), future), oldest first
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self._fill()
+
+    def _plan(self, pending: List[Dict]) -> Iterator[Tuple[str, int, int]]:
+        for file_info in pending:
+            path = file_info["path"]
+            if not path.lower().endswith('.pdf'):
+                continue
+            try:
+                self.pages[path] = pdf_page_count(path)
+            except Exception as e:
+                self.errors[path] = str(e)
+                continue
+            for start in range(0, self.pages[path], EXTRACT_PAGES_PER_TASK):
+                yield path, start, min(start + EXTRACT_PAGES_PER_TASK, self.pages[path])
+
+    def _fill(self):
+        while len(self.queue) < self.max_in_flight:
+            task = next(self.tasks, None)
+            if task is None:
+                return
+            if task[0] in self.skipped:
+                continue
+            try:
+                future = self.pool.submit(extract_pages, *task)
+            except BrokenProcessPool:
+                future = None  # A worker already died; resubmitted once next_window reaches it
+            self.queue.append((task, future))
+
+    def _restart(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def next_window(self, path: str) -> Dict:
+        """extract_pages result of the next window of `path`, whose earlier windows were all taken."""
+        task, future = self.queue.popleft()
+        assert task[0] == path, (task, path)
+        try:
+            if future is None:
+                raise BrokenProcessPool("submitted after a worker died")
+            result = future.result()
+        except BrokenProcessPool:
+            self._restart()
+            try:
+                result = self.pool.submit(extract_pages, *task).result()
+            except BrokenProcessPool as e:
+                self._restart()
+                result = {"segments": [], "seconds": 0.0, "error": f"worker process died ({e})"}
+            # Windows caught in the crash start over in the new pool
+            self.queue = deque((t, self.pool.submit(extract_pages, *t)) for t, _ in self.queue)
+        self._fill()
+        return result
+
+    def skip(self, path: str):
+        """Drop the remaining windows of a document that failed."""
+        self.skipped.add(path)
+        while self.queue and self.queue[0][0][0] == path:
+            future = self.queue.popleft()[1]
+            if future is not None:
+                future.cancel()
+        self._fill()
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+class ExtractedDocument:
+    """
+    One document as (text, location) segments, iterated once: PDF page windows
+    come from the PageExtractor, other formats are read here one CSV row group
+    or text block at a time. `seconds` is the time spent extracting so far.
+    Raises ExtractionError if the document cannot be read.
+    """
+    def __init__(self, path: str, extractor: Optional[PageExtractor] = None):
+        self.path = path
+        self.extractor = extractor
+        self.seconds = 0.0
+
+    def __iter__(self) -> Iterator[Tuple[str, Dict]]:
+        if self.extractor is not None and self.path in self.extractor.errors:
+            raise ExtractionError(self.extractor.errors[self.path])
+        if self.extractor is not None and self.path in self.extractor.pages:
+            for _ in range(0, self.extractor.pages[self.path], EXTRACT_PAGES_PER_TASK):
+                result = self.extractor.next_window(self.path)
+                self.seconds += result["seconds"]
+                if result["error"]:
+                    self.extractor.skip(self.path)
+                    raise ExtractionError(result["error"])
+                yield from result["segments"]
+            return
+        segments = RAGEngine._read_file(self.path)
+        while True:
+            start = time.perf_counter()
+            try:
+                segment = next(segments, None)
+            except Exception as e:
+                raise ExtractionError(str(e)) from e
+            finally:
+                self.seconds += time.perf_counter() - start
+            if segment is None:
+                return
+            yield segment
 
 class RAGEngine:
-    def __init__(self, cache_file_name: str = "rag_cache.pkl", rebuild_index: bool = False):
+    def __init__(self, cache_file_name: str = "rag_cache.pkl", rebuild_index: bool = False,
+                 quantization: Optional[str] = None, embedding_provider: Optional[EmbeddingProvider] = None,
+                 answer_cache_ttl: Optional[float] = DEFAULT_TTL_SECONDS):
         self.load_environment()
-        self.client = OpenAI()
+        # Chat client; an offline embedding_provider (e.g. HashingEmbeddingProvider) works without a key
+        self.client = OpenAI() if os.getenv("OPENAI_API_KEY") else None
+        if embedding_provider is None and self.client is None:
+            raise RuntimeError("OPENAI_API_KEY is not set: add it to app/.env, or pass an offline "
+                               "embedding_provider (e.g. HashingEmbeddingProvider).")
+        self.embedder = embedding_provider or OpenAIEmbeddingProvider(
+            self.client, EMBEDDING_MODEL, max_concurrency=EMBEDDING_CONCURRENCY
+        )
+        # Legacy pickle path (migrated once) and the columnar index directory next to it
         self.cache_path = os.path.join(CACHE_DIR, cache_file_name)
+        self.index_dir = os.path.join(CACHE_DIR, os.path.splitext(cache_file_name)[0])
         self.ensure_directories()
+        # Optional "float16"/"int8" in-RAM scoring copy; exact float32 rows stay on disk (mmap)
+        self.quantization = quantization
+        self.store = IndexStore(self.index_dir, dim=self.embedder.dim, quantization=quantization)
+        self.query_cache = get_query_cache()
+        self.answer_cache = AnswerCache(os.path.join(self.index_dir, ANSWER_CACHE_FILE), ttl_seconds=answer_cache_ttl)
         
-        if not rebuild_index and os.path.exists(self.cache_path):
-            self.load_index()
+        if rebuild_index:
+            self.store.clear() # Start fresh if rebuilding
+            self.answer_cache.clear()
         else:
-            self.index = [] # Start fresh if rebuilding or no cache
+            self.load_index()
 
     def load_environment(self):
         """Load environment variables."""
@@ -43,84 +203,119 @@ class RAGEngine:
             os.makedirs(CACHE_DIR)
 
     def load_index(self):
-        """Load index from cache and build matrix."""
-        print(f"Loading index from {self.cache_path}...")
+        """Memory-map the columnar index, migrating the legacy pickle on first run."""
         try:
-            with open(self.cache_path, 'rb') as f:
-                self.index = pickle.load(f)
-            print(f"Loaded {len(self.index)} chunks from cache.")
-            self._build_matrix()
+            if not self.store.exists() and os.path.exists(self.cache_path):
+                self.store = migrate_pickle(self.cache_path, self.index_dir)
+                self.store.quantization = self.quantization
+            print(f"Loading index from {self.index_dir}...")
+            self.store.load()
+            print(f"Loaded {len(self.store)} chunks from cache.")
         except Exception as e:
             print(f"Error loading cache: {e}. Starting with empty index.")
-            self.index = []
-            self.embeddings_matrix = None
+            self.store.segments = []
+
+    def compact_index(self):
+        """Merge delta segments written during ingestion into the base matrix."""
+        self.store.compact()
+        print(f"Index compacted: {len(self.store)} chunks in one segment.")
 
-    def _build_matrix(self):
-        """Rebuild numpy matrix from index."""
-        if not self.index:
-            self.embeddings_matrix = None
+    def build_ivf(self, n_lists: Optional[int] = None, nprobe: int = DEFAULT_NPROBE):
+        """Build the IVF approximate index; later ingests keep it up to date."""
+        if not self.store.live_count():
+            print("Index is empty; nothing to cluster.")
             return
-            
-        # Extract embeddings
+        self.store.build_ivf(n_lists=n_lists, nprobe=nprobe)
+        print(f"IVF index ready: {self.store.ivf.n_lists} lists, nprobe={self.store.ivf.nprobe}.")
+
+    def _detect_changes(self, file_paths: List[str]) -> List[Dict]:
+        """
+        Compare files against the manifest. Size/mtime short-circuits the check;
+        otherwise the content hash decides. Returns the new or changed files.
+        """
+        pending = []
+        for path in file_paths:
+            if not os.path.exists(path):
+                continue
+            stat = os.stat(path)
+            state = self.store.file_state(path)
+            if state and state["size"] == stat.st_size and state["mtime"] == stat.st_mtime:
+                continue
+            content_hash = file_sha256(path)
+            if state and state["content_hash"] == content_hash:
+                # Touched but not edited: just refresh the manifest entry
+                self.store.set_file_state(path, stat.st_size, stat.st_mtime, content_hash)
+                continue
+            pending.append({"path": path, "size": stat.st_size, "mtime": stat.st_mtime, "content_hash": content_hash})
+        return pending
+
+    def _extract_stream(self, pending: List[Dict], workers: int) -> Iterator[Tuple[Dict, ExtractedDocument]]:
+        """
+        Yield (file_info, document) in order; iterate each document before asking for the next.
+        PDF pages are extracted in `workers` processes, 2 * workers windows ahead of
+        the indexer (possibly of later files), so extraction overlaps embedding.
+        """
+        if workers <= 1 or not any(f["path"].lower().endswith('.pdf') for f in pending):
+            for file_info in pending:
+                yield file_info, ExtractedDocument(file_info["path"])
+            return
+
+        extractor = PageExtractor(pending, workers, max_in_flight=2 * workers)
         try:
-            # Filter items that might be malformed
-            valid_items = [item for item in self.index if "embedding" in item and len(item["embedding"]) == 1536]
-            if not valid_items:
-                 self.embeddings_matrix = None
-                 return
-                 
-            self.embeddings_matrix = np.array([item["embedding"] for item in valid_items], dtype='float32')
-            # Normalize matrix for cosine similarity (if vectors aren't already normalized)
-            # embeddings from openai are usually normalized, but let's be safe for dot product = cosine similarity
-            # Actually, standard is dot product of normalized vectors. 
-            # Vector normalization:
-            norms = np.linalg.norm(self.embeddings_matrix, axis=1, keepdims=True)
-            # Avoid divide by zero
-            norms[norms == 0] = 1
-            self.embeddings_matrix = self.embeddings_matrix / norms
-        except Exception as e:
-            print(f"Error building matrix: {e}")
-            self.embeddings_matrix = None
-
-    def save_index(self):
-        """Save index to cache."""
-        # We only save the list, matrix is rebuilt on load/update
-        print(f"Saving index to {self.cache_path}...")
-        with open(self.cache_path, 'wb') as f:
-            pickle.dump(self.index, f)
-
-    def ingest_files(self, file_paths: List[str]):
-        """Ingest a list of specific file paths."""
-        # 1. Identify new files
-        existing_paths = set(item['path'] for item in self.index if 'path' in item)
-        new_paths = [p for p in file_paths if p not in existing_paths]
+            for file_info in pending:
+                yield file_info, ExtractedDocument(file_info["path"], extractor)
+        finally:
+            extractor.close()
+
+    def ingest_files(self, file_paths: List[str], workers: int = EXTRACT_WORKERS):
+        """
+        Ingest a list of specific file paths (new, edited and deleted files are reconciled).
+        PDF text extraction runs in `workers` processes; on Windows, call this from under
+        an `if __name__ == "__main__":` guard.
+        """
+        # 1. Drop chunks of files that no longer exist
+        removed = [p for p in self.store.tracked_files() if not os.path.exists(p)]
+        for path in removed:
+            self.store.delete_file(path)
+        self.answer_cache.invalidate_paths(removed)
+        if removed:
+            print(f"Removed {len(removed)} deleted files from the index.")
+
+        # 2. Identify new or changed files
+        pending = self._detect_changes(file_paths)
         
-        if not new_paths:
+        if not pending:
             print("All files already indexed.")
             return
 
-        print(f"Found {len(new_paths)} new files to ingest.")
+        print(f"Found {len(pending)} new or changed files to ingest.")
         
-        # 2. Process in chunks of files to allow incremental saving
-        file_batch_size = 10
-        for i in range(0, len(new_paths), file_batch_size):
-            batch_paths = new_paths[i:i + file_batch_size]
-            docs_batch = []
-            
-            for path in batch_paths:
-                if not os.path.exists(path):
-                    continue
-                content = self._read_file(path)
-                if content:
-                    docs_batch.append({"source": os.path.basename(path), "text": content, "path": path})
-            
-            self._process_and_index(docs_batch)
-            print(f"Saved progress after {i + len(batch_paths)}/{len(new_paths)} files.")
+        # 3. Extract in parallel; index each file window by window as its text arrives
+        timings = []
+        wall_start = time.perf_counter()
+        for done, (file_info, document) in enumerate(self._extract_stream(pending, workers), start=1):
+            name = os.path.basename(file_info["path"])
+            try:
+                indexed = self._index_document(file_info, document)
+            except ExtractionError as e:
+                print(f"  - Failed {name} after {document.seconds:.2f}s: {e}")
+            else:
+                if indexed:
+                    print(f"  - Indexed {name}: {indexed} chunks, {document.seconds:.2f}s extracting")
+                else:
+                    print(f"  - Skipped {name}: no extractable text")
+            timings.append((document.seconds, name))
+            print(f"Saved progress after {done}/{len(pending)} files.")
+
+        cpu_seconds = sum(t for t, _ in timings)
+        slowest = ", ".join(f"{n} ({t:.1f}s)" for t, n in sorted(timings, reverse=True)[:3])
+        print(f"Extraction: {len(timings)} files, {cpu_seconds:.1f}s total in {time.perf_counter() - wall_start:.1f}s wall "
+              f"with {workers} workers. Slowest: {slowest}")
 
-    def ingest_directories(self, directories: List[str], recursive: bool = True):
+    def ingest_directories(self, directories: List[str], recursive: bool = True, workers: int = EXTRACT_WORKERS):
         """Ingest all supported files from directories."""
         all_files = []
-        extensions = ['*.txt', '*.csv', '*.pdf', '*.md']
+        extensions = ['*' + ext for ext in SUPPORTED_EXTENSIONS]
         
         for dir_path in directories:
             if not os.path.exists(dir_path):
@@ -132,111 +327,181 @@ class RAGEngine:
         
         # Remove duplicates
         all_files = list(set(all_files))
-        self.ingest_files(all_files)
+        self.ingest_files(all_files, workers=workers)
 
-    def _read_file(self, file_path: str) -> Optional[str]:
-        # Silence the read print to reduce noise
-        # print(f"Reading {os.path.basename(file_path)}...", end='\r')
-        ext = os.path.splitext(file_path)[1].lower()
-        try:
-            if ext == '.txt' or ext == '.md':
-                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                    return f.read()
-            elif ext == '.csv':
-                try:
-                    df = pd.read_csv(file_path)
-                    return df.to_string(index=False)
-                except:
-                    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                        return f.read()
-            elif ext == '.pdf':
-                if PdfReader:
-                    reader = PdfReader(file_path)
-                    text = ""
-                    for page in reader.pages:
-                         extracted = page.extract_text()
-                         if extracted:
-                             text += extracted + "\n"
-                    return text
-                else:
-                    return None
-            else:
-                return None
-        except Exception as e:
-            print(f"Error reading {file_path}: {e}")
-            return None
+    @staticmethod
+    def _read_file(file_path: str) -> Iterator[Tuple[str, Dict]]:
+        """
+        Stream a document as (text, location) segments so it is never held whole in memory:
+        PDFs yield one page at a time ({"page": n}), CSVs one row group at a time
+        ({"row_start", "row_end"}), and text/markdown ~1MB blocks ({}).
+        """
+        return read_segments(file_path)
 
-    def chunk_text(self, text: str, chunk_size: int = 1500, overlap: int = 300) -> List[str]:
-        chunks = []
-        start = 0
-        text_len = len(text)
-        while start < text_len:
-            end = start + chunk_size
-            chunk = text[start:end]
-            chunks.append(chunk)
-            start += (chunk_size - overlap)
-        return chunks
-
-    def _process_and_index(self, docs: List[Dict]):
-        if not docs:
-            return
+    @staticmethod
+    def chunk_text(segments: Union[str, Iterable[Tuple[str, Dict]]], chunk_size: int = 1500,
+                   overlap: int = 300) -> Iterator[Tuple[str, Dict]]:
+        """
+        Incrementally chunk a text or a stream of (text, location) segments.
+        Only the unconsumed tail of the stream is buffered. Yields (chunk, meta) where
+        meta holds the page / row range the chunk spans, when the source has one.
+        """
+        if isinstance(segments, str):
+            segments = [(segments, {})]
+        step = chunk_size - overlap
+        buffer = ""
+        buffer_start = 0  # absolute offset of buffer[0]
+        marks = []        # (abs_start, abs_end, location) of segments still in the buffer
 
-        all_chunk_texts = []
-        indexed_chunks = [] 
+        def span_meta(start: int, end: int) -> Dict:
+            meta = {}
+            locs = [loc for s, e, loc in marks if s < end and e > start]
+            pages = [loc["page"] for loc in locs if "page" in loc]
+            if pages:
+                meta["page_start"], meta["page_end"] = min(pages), max(pages)
+            rows = [loc for loc in locs if "row_start" in loc]
+            if rows:
+                meta["row_start"], meta["row_end"] = rows[0]["row_start"], rows[-1]["row_end"]
+            return meta
 
-        for doc in docs:
-            chunks = self.chunk_text(doc["text"])
-            for c in chunks:
-                all_chunk_texts.append(c)
-                indexed_chunks.append({"text": c, "source": doc["source"], "path": doc["path"]})
-        
-        if not all_chunk_texts:
-            return
+        pos = 0           # start of the next window within buffer
+        for text, location in segments:
+            # Drop consumed text once per segment (not per chunk) to keep this linear
+            buffer = buffer[pos:] + text
+            buffer_start += pos
+            pos = 0
+            marks = [m for m in marks if m[1] > buffer_start]
+            seg_start = buffer_start + len(buffer) - len(text)
+            marks.append((seg_start, seg_start + len(text), location))
+            while len(buffer) - pos >= chunk_size + step:
+                yield buffer[pos:pos + chunk_size], span_meta(buffer_start + pos, buffer_start + pos + chunk_size)
+                pos += step
 
-        print(f"Embedding {len(all_chunk_texts)} chunks for {len(docs)} files...")
-        embeddings = self.get_embeddings(all_chunk_texts)
-        
-        for i, emb in enumerate(embeddings):
-            indexed_chunks[i]["embedding"] = emb
-        
-        self.index.extend(indexed_chunks)
-        self.save_index()
-        # Rebuild matrix to include new chunks
-        self._build_matrix()
+        # Flush the tail exactly like the original fixed-window loop
+        start = pos
+        while start < len(buffer):
+            chunk = buffer[start:start + chunk_size]
+            yield chunk, span_meta(buffer_start + start, buffer_start + start + len(chunk))
+            start += step
+
+    def _index_document(self, file_info: Dict, document: Iterable[Tuple[str, Dict]]) -> int:
+        """
+        Chunk, embed and append one document INDEX_WINDOW_CHUNKS chunks at a time, so
+        memory stays flat whatever its size. The file's old rows are dropped once all
+        new ones are in; if reading fails midway, the new rows are dropped instead.
+        Returns the number of chunks indexed.
+        """
+        path = file_info["path"]
+        source = os.path.basename(path)
+        stale_rows, old_by_hash = [], {}
+        for row_id, text in self.store.rows_for_path(path):
+            stale_rows.append(row_id)
+            old_by_hash[text_sha1(text)] = row_id
 
-    def retrieve(self, query: str, k: int = 5) -> List[Dict]:
-        if not self.index or self.embeddings_matrix is None:
+        new_rows, window = [], []
+        try:
+            for chunk, meta in self.chunk_text(document):
+                window.append({"text": chunk, "source": source, "path": path, **meta})
+                if len(window) == INDEX_WINDOW_CHUNKS:
+                    new_rows.extend(self._index_window(window, old_by_hash))
+                    window = []
+            new_rows.extend(self._index_window(window, old_by_hash))
+        except BaseException:
+            self.store.delete_rows(new_rows)
+            raise
+        if not new_rows:
+            return 0
+
+        self.store.delete_rows(stale_rows)
+        dropped = self.answer_cache.invalidate_paths([path])
+        if dropped:
+            print(f"Invalidated {dropped} cached answers citing {source}.")
+        self.store.set_file_state(path, file_info["size"], file_info["mtime"], file_info["content_hash"])
+        return len(new_rows)
+
+    def _index_window(self, window: List[Dict], old_by_hash: Dict[str, int]) -> List[int]:
+        """
+        Embed and append one window of chunk records; returns their row ids. Chunks
+        whose text is already indexed reuse their vectors; only new text is embedded.
+        """
+        if not window:
             return []
-            
+        reused_rows = {}  # position in window -> existing row id
+        for i, record in enumerate(window):
+            row_id = old_by_hash.get(text_sha1(record["text"]))
+            if row_id is not None:
+                reused_rows[i] = row_id
+
+        to_embed = [i for i in range(len(window)) if i not in reused_rows]
+        vectors = np.empty((len(window), self.store.dim), dtype='float32')
+        if reused_rows:
+            positions = list(reused_rows.keys())
+            vectors[positions] = self.store.take(reused_rows.values())
+
+        print(f"Embedding {len(to_embed)} chunks of {window[0]['source']} ({len(reused_rows)} unchanged chunks reused)...")
+        if to_embed:
+            embeddings = self.get_embeddings([window[i]["text"] for i in to_embed])
+            # Normalize once on the way in; dot product == cosine similarity at query time
+            vectors[to_embed] = normalize_rows(np.array(embeddings, dtype='float32'))
+        return self.store.append(vectors, window)
+
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Embed chunk texts through the configured provider (batched, concurrent, retried)."""
+        return self.embedder.embed(texts)
+
+    def embed_queries(self, queries: List[str]) -> Optional[np.ndarray]:
+        """
+        Embed queries in batched requests. Returns a normalized (Q, D) matrix.
+        Previously seen queries are served from the query-embedding cache.
+        """
         try:
-            query_emb = self.client.embeddings.create(input=[query], model=EMBEDDING_MODEL).data[0].embedding
+            embeddings = []
+            for i in range(0, len(queries), QUERY_BATCH_SIZE):
+                batch = queries[i:i + QUERY_BATCH_SIZE]
+                embeddings.extend(self.query_cache.get_or_embed_many(self.embedder, self.embedder.model, batch))
         except Exception as e:
             print(f"Error embedding query: {e}")
+            return None
+        return normalize_rows(np.array(embeddings, dtype='float32'))
+
+    def retrieve_many(self, queries: List[str], k: int = 5, exact: bool = False,
+                      filters: Optional[Dict] = None) -> List[List[Dict]]:
+        """
+        Retrieve top k chunks for many queries at once: one batched embedding call,
+        matrix-matrix scoring over memory-bounded row blocks, argpartition top-k.
+        Uses the IVF index when one is built, unless `exact` forces brute force.
+        `filters` (e.g. {"source": "NFPA 99.pdf"} or {"source": [...]}) limits scoring
+        to the matching rows, so restricted searches cost in proportion to the subset.
+        """
+        if not queries:
             return []
-            
-        query_vec = np.array(query_emb, dtype='float32')
-        # Normalize query vector
-        norm = np.linalg.norm(query_vec)
-        if norm > 0:
-            query_vec = query_vec / norm
-        
-        # Vectorized Cosine Similarity: Matrix (N, D) dot Vector (D,) -> Scores (N,)
-        scores = np.dot(self.embeddings_matrix, query_vec)
-        
-        # Get top k indices
-        # argsort sorts ascending, so take last k and reverse
-        top_k_indices = np.argsort(scores)[-k:][::-1]
-        
-        return [self.index[i] for i in top_k_indices]
+        if not self.store.live_count():
+            return [[] for _ in queries]
+
+        query_matrix = self.embed_queries(queries)
+        if query_matrix is None:
+            return [[] for _ in queries]
+
+        top_ids, _ = self.store.top_k(query_matrix, k, exact=exact, filters=filters)
+        return [self.store.get_records(ids) for ids in top_ids]
+
+    def retrieve(self, query: str, k: int = 5, exact: bool = False, filters: Optional[Dict] = None) -> List[Dict]:
+        return self.retrieve_many([query], k=k, exact=exact, filters=filters)[0]
 
-    def query(self, query: str, k: int = 5) -> str:
-        top_chunks = self.retrieve(query, k=k)
+    def _answer(self, query: str, top_chunks: List[Dict], use_cache: bool = True) -> str:
         if not top_chunks:
             return "No relevant information found in the documents."
+
+        key = answer_key(CHAT_MODEL, PROMPT_VERSION, query, top_chunks)
+        if use_cache:
+            cached = self.answer_cache.get(key)
+            if cached is not None:
+                return cached
             
         context_str = ""
         for chunk in top_chunks:
-            context_str += f"\n--- Source: {chunk['source']} ---\n{chunk['text']}\n"
+            location = f" (p. {chunk['page_start']}-{chunk['page_end']})" if "page_start" in chunk else ""
+            context_str += f"\n--- Source: {chunk['source']}{location} ---\n{chunk['text']}\n"
             
         prompt = (
             "You are an expert architect and engineering assistant.\n"
@@ -254,6 +519,26 @@ class RAGEngine:
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.0
             )
-            return response.choices[0].message.content.strip()
+            answer = response.choices[0].message.content.strip()
         except Exception as e:
             return f"Error querying LLM: {e}"
+        # Errors are never cached, so a transient failure is retried next time
+        self.answer_cache.put(key, answer, top_chunks)
+        return answer
+
+    def query(self, query: str, k: int = 5, filters: Optional[Dict] = None, use_cache: bool = True) -> str:
+        """
+        Answer a question from the top k chunks. Answers are cached per exact
+        retrieved context; pass use_cache=False to force a fresh LLM call.
+        """
+        return self._answer(query, self.retrieve(query, k=k, filters=filters), use_cache=use_cache)
+
+    def query_many(self, queries: List[str], k: int = 5, filters: Optional[Dict] = None,
+                   use_cache: bool = True) -> List[str]:
+        """Answer a checklist of questions; retrieval for all of them is batched."""
+        all_chunks = self.retrieve_many(queries, k=k, filters=filters)
+        return [self._answer(q, chunks, use_cache=use_cache) for q, chunks in zip(queries, all_chunks)]
+
+    def cache_stats(self) -> Dict:
+        """Hit-rate stats for the query-embedding and answer caches."""
+        return {"query_embeddings": self.query_cache.stats(), "answers": self.answer_cache.stats()}
@@ -0,0 +1,101 @@
+import re
+from typing import Dict, List, Optional
+
+# Section and table numbering of the code books: NFPA 70 articles and sections
+# ("ARTICLE 517", "517.13"), chapter/decimal sections of the other NFPA standards
+# ("CHAPTER 4", "4.3.2.1"), UFC paragraphs ("3-2.1") and FGI sections ("2.1-3.4.2").
+# Headings are recognised only at the start of a line, so the splitter can cut
+# the token stream right before them. Wrapped PDF text also puts cross-references
+# there ("Article 250, Part VI", "Table 250.122 for sizing"), so articles and
+# chapters must be in capitals and a table caption must be alone on its line or
+# followed by its title.
+MAJOR, MINOR, TABLE = "major", "minor", "table"  # Heading kinds: article/chapter, numbered section, table caption
+SECTION_PATH_SEPARATOR = " > "
+UNKNOWN_SECTION = "Unknown"
+NEC_ARTICLE_RANGE = (90, 840)  # Bare "NNN.N" numbers in this range are NEC sections of article NNN
+HEADING_RULES_VERSION = 2      # Part of the ingest chunker config: bumping it re-chunks every book
+
+TABLE_NUMBER = r"\d+(?:\.\d+)*(?:-\d+(?:\.\d+)*)?(?:\([A-Za-z0-9]+\))*"
+HEADING_PATTERN = re.compile(
+    r"^(?:"
+    r"ARTICLE\s+(?P<article>\d{2,3})\b"
+    r"|CHAPTER\s+(?P<chapter>\d{1,2})\b"
+    rf"|(?:TABLE|Table)\s+(?P<table>{TABLE_NUMBER})(?=[ \t\r]*$|[ \t]+[A-Z])"
+    r"|(?P<section>\d{1,2}\.\d-\d+(?:\.\d+)*|\d{1,2}-\d+(?:\.\d+)*|\d{1,3}(?:\.\d{1,3}){1,5})(?=[ \t]+[A-Z*])"
+    r")",
+    re.MULTILINE,
+)
+
+QUERY_TABLE = re.compile(rf"\btable\s+({TABLE_NUMBER})", re.IGNORECASE)
+QUERY_ARTICLE = re.compile(r"\barticle\s+(\d{2,3})\b", re.IGNORECASE)
+QUERY_SECTION = re.compile(r"(?:\bsection\s+|\bsec\.\s*|§\s*|\bNEC\s+)(\d{2,3})\.\d{1,3}\b", re.IGNORECASE)
+
+
+def normalize_table_number(number: str) -> str:
+    return number.upper()
+
+
+def first_component(number: str) -> str:
+    return re.split(r"[.\-]", number, maxsplit=1)[0]
+
+
+def is_parent_number(parent: str, child: str) -> bool:
+    """"4.3" contains "4.3.2"; "3-2" contains "3-2.1"; "2.1-3" contains "2.1-3.4"."""
+    return child.startswith(parent) and len(child) > len(parent) and child[len(parent)] in ".-"
+
+
+class SectionTracker:
+    """Running section state of one document, fed its headings in order."""
+    def __init__(self):
+        self.top_kind = ""     # "Article" / "Chapter"
+        self.top_number = ""
+        self.numbered: List[str] = []  # Open numbered sections, outermost first
+        self.table = ""
+
+    def update(self, match: re.Match) -> Optional[str]:
+        """Apply one HEADING_PATTERN match; returns its kind, or None if it is not a heading of this article/chapter."""
+        if match.group("article") or match.group("chapter"):
+            self.top_kind = "Article" if match.group("article") else "Chapter"
+            self.top_number = (match.group("article") or match.group("chapter")).lstrip("0") or "0"
+            self.numbered = []
+            self.table = ""
+            return MAJOR
+        if match.group("table"):
+            self.table = normalize_table_number(match.group("table"))
+            return TABLE
+
+        number = match.group("section")
+        top = first_component(number)
+        if self.top_kind and "-" not in number.split(".", 1)[0] and top != self.top_number:
+            # A cross-reference wrapped onto the start of a line ("210.8 shall apply"
+            # inside Article 220). Only ARTICLE/CHAPTER headings move the article on.
+            return None
+        if not self.top_kind and re.fullmatch(r"\d{2,3}\.\d{1,3}", number) \
+                and NEC_ARTICLE_RANGE[0] <= int(top) <= NEC_ARTICLE_RANGE[1]:
+            self.top_kind, self.top_number = "Article", top
+        self.numbered = [s for s in self.numbered if is_parent_number(s, number)] + [number]
+        self.table = ""
+        return MINOR
+
+    def metadata(self) -> Dict:
+        path = ([f"{self.top_kind} {self.top_number}"] if self.top_kind else []) + self.numbered
+        return {
+            "section_path": SECTION_PATH_SEPARATOR.join(path) or UNKNOWN_SECTION,
+            "article": self.top_number if self.top_kind == "Article" else "",
+            "table_number": self.table,
+        }
+
+
+def default_section_metadata() -> Dict:
+    return {"section_path": UNKNOWN_SECTION, "article": "", "table_number": ""}
+
+
+def query_section_filter(query: str) -> Optional[Dict]:
+    """Chroma `where` clause for a question that names a table, article or NEC section, else None."""
+    table = QUERY_TABLE.search(query)
+    if table:
+        return {"table_number": normalize_table_number(table.group(1))}
+    article = QUERY_ARTICLE.search(query) or QUERY_SECTION.search(query)
+    if article:
+        return {"article": article.group(1).lstrip("0") or "0"}
+    return None
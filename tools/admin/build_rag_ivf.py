@@ -0,0 +1,32 @@
+import os
+import sys
+import argparse
+
+# Add root dir to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from app.rag_core.index_store import IndexStore
+from app.rag_core.ivf_index import DEFAULT_NPROBE
+from app.rag_core.rag_engine import CACHE_DIR
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the IVF (clustered) approximate index for RAGEngine.")
+    parser.add_argument("--index-dir", default=os.path.join(CACHE_DIR, "rag_cache"), help="Index directory")
+    parser.add_argument("--lists", type=int, default=None, help="Number of k-means lists (default ~4*sqrt(N))")
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE, help="Lists probed per query")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.index_dir):
+        print(f"Error: Index directory not found: {args.index_dir}")
+        return
+
+    store = IndexStore(args.index_dir)
+    store.load()
+    if not store.live_count():
+        print("Index is empty; nothing to cluster.")
+        return
+    store.build_ivf(n_lists=args.lists, nprobe=args.nprobe)
+    print(f"Done. {store.ivf.n_lists} lists over {len(store)} rows, nprobe={store.ivf.nprobe}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import os
+import sys
+import argparse
+
+# Add root dir to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from app.rag_core.index_store import IndexStore
+from app.rag_core.rag_engine import CACHE_DIR
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge RAGEngine delta segments into a single base matrix.")
+    parser.add_argument("--index-dir", default=os.path.join(CACHE_DIR, "rag_cache"), help="Index directory to compact")
+    parser.add_argument("--verify", action="store_true", help="Re-checksum every segment before merging")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.index_dir):
+        print(f"Error: Index directory not found: {args.index_dir}")
+        return
+
+    store = IndexStore(args.index_dir)
+    store.load(verify=args.verify)
+    print(f"Loaded {len(store)} rows in {len(store.segments)} segments.")
+    store.compact()
+    print(f"Done. {len(store)} rows in {len(store.segments)} segment(s).")
+
+if __name__ == "__main__":
+    main()
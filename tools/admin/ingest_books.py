@@ -1,22 +1,76 @@
 import os
+import re
+import sys
 import glob
+import json
 import chromadb
 import uuid
 import time
-from typing import List, Dict, Optional, Tuple
+import bisect
+import queue
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import lru_cache
+from typing import List, Dict, Optional, Tuple, Iterable
 from dotenv import load_dotenv
 from openai import OpenAI
 import tiktoken
 
 import argparse
 
+# Add root dir to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from app.rag_core.parent_store import ParentStore, PARENT_DB_FILE
+from app.rag_core.index_store import file_sha256
+from app.rag_core.embedding_providers import OpenAIEmbeddingProvider
+from app.rag_core.embedding_cache import ContentEmbeddingCache
+from app.rag_core.corpus import CORPUS_COLLECTION, membership_metadata
+from app.rag_core.document_readers import read_segments, read_pdf_pages, pdf_page_count, PdfReader, SUPPORTED_EXTENSIONS
+from app.rag_core.sections import (
+    HEADING_PATTERN, HEADING_RULES_VERSION, SectionTracker, default_section_metadata, MAJOR, TABLE
+)
+
 # Configuration
 # Default paths
 # Default paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 CHROMA_DIR = os.path.join(BASE_DIR, '.gemini', 'chroma_db')
 EMBEDDING_MODEL = "text-embedding-3-large"
+# Embedding request shaping (defaults sit under OpenAI tier-1 limits for text-embedding-3-large)
+EMBEDDING_CONCURRENCY = 4        # Requests in flight
+EMBEDDING_BATCH_TOKENS = 100000  # Tokens per request (API limit is ~300k)
+EMBEDDING_RPM = 3000
+EMBEDDING_TPM = 1000000
+EMBEDDING_PRICE_PER_M_TOKENS = 0.13  # USD, text-embedding-3-large list price (savings report)
+
+# Ingestion manifest, next to CHROMA_DIR: per collection and book, the file's sha256,
+# size/mtime, chunker config, embedding model, chunk-id layout and progress.
+# The skip/replace decision is a dict lookup plus a stat per book (and a hash of
+# touched files), and a changed book's old chunks are deleted by id. Chunks are
+# embedded and written in windows with progress saved after each, so a failure
+# only loses the current one.
+MANIFEST_FILE = "ingest_manifest.json"
+INGEST_BATCH_CHUNKS = 1000        # Chunks embedded + written per manifest save
+DEFAULT_CHROMA_MAX_BATCH = 5000   # Used if the client cannot report its limit
+
+# Streaming pipeline: chunk stage (main thread driving worker processes) -> embed
+# thread -> one Chroma writer thread, joined by bounded queues so a fast stage waits
+# instead of buffering the whole library in memory. Books are chunked a segment
+# batch at a time, so no stage ever holds a whole book.
+CHUNK_WORKERS = min(4, os.cpu_count() or 1)
+PIPELINE_QUEUE_SIZE = 4           # Chunk batches awaiting embedding / embedded windows awaiting the writer
+METRICS_INTERVAL = 10.0           # Seconds between pipeline progress lines (0 disables)
+BOOKS_PER_WORKER = 2              # Books chunked concurrently, per chunk worker
+PDF_PAGES_PER_TASK = 25           # PDF pages extracted per worker task (a big PDF spreads over all workers)
+PDF_PAGE_TASKS_AHEAD = 2          # Page tasks extracted ahead of each PDF's chunk task
+SEGMENT_BATCH_CHARS = 1000000     # Text of .txt/.md/.csv segments sent to one chunk task
 
+# Every domain folder feeds the one CORPUS_COLLECTION; a book found in several
+# folders is ingested once and flagged with each domain. "collection" names the
+# pre-corpus per-domain collection, kept for the savings report and RAGAgent fallback.
 DOMAIN_MAP = {
     "healthcare": {"folder": "Code Books and Healthcare", "collection": "rag_healthcare"},
     "code": {"folder": "Code Books Only", "collection": "rag_code_only"},
@@ -27,6 +81,13 @@ DOMAIN_MAP = {
 PARENT_CHUNK_SIZE = 2000  # Tokens
 CHILD_CHUNK_SIZE = 400    # Tokens
 CHILD_OVERLAP = 100       # Tokens
+PARENT_OVERLAP = 100      # Tokens
+ALIGN_PARENTS_TO_SECTIONS = True  # End parents at article/section/table headings instead of mid-section
+MIN_PARENT_TOKENS = 500   # A section break is only used as a parent end this far into the parent
+
+# Keyword heuristic for calculation/formula chunks, matched in one case-insensitive pass
+CALC_KEYWORDS = ["calculate", "load calculation", "demand factor", "VA per", "watts per", "table"]
+CALC_PATTERN = re.compile("|".join(re.escape(k) for k in CALC_KEYWORDS), re.IGNORECASE)
 
 def load_environment():
     """Load environment variables."""
@@ -35,32 +96,35 @@ def load_environment():
     if not os.getenv("OPENAI_API_KEY"):
         raise ValueError("OPENAI_API_KEY not found in .env file")
 
+@lru_cache(maxsize=None)
+def get_encoder(model_name: str):
+    """tiktoken encodings are expensive to build; share one per model across splitters and files."""
+    return tiktoken.encoding_for_model(model_name)
+
+def token_spans(total_tokens: int, chunk_size: int, overlap: int = 0) -> List[Tuple[int, int]]:
+    """(start, end) token ranges of consecutive windows; the last window ends at total_tokens."""
+    spans = []
+    start = 0
+    while start < total_tokens:
+        end = min(start + chunk_size, total_tokens)
+        spans.append((start, end))
+        if end == total_tokens:
+            break
+        start += (chunk_size - overlap)
+    return spans
+
 class ParentChildSplitter:
-    def __init__(self, model_name="gpt-4"):
-        self.encoder = tiktoken.encoding_for_model(model_name)
+    def __init__(self, model_name="gpt-4", align_sections: bool = ALIGN_PARENTS_TO_SECTIONS):
+        self.encoder = get_encoder(model_name)
+        self.align_sections = align_sections
 
     def count_tokens(self, text: str) -> int:
-        return len(self.encoder.encode(text))
+        return len(self.encoder.encode_ordinary(text))
 
     def split_text(self, text: str, chunk_size: int, overlap: int = 0) -> List[str]:
         """Split text into chunks based on token count."""
-        tokens = self.encoder.encode(text)
-        chunks = []
-        start = 0
-        total_tokens = len(tokens)
-        
-        while start < total_tokens:
-            end = min(start + chunk_size, total_tokens)
-            chunk_tokens = tokens[start:end]
-            chunk_text = self.encoder.decode(chunk_tokens)
-            chunks.append(chunk_text)
-            
-            if end == total_tokens:
-                break
-                
-            start += (chunk_size - overlap)
-            
-        return chunks
+        tokens = self.encoder.encode_ordinary(text)
+        return [self.encoder.decode(tokens[start:end]) for start, end in token_spans(len(tokens), chunk_size, overlap)]
 
     def extract_metadata(self, text: str, source: str) -> Dict:
         """
@@ -70,15 +134,13 @@ class ParentChildSplitter:
         meta = {
             "source_id": source.replace(" ", "_").replace(".", "_"), # Simple ID
             "source_title": source,
-            "section_path": "Unknown", # Placeholder
             "rev": "Latest", # Placeholder
             "chunk_role": "normative", # Default
             "contains_formula": False
         }
         
         # Heuristic for calculation/formula
-        calc_keywords = ["calculate", "load calculation", "demand factor", "VA per", "watts per", "table"]
-        if any(k in text.lower() for k in calc_keywords):
+        if CALC_PATTERN.search(text):
             meta["contains_formula"] = True
             
         # Heuristic for Table
@@ -87,182 +149,921 @@ class ParentChildSplitter:
             
         return meta
 
-    def create_parent_child_chunks(self, text: str, source: str, domain: str) -> List[Dict]:
+    def create_parent_child_chunks(self, text: str, source: str, domain: str) -> Tuple[List[Dict], List[Dict]]:
         """
         Splits text into Parents, then splits Parents into Children.
-        Returns a list of Child chunks with Parent metadata.
+        Returns (parents, children): parents are {"id", "text"} for the ParentStore;
+        children carry Parent metadata and reference their parent only by id.
         """
-        chunks_data = []
-        
-        # 1. Create Parent Chunks
-        parent_chunks = self.split_text(text, PARENT_CHUNK_SIZE, overlap=100)
+        return self.create_parent_child_chunks_from_segments([(text, {})], source, domain)
+
+    def create_parent_child_chunks_from_segments(self, segments: Iterable[Tuple[str, Dict]], source: str,
+                                                 domain: str) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Streaming form of create_parent_child_chunks over (text, location) segments
+        (PDF pages, CSV row groups, text blocks). Each segment is tokenized once as
+        it arrives and parents are cut as soon as their tokens are known, so only the
+        tokens not yet covered by a parent are buffered. Children record the pages
+        or rows they span (`page_start`/`page_end`, `row_start`/`row_end`) and their
+        `section_path`, `article` and `table_number` from the headings seen so far.
+        With `align_sections`, parents end at section breaks instead of mid-section.
+        """
+        state = ChunkState(source, domain)
+        parents, chunks_data = self.feed_segments(state, segments)
+        last_parents, last_chunks = self.finish_chunking(state)
+        return parents + last_parents, chunks_data + last_chunks
+
+    def feed_segments(self, state: "ChunkState", segments: Iterable[Tuple[str, Dict]]) -> Tuple[List[Dict], List[Dict]]:
+        """Advance `state` over more segments; returns the parents/children completed by them."""
+        parents, chunks_data = [], []
+        start_time = time.perf_counter()
+        for text, location in segments:
+            segment_start = state.total
+            # Headings start lines, which are pre-token boundaries: tokenizing the
+            # pieces between them gives the tokens of the whole segment
+            piece_start = 0
+            # CSV row groups are table data, not headings
+            for match in (HEADING_PATTERN.finditer(text) if "row_start" not in location else ()):
+                self._append_tokens(state, text[piece_start:match.start()])
+                piece_start = match.start()
+                kind = state.tracker.update(match)
+                if kind:
+                    state.heading_starts.append(state.total)
+                    state.headings.append((kind, state.tracker.metadata()))
+            self._append_tokens(state, text[piece_start:])
+            if location:
+                state.marks.append((segment_start, state.total, location))
+            while True:
+                cut = self._next_parent_end(state)
+                if cut is None:
+                    break
+                p_end, at_heading = cut
+                self._emit_parent(state, state.next_parent, p_end, parents, chunks_data)
+                # Overlap only when the cut falls inside a section
+                state.next_parent = p_end if at_heading else p_end - PARENT_OVERLAP
+            state.release_covered()
+        state.seconds += time.perf_counter() - start_time
+        return parents, chunks_data
+
+    def finish_chunking(self, state: "ChunkState") -> Tuple[List[Dict], List[Dict]]:
+        """End the document: the last parent runs to its final token."""
+        parents, chunks_data = [], []
+        if state.total > state.next_parent:
+            self._emit_parent(state, state.next_parent, state.total, parents, chunks_data)
+            state.next_parent = state.total
+        print(f"  - Chunked {state.total:,} tokens into {state.n_parents} parents and {state.n_children} children "
+              f"in {state.seconds:.2f}s ({state.total / max(state.seconds, 1e-9):,.0f} tokens/s).")
+        return parents, chunks_data
+
+    def _append_tokens(self, state: "ChunkState", text: str):
+        piece_tokens = self.encoder.encode_ordinary(text)
+        state.tokens.extend(piece_tokens)
+        state.total += len(piece_tokens)
+
+    def _next_parent_end(self, state: "ChunkState") -> Optional[Tuple[int, bool]]:
+        """(end, at a heading) of the parent starting at `next_parent` once it can no longer change, else None."""
+        limit = state.next_parent + PARENT_CHUNK_SIZE
+        if self.align_sections:
+            # Breaks far enough into the window to leave a useful parent behind them
+            first = bisect.bisect_right(state.heading_starts, state.next_parent + MIN_PARENT_TOKENS)
+            last = bisect.bisect_right(state.heading_starts, min(limit, state.total))
+            for idx in range(first, last):
+                if state.headings[idx][0] == MAJOR:
+                    return state.heading_starts[idx], True   # First article/chapter heading
+            if state.total > limit and last > first:
+                return state.heading_starts[last - 1], True  # Window full: latest section or table heading
+        # A parent that ends before the last known token is never the final one
+        return (limit, False) if state.total > limit else None
+
+    def _emit_parent(self, state: "ChunkState", p_start: int, p_end: int, parents: List[Dict], chunks_data: List[Dict]):
+        source = state.source
+        # Parent-level fields only depend on the source
+        parent_meta = self.extract_metadata("", source)
+        p_idx = state.n_parents
+        state.n_parents += 1
+        parent_id = f"{source}_p{p_idx}"
+        parent_tokens = state.tokens[p_start - state.base:p_end - state.base]
+        parents.append({"id": parent_id, "text": self.encoder.decode(parent_tokens)})
         
-        print(f"  - Generated {len(parent_chunks)} Parent chunks.")
+        # Create Child Chunks from this Parent (offsets relative to the parent)
+        child_spans = token_spans(p_end - p_start, CHILD_CHUNK_SIZE, overlap=CHILD_OVERLAP)
+        state.n_children += len(child_spans)
         
-        for p_idx, parent_text in enumerate(parent_chunks):
-            parent_id = f"{source}_p{p_idx}"
+        for c_idx, (c_start, c_end) in enumerate(child_spans):
+            chunk_id = f"{parent_id}_c{c_idx}"
+            child_text = self.encoder.decode(parent_tokens[c_start:c_end])
             
-            # Simple metadata extraction for parent
-            parent_meta = self.extract_metadata(parent_text, source)
+            # Child inherits parent metadata but can refine specific formula detection
+            child_meta = self.extract_metadata(child_text, source)
             
-            # 2. Create Child Chunks from this Parent
-            child_chunks = self.split_text(parent_text, CHILD_CHUNK_SIZE, overlap=CHILD_OVERLAP)
+            # Merge metadata
+            full_meta = {
+                "source": source,
+                "parent_id": parent_id,
+                "child_index": c_idx,
+                "parent_index": p_idx,
+                "source_title": parent_meta["source_title"],
+                "domain": state.domain,
+                "chunk_role": child_meta["chunk_role"],
+                "contains_formula": child_meta["contains_formula"],
+                "rev": parent_meta["rev"],
+                **state.section_metadata(p_start + c_start, p_start + c_end),
+                **location_metadata(state.marks, p_start + c_start, p_start + c_end)
+            }
             
-            for c_idx, child_text in enumerate(child_chunks):
-                chunk_id = f"{parent_id}_c{c_idx}"
-                
-                # Child inherits parent metadata but can refine specific formula detection
-                child_meta = self.extract_metadata(child_text, source)
-                
-                # Merge metadata
-                full_meta = {
-                    "source": source,
-                    "parent_id": parent_id,
-                    "parent_text": parent_text,
-                    "child_index": c_idx,
-                    "parent_index": p_idx,
-                    "source_title": parent_meta["source_title"],
-                    "domain": domain,
-                    "section_path": parent_meta["section_path"],
-                    "chunk_role": child_meta["chunk_role"],
-                    "contains_formula": child_meta["contains_formula"],
-                    "rev": parent_meta["rev"]
-                }
-                
-                chunks_data.append({
-                    "id": chunk_id,
-                    "text": child_text,
-                    "metadata": full_meta
-                })
-                
-        return chunks_data
-
-def get_embeddings_batched(client: OpenAI, texts: List[str], batch_size: int = 50) -> List[List[float]]:
-    """Generate embeddings with batching and retry logic."""
-    all_embeddings = []
-    
+            chunks_data.append({
+                "id": chunk_id,
+                "text": child_text,
+                "metadata": full_meta,
+                "tokens": c_end - c_start
+            })
+
+class ChunkState:
+    """
+    Resumable state of one document's streaming split: the tokens not yet covered
+    by a parent, plus the page/row marks and headings they still need. It stays
+    small and picklable, so a PDF's page batches can be chunked by successive
+    worker tasks without any of them seeing the whole text.
+    """
+    def __init__(self, source: str, domain: str):
+        self.source = source
+        self.domain = domain
+        self.tokens: List[int] = []  # Buffered tokens; tokens[0] is token number `base` of the document
+        self.base = 0
+        self.total = 0
+        self.next_parent = 0         # Start of the next parent span
+        self.n_parents = 0
+        self.n_children = 0
+        self.marks = []              # (start, end, location) token ranges of located segments still buffered
+        self.tracker = SectionTracker()
+        self.heading_starts = []     # Token position of each buffered heading, ascending
+        self.headings = []           # (kind, section metadata from that heading on), parallel to heading_starts
+        self.seconds = 0.0
+
+    def release_covered(self):
+        """Drop what lies before `next_parent`; the heading in effect there is kept."""
+        if self.next_parent <= self.base:
+            return
+        del self.tokens[:self.next_parent - self.base]
+        self.base = self.next_parent
+        self.marks = [m for m in self.marks if m[1] > self.base]
+        first = bisect.bisect_right(self.heading_starts, self.base) - 1
+        if first > 0:
+            del self.heading_starts[:first]
+            del self.headings[:first]
+
+    def section_at(self, position: int) -> Dict:
+        idx = bisect.bisect_right(self.heading_starts, position) - 1
+        return dict(self.headings[idx][1]) if idx >= 0 else default_section_metadata()
+
+    def section_metadata(self, start: int, end: int) -> Dict:
+        """Section in effect at the middle of [start, end); a table captioned inside it wins."""
+        meta = self.section_at((start + end) // 2)
+        if not meta["table_number"]:
+            first = bisect.bisect_left(self.heading_starts, start)
+            last = bisect.bisect_left(self.heading_starts, end)
+            for kind, heading_meta in self.headings[first:last]:
+                if kind == TABLE:
+                    meta["table_number"] = heading_meta["table_number"]
+                    break
+        return meta
+
+def location_metadata(marks: List[Tuple[int, int, Dict]], start: int, end: int) -> Dict:
+    """Page / row range covered by the token range [start, end), from the located segments."""
+    meta = {}
+    locs = [loc for s, e, loc in marks if s < end and e > start]
+    pages = [loc["page"] for loc in locs if "page" in loc]
+    if pages:
+        meta["page_start"], meta["page_end"] = min(pages), max(pages)
+    rows = [loc for loc in locs if "row_start" in loc]
+    if rows:
+        meta["row_start"], meta["row_end"] = rows[0]["row_start"], rows[-1]["row_end"]
+    return meta
+
+def make_embedding_provider(client: OpenAI, batch_size: int = 2048,
+                            max_concurrency: int = EMBEDDING_CONCURRENCY) -> OpenAIEmbeddingProvider:
+    return OpenAIEmbeddingProvider(
+        client, EMBEDDING_MODEL, max_concurrency=max_concurrency,
+        max_batch_tokens=EMBEDDING_BATCH_TOKENS, max_batch_items=batch_size,
+        requests_per_minute=EMBEDDING_RPM, tokens_per_minute=EMBEDDING_TPM,
+    )
+
+def get_embeddings_batched(client: OpenAI, texts: List[str], batch_size: int = 2048,
+                           max_concurrency: int = EMBEDDING_CONCURRENCY,
+                           cache: Optional[ContentEmbeddingCache] = None,
+                           provider: Optional[OpenAIEmbeddingProvider] = None) -> List[List[float]]:
+    """
+    Generate embeddings in token-sized batches with up to `max_concurrency` requests
+    in flight, RPM/TPM token buckets, and exponential backoff with jitter on
+    rate-limit/server errors. Results are returned in input order.
+    With a `cache`, previously embedded text and in-batch duplicates skip the API.
+    Pass a shared `provider` to keep its rate limits across calls.
+    """
     total = len(texts)
     print(f"  - Generating embeddings for {total} chunks...")
-    
-    for i in range(0, total, batch_size):
-        batch = texts[i:i + batch_size]
-        attempts = 0
-        while attempts < 3:
+    start = time.perf_counter()
+    if provider is None:
+        provider = make_embedding_provider(client, batch_size, max_concurrency)
+    else:
+        max_concurrency = provider.max_concurrency
+    if cache is None:
+        embeddings = provider.embed(texts)
+    else:
+        before = dict(cache.stats_counts)
+        embeddings = cache.embed(provider.embed, EMBEDDING_MODEL, texts)
+        hits = cache.stats_counts["hits"] - before["hits"]
+        duplicates = cache.stats_counts["duplicates"] - before["duplicates"]
+        print(f"    - Embedding cache: {hits} hits, {duplicates} in-batch duplicates, "
+              f"{cache.stats_counts['misses'] - before['misses']} sent to the API.")
+    print(f"    - Embeddings complete in {time.perf_counter() - start:.1f}s ({max_concurrency} requests in flight).")
+    return embeddings
+
+def chunker_config() -> str:
+    """Chunk indices are only comparable between runs with the same chunking parameters."""
+    sections = f"sections-aligned/{MIN_PARENT_TOKENS}" if ALIGN_PARENTS_TO_SECTIONS else "sections"
+    sections += f"/v{HEADING_RULES_VERSION}"
+    return f"{PARENT_CHUNK_SIZE}/{PARENT_OVERLAP}/{CHILD_CHUNK_SIZE}/{CHILD_OVERLAP}/{sections}"
+
+def manifest_path() -> str:
+    return os.path.join(os.path.dirname(CHROMA_DIR), MANIFEST_FILE)
+
+def load_manifest(path: str) -> Dict:
+    """{collection: {file name: entry}}, or {} before the first ingest."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: unreadable manifest {path} ({e}); starting without it.")
+        return {}
+
+def save_manifest(path: str, manifest: Dict):
+    """Write via temp file + rename so a crash never leaves a half-written manifest."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def entry_matches(entry: Dict, content_hash: str) -> bool:
+    """A manifest entry's chunks are reusable only for the same text, chunking and embedding model."""
+    return (entry["content_hash"] == content_hash and entry["chunker"] == chunker_config()
+            and entry.get("embedding_model", EMBEDDING_MODEL) == EMBEDDING_MODEL)
+
+def entry_complete(entry: Dict) -> bool:
+    """Every chunk of the book is written (total_chunks is None while it is still being ingested)."""
+    return entry.get("total_chunks") is not None and entry["next_chunk"] >= entry["total_chunks"]
+
+def extend_layout(counts: List[int], chunks: List[Dict]):
+    """Compact chunk-id layout: ids are `{source}_p{i}_c{j}` for j < counts[i]. Chunks arrive in id order."""
+    for chunk in chunks:
+        p_idx = chunk["metadata"]["parent_index"]
+        if p_idx == len(counts):
+            counts.append(0)
+        counts[p_idx] += 1
+
+def layout_chunk_ids(source: str, counts: List[int]) -> List[str]:
+    return [f"{source}_p{p_idx}_c{c_idx}" for p_idx, n in enumerate(counts) for c_idx in range(n)]
+
+def delete_book(collection, parent_store: ParentStore, file_name: str, entry: Dict, max_batch: int):
+    """Drop a book's chunks by id (from the manifest layout) and its parent texts."""
+    if "children_per_parent" in entry:
+        ids = layout_chunk_ids(file_name, entry["children_per_parent"])
+        for start in range(0, len(ids), max_batch):
+            collection.delete(ids=ids[start:start + max_batch])
+    else:
+        # Entries written before the layout was recorded
+        collection.delete(where={"source": file_name})
+    parent_store.delete_source(file_name)
+
+def chroma_max_batch_size(chroma_client) -> int:
+    try:
+        return int(chroma_client.get_max_batch_size())
+    except Exception:
+        return DEFAULT_CHROMA_MAX_BATCH
+
+def upsert_in_batches(collection, chunks: List[Dict], embeddings: List[List[float]], max_batch: int):
+    """Write chunks in slices under Chroma's batch limit. Upsert keeps a retried window idempotent."""
+    for start in range(0, len(chunks), max_batch):
+        batch = chunks[start:start + max_batch]
+        collection.upsert(
+            documents=[c["text"] for c in batch],
+            embeddings=embeddings[start:start + max_batch],
+            metadatas=[c["metadata"] for c in batch],
+            ids=[c["id"] for c in batch]
+        )
+
+def relabel_chunks(collection, file_name: str, counts: List[int], domains: List[str], max_batch: int):
+    """Rewrite the domain membership of a book's written chunks; embeddings and documents are untouched."""
+    ids = layout_chunk_ids(file_name, counts)
+    membership = {"domain": ",".join(domains), **membership_metadata(domains, DOMAIN_MAP.keys())}
+    for start in range(0, len(ids), max_batch):
+        written = collection.get(ids=ids[start:start + max_batch], include=["metadatas"])
+        collection.update(ids=written["ids"], metadatas=[{**meta, **membership} for meta in written["metadatas"]])
+
+def scan_domain_books() -> Dict[str, Dict]:
+    """
+    file name -> {"path", "domains"} across every domain folder (.txt, .md, .csv, .pdf).
+    A book present in several folders is one corpus entry tagged with all of them;
+    the first copy found is read.
+    """
+    books = {}
+    for domain, domain_config in DOMAIN_MAP.items():
+        books_dir = os.path.join(BASE_DIR, domain_config["folder"])
+        if not os.path.exists(books_dir):
+            print(f"Warning: Directory not found: {books_dir}")
+            continue
+        for file_path in sorted(glob.glob(os.path.join(books_dir, "*"))):
+            file_name = os.path.basename(file_path)
+            ext = os.path.splitext(file_name)[1].lower()
+            if ext not in SUPPORTED_EXTENSIONS or file_name.startswith('.'):
+                continue
+            if ext == '.pdf' and not PdfReader:
+                print(f"Warning: pypdf is not installed; skipping {file_path}.")
+                continue
+            book = books.setdefault(file_name, {"path": file_path, "domains": []})
+            if book["path"] != file_path and os.path.getsize(book["path"]) != os.path.getsize(file_path):
+                print(f"Warning: {file_path} and {book['path']} are different copies of {file_name}; "
+                      f"only {book['path']} is ingested (for every domain that has it).")
+            book["domains"].append(domain)
+    return books
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
             try:
-                response = client.embeddings.create(input=batch, model=EMBEDDING_MODEL)
-                embeddings = [data.embedding for data in response.data]
-                all_embeddings.extend(embeddings)
-                print(f"    - Processed batch {i}/{total}", end='\r')
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def report_corpus_savings(chroma_client, file_states: Dict):
+    """
+    Compare the unified corpus with the per-domain layout, where each book was
+    chunked, embedded and indexed once per domain folder it sits in.
+    Disk and time are extrapolated from the measured per-chunk averages.
+    """
+    books = [s for s in file_states.values() if s.get("domains") and entry_complete(s)]
+    if not books:
+        return
+    chunks = sum(s["total_chunks"] for s in books)
+    legacy_chunks = sum(s["total_chunks"] * len(s["domains"]) for s in books)
+    tokens = sum(s.get("embedding_tokens", 0) for s in books)
+    legacy_tokens = sum(s.get("embedding_tokens", 0) * len(s["domains"]) for s in books)
+
+    print(f"\n--- Unified corpus vs. one collection per domain ---")
+    print(f"Books: {len(books)} ingested once ({sum(len(s['domains']) for s in books)} domain memberships).")
+    print(f"Chunks indexed: {chunks:,} vs {legacy_chunks:,} ({legacy_chunks - chunks:,} fewer).")
+    cost = (legacy_tokens - tokens) / 1e6 * EMBEDDING_PRICE_PER_M_TOKENS
+    print(f"Embedding tokens: {tokens:,} vs {legacy_tokens:,} (${cost:,.2f} saved at "
+          f"${EMBEDDING_PRICE_PER_M_TOKENS}/1M tokens without the content embedding cache).")
+
+    # Average on-disk bytes per stored chunk across every collection (vectors, HNSW, documents, metadata)
+    stored = 0
+    for col in chroma_client.list_collections():
+        stored += chroma_client.get_collection(getattr(col, "name", col)).count()
+    if stored:
+        parent_db = os.path.join(CHROMA_DIR, PARENT_DB_FILE)
+        shared = os.path.getsize(parent_db) if os.path.exists(parent_db) else 0
+        per_chunk = (directory_size(CHROMA_DIR) - shared) / stored
+        print(f"Disk: ~{chunks * per_chunk / 1e6:,.1f} MB vs ~{legacy_chunks * per_chunk / 1e6:,.1f} MB "
+              f"({per_chunk / 1024:.1f} KB/chunk measured; parent texts are shared either way).")
+
+    timed = [s for s in books if s.get("ingest_seconds")]
+    if timed:
+        per_chunk_seconds = sum(s["ingest_seconds"] for s in timed) / sum(s["total_chunks"] for s in timed)
+        print(f"Ingest time: ~{chunks * per_chunk_seconds / 60:,.1f} min vs ~{legacy_chunks * per_chunk_seconds / 60:,.1f} min "
+              f"({per_chunk_seconds * 1000:.1f} ms/chunk measured).")
+
+@lru_cache(maxsize=None)
+def get_splitter() -> ParentChildSplitter:
+    return ParentChildSplitter()
+
+def extract_pdf_pages(file_path: str, start: int, stop: int) -> Dict:
+    """Extract stage, run in a worker process: text of PDF pages [start, stop)."""
+    started = time.perf_counter()
+    segments = list(read_pdf_pages(file_path, start, stop))
+    return {"segments": segments, "pages": stop - start, "seconds": time.perf_counter() - started}
+
+def chunk_segments(state: ChunkState, segments: List[Tuple[str, Dict]], final: bool) -> Dict:
+    """Chunk stage for one batch of a book's segments, run in a worker process: advances and returns `state`."""
+    start = time.perf_counter()
+    splitter = get_splitter()
+    parents, chunks = splitter.feed_segments(state, segments)
+    if final:
+        last_parents, last_chunks = splitter.finish_chunking(state)
+        parents, chunks = parents + last_parents, chunks + last_chunks
+    return {"state": state, "parents": parents, "chunks": chunks, "seconds": time.perf_counter() - start}
+
+class StageMetrics:
+    """Counters for one pipeline stage; `busy` is time spent working, the rest is waiting on neighbours."""
+    def __init__(self, name: str, workers: int = 1):
+        self.name = name
+        self.workers = workers
+        self.books = 0
+        self.chunks = 0  # PDF pages for the extract stage
+        self.busy = 0.0
+        self.waiting_input = 0.0
+        self.blocked_output = 0.0
+        self.depth_total = 0
+        self.depth_samples = 0
+        self.depth_max = 0
+
+    def sample_depth(self, q: queue.Queue):
+        depth = q.qsize()
+        self.depth_total += depth
+        self.depth_samples += 1
+        self.depth_max = max(self.depth_max, depth)
+
+    def utilization(self, wall: float) -> float:
+        return self.busy / (wall * self.workers) if wall else 0.0
+
+    def row(self, wall: float) -> str:
+        depth = f"{self.depth_total / self.depth_samples:.1f}/{self.depth_max}" if self.depth_samples else "-"
+        rate = f"{self.chunks / self.busy:,.0f}" if self.busy else "-"
+        return (f"{self.name:<7} {self.workers:>7} {self.books:>6} {self.chunks:>8} {self.busy:>8.1f} "
+                f"{self.utilization(wall):>5.0%} {rate:>9} {self.waiting_input:>10.1f} {self.blocked_output:>14.1f} {depth:>17}")
+
+class IngestPipeline:
+    """
+    Streaming ingest. The chunk stage (main thread) skips untouched books and feeds
+    the rest to worker processes a segment batch at a time (PDF page ranges, or
+    ~SEGMENT_BATCH_CHARS of text/CSV), several books at once; one thread embeds
+    each book's chunks in windows as its batches arrive, and one thread writes
+    them to Chroma. Bounded queues between stages give backpressure, so
+    tokenization, embedding requests and Chroma writes overlap while only a few
+    batches are held in memory. Only the writer touches Chroma, the ParentStore and the manifest.
+    """
+    def __init__(self, collection, parent_store: ParentStore, manifest: Dict, manifest_file: str,
+                 client: OpenAI, embedding_cache: Optional[ContentEmbeddingCache], max_batch: int, args):
+        self.collection = collection
+        self.parent_store = parent_store
+        self.manifest = manifest
+        self.manifest_file = manifest_file
+        self.file_states = manifest[collection.name]
+        self.client = client
+        self.embedding_cache = embedding_cache
+        self.max_batch = max_batch
+        self.batch_chunks = args.batch_chunks
+        self.chunk_workers = args.chunk_workers
+        self.metrics_interval = args.metrics_interval
+        self.provider = make_embedding_provider(client, max_concurrency=args.concurrency)
+        self.chunk_q = queue.Queue(maxsize=args.queue_size)
+        self.write_q = queue.Queue(maxsize=args.queue_size)
+        self.failed = set()
+        # Tokens of the books chunked completely; with the chunk stage's busy time, the cumulative throughput
+        self.chunked_tokens = 0
+        self.finished = threading.Event()
+        self.pool = None
+        self.metrics = {
+            # Extract and chunk tasks share the worker pool
+            "extract": StageMetrics("extract", max(1, args.chunk_workers)),
+            "chunk": StageMetrics("chunk", max(1, args.chunk_workers)),
+            "embed": StageMetrics("embed"),
+            "write": StageMetrics("write"),
+        }
+        self.wall = 0.0
+
+    def run(self, books: Dict[str, Dict]):
+        start = time.perf_counter()
+        stages = [threading.Thread(target=self.embed_stage, daemon=True),
+                  threading.Thread(target=self.write_stage, daemon=True)]
+        monitor = threading.Thread(target=self.monitor, daemon=True)
+        for thread in stages + [monitor]:
+            thread.start()
+        # Workers are spawned, not forked: this process already runs Chroma's and the pipeline's threads.
+        # chunk_workers=0 chunks in-process (one thread) instead
+        if self.chunk_workers > 0:
+            pool = ProcessPoolExecutor(self.chunk_workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            pool = ThreadPoolExecutor(1)
+        self.pool = pool
+        with pool:
+            try:
+                self.chunk_stage(books)
+            finally:
+                self.put(self.chunk_q, None, self.metrics["chunk"])
+                for thread in stages:
+                    thread.join()
+        self.finished.set()
+        monitor.join()
+        self.wall = time.perf_counter() - start
+
+    def put(self, q: queue.Queue, item, metrics: StageMetrics):
+        start = time.perf_counter()
+        q.put(item)
+        metrics.blocked_output += time.perf_counter() - start
+
+    def fail(self, file_name: str, error: Exception):
+        self.failed.add(file_name)
+        print(f"Error processing {file_name}: {error}")
+        print(f"  - Progress is saved in the manifest; re-run to resume {file_name}.")
+
+    def chunk_stage(self, books: Dict[str, Dict]):
+        """
+        Keep up to BOOKS_PER_WORKER books per worker in flight. Each book is a chain
+        of chunk tasks (each continues from the ChunkState the previous one returned);
+        a finished batch goes to the embed stage at once, whichever book it belongs to.
+        """
+        todo = iter(books.items())
+        active = []
+        while True:
+            while len(active) < BOOKS_PER_WORKER * max(1, self.chunk_workers):
+                job = self.plan_next(todo)
+                if job is None:
+                    break
+                self.put(self.chunk_q, ("begin", job["ctx"]), self.metrics["chunk"])
+                if job["ctx"]["action"] == "ingest" and not self.advance(job):
+                    active.append(job)
+            if not active:
+                return
+            wait([self.pending_future(job) for job in active], return_when=FIRST_COMPLETED)
+            active = [job for job in active if not self.advance(job)]
+
+    def plan_next(self, todo) -> Optional[Dict]:
+        """The next book that needs work, with its planned action; untouched books are skipped on the manifest alone."""
+        for file_name, book in todo:
+            domains = book["domains"]
+            state = self.file_states.get(file_name)
+            try:
+                file_stat = os.stat(book["path"])
+                if (state and entry_complete(state) and state.get("domains") == domains
+                        and state.get("size") == file_stat.st_size and state.get("mtime_ns") == file_stat.st_mtime_ns
+                        and entry_matches(state, state["content_hash"])):
+                    print(f"Skipping {file_name} (already indexed for {', '.join(domains)}).")
+                    continue
+                ctx = {"file_name": file_name, "domains": domains, "file_stat": file_stat,
+                       "content_hash": file_sha256(book["path"]), "resume_from": 0, "replace": False, "action": "ingest"}
+                if state and entry_matches(state, ctx["content_hash"]):
+                    if entry_complete(state):
+                        # Touched but identical: refresh the stat, or only the domain flags
+                        ctx["action"] = "refresh" if state.get("domains") == domains else "relabel"
+                        return {"ctx": ctx}
+                    ctx["resume_from"] = state["next_chunk"]
+                elif state:
+                    ctx["replace"] = True
+                job = {"ctx": ctx, "path": book["path"], "state": ChunkState(file_name, ",".join(domains)),
+                       "chunk_future": None, "final": False}
+                if book["path"].lower().endswith('.pdf'):
+                    job.update(pages=pdf_page_count(book["path"]), next_page=0, page_futures=deque())
+                    for _ in range(PDF_PAGE_TASKS_AHEAD):
+                        self.submit_page_task(job)
+                else:
+                    job["segments"] = read_segments(book["path"])
+            except Exception as e:
+                print(f"Error processing {file_name}: {e}")
+                continue
+            return job
+        return None
+
+    def submit_page_task(self, job: Dict):
+        """Queue extraction of the PDF's next PDF_PAGES_PER_TASK pages, if any are left."""
+        start = job["next_page"]
+        if start < job["pages"]:
+            stop = min(start + PDF_PAGES_PER_TASK, job["pages"])
+            job["page_futures"].append(self.pool.submit(extract_pdf_pages, job["path"], start, stop))
+            job["next_page"] = stop
+
+    def pending_future(self, job: Dict):
+        """What an active book is waiting on: its running chunk task, else its next page range."""
+        return job["chunk_future"] or job["page_futures"][0]
+
+    def next_batch(self, job: Dict) -> Optional[Tuple[List[Tuple[str, Dict]], bool]]:
+        """(segments, last batch) for the book's next chunk task; None while its next pages are being extracted."""
+        if "page_futures" in job:
+            if not job["page_futures"]:
+                return [], True
+            if not job["page_futures"][0].done():
+                return None
+            part = job["page_futures"].popleft().result()
+            self.submit_page_task(job)
+            extract_metrics = self.metrics["extract"]
+            extract_metrics.chunks += part["pages"]
+            extract_metrics.busy += part["seconds"]
+            if not job["page_futures"]:
+                extract_metrics.books += 1
+            return part["segments"], not job["page_futures"]
+        # Text and CSV segments are read here, one batch ahead of the chunk task
+        batch, size = [], 0
+        segment = job.pop("peeked", None) or next(job["segments"], None)
+        while segment is not None:
+            batch.append(segment)
+            size += len(segment[0])
+            segment = next(job["segments"], None)
+            if size >= SEGMENT_BATCH_CHARS:
+                break
+        job["peeked"] = segment
+        return batch, segment is None
+
+    def advance(self, job: Dict) -> bool:
+        """Move a book's chunk chain on as far as its finished tasks allow. True once the book is done."""
+        ctx, chunk_metrics = job["ctx"], self.metrics["chunk"]
+        try:
+            while True:
+                future = job["chunk_future"]
+                if future is not None:
+                    if not future.done():
+                        return False
+                    job["chunk_future"] = None
+                    result = future.result()
+                    job["state"] = result["state"]
+                    chunk_metrics.chunks += len(result["chunks"])
+                    chunk_metrics.busy += result["seconds"]
+                    self.put(self.chunk_q, ("batch", ctx, result["parents"], result["chunks"], result["seconds"]), chunk_metrics)
+                    if job["final"]:
+                        chunk_metrics.books += 1
+                        self.chunked_tokens += job["state"].total
+                        self.put(self.chunk_q, ("end", ctx), chunk_metrics)
+                        return True
+                batch = self.next_batch(job)
+                if batch is None:
+                    return False
+                segments, job["final"] = batch
+                job["chunk_future"] = self.pool.submit(chunk_segments, job["state"], segments, job["final"])
+        except Exception as e:
+            self.fail(ctx["file_name"], e)
+            self.put(self.chunk_q, ("end", ctx), chunk_metrics)
+            return True
+
+    def embed_stage(self):
+        """Collect each book's chunks into windows of batch_chunks and embed them; books may interleave."""
+        books = {}
+        metrics = self.metrics["embed"]
+        while True:
+            start = time.perf_counter()
+            message = self.chunk_q.get()
+            metrics.waiting_input += time.perf_counter() - start
+            if message is None:
                 break
+            kind, ctx = message[0], message[1]
+            file_name = ctx["file_name"]
+            if file_name in self.failed:
+                books.pop(file_name, None)
+                continue
+            try:
+                if kind == "begin":
+                    self.put(self.write_q, ("begin", ctx), metrics)
+                    if ctx["action"] == "ingest":
+                        metrics.books += 1
+                        books[file_name] = {"next": ctx["resume_from"], "seen": 0, "tokens": 0, "seconds": 0.0,
+                                            "parents": [], "chunks": []}
+                    continue
+                book = books[file_name]
+                if kind == "batch":
+                    _, _, parents, chunks, seconds = message
+                    flags = membership_metadata(ctx["domains"], DOMAIN_MAP.keys())
+                    for chunk in chunks:
+                        chunk["metadata"].update(flags)
+                    # Chunks before resume_from are already written (a resumed book is re-chunked from the start)
+                    skip = max(0, ctx["resume_from"] - book["seen"])
+                    book["seen"] += len(chunks)
+                    book["tokens"] += sum(c["tokens"] for c in chunks)
+                    book["seconds"] += seconds
+                    book["parents"].extend(parents)
+                    book["chunks"].extend(chunks[skip:])
+                    while len(book["chunks"]) >= self.batch_chunks:
+                        self.embed_window(ctx, book)
+                else:
+                    del books[file_name]
+                    while book["chunks"]:
+                        self.embed_window(ctx, book)
+                    self.put(self.write_q, ("end", ctx, book["seen"], book["tokens"], book["seconds"]), metrics)
             except Exception as e:
-                print(f"    - Error batch {i}: {e}. Retrying in 5s...")
-                time.sleep(5)
-                attempts += 1
+                # Never let one book stop the stage: the writer and chunk stage would wait forever
+                books.pop(file_name, None)
+                self.fail(file_name, e)
+        self.write_q.put(None)
+
+    def embed_window(self, ctx: Dict, book: Dict):
+        """Embed the book's next batch_chunks chunks and hand them, with the parents they need, to the writer."""
+        metrics = self.metrics["embed"]
+        window = book["chunks"][:self.batch_chunks]
+        del book["chunks"][:self.batch_chunks]
+        parents, book["parents"] = book["parents"], []
+        window_start = book["next"]
+        book["next"] += len(window)
+        start = time.perf_counter()
+        embeddings = get_embeddings_batched(self.client, [c["text"] for c in window],
+                                            cache=self.embedding_cache, provider=self.provider)
+        seconds = time.perf_counter() - start
+        metrics.busy += seconds
+        metrics.chunks += len(window)
+        self.put(self.write_q, ("window", ctx, window_start, window, parents, embeddings, seconds), metrics)
+
+    def write_stage(self):
+        metrics = self.metrics["write"]
+        while True:
+            start = time.perf_counter()
+            message = self.write_q.get()
+            metrics.waiting_input += time.perf_counter() - start
+            if message is None:
+                break
+            kind, ctx = message[0], message[1]
+            file_name = ctx["file_name"]
+            if file_name in self.failed:
+                continue
+            start = time.perf_counter()
+            try:
+                if kind == "begin":
+                    if self.begin_book(ctx):
+                        metrics.books += 1
+                elif kind == "window":
+                    _, _, window_start, window, parents, embeddings, embed_seconds = message
+                    # Parents first, so a child is never visible without its parent
+                    if parents:
+                        self.parent_store.put_many((p["id"], file_name, p["text"]) for p in parents)
+                    upsert_in_batches(self.collection, window, embeddings, self.max_batch)
+                    state = self.file_states[file_name]
+                    state["next_chunk"] = window_start + len(window)
+                    extend_layout(state["children_per_parent"], window)
+                    state["ingest_seconds"] += embed_seconds + time.perf_counter() - start
+                    save_manifest(self.manifest_file, self.manifest)
+                    metrics.chunks += len(window)
+                    print(f"  - Wrote chunks {window_start}-{state['next_chunk'] - 1} of {file_name} to ChromaDB.")
+                else:
+                    _, _, total, tokens, chunk_seconds = message
+                    self.finish_book(file_name, total, tokens, chunk_seconds)
+            except Exception as e:
+                self.fail(file_name, e)
+            metrics.busy += time.perf_counter() - start
+
+    def begin_book(self, ctx: Dict) -> bool:
+        """Apply the planned refresh/relabel/replace and open the book's manifest entry. True if chunks follow."""
+        file_name, domains, file_stat = ctx["file_name"], ctx["domains"], ctx["file_stat"]
+        state = self.file_states.get(file_name)
+        if ctx["action"] != "ingest":
+            if ctx["action"] == "relabel":
+                # Membership changed: relabel what is already written, no re-embedding
+                print(f"Updating domains of {file_name} to {', '.join(domains)}...")
+                relabel_chunks(self.collection, file_name, state["children_per_parent"], domains, self.max_batch)
+                state["domains"] = domains
+            else:
+                print(f"Skipping {file_name} (already indexed for {', '.join(domains)}).")
+            # Refresh the stat so the next run skips without reading
+            state["size"], state["mtime_ns"] = file_stat.st_size, file_stat.st_mtime_ns
+            save_manifest(self.manifest_file, self.manifest)
+            return False
+        if ctx["replace"]:
+            previous = self.file_states.pop(file_name)
+            partial = "" if entry_complete(previous) else " (partial)"
+            print(f"{file_name} changed since its last{partial} ingest; replacing its chunks.")
+            delete_book(self.collection, self.parent_store, file_name, previous, self.max_batch)
+            save_manifest(self.manifest_file, self.manifest)
+            state = None
+
+        resume_from = ctx["resume_from"]
+        print(f"Processing {file_name} [{', '.join(domains)}]..." + (f" (resuming at chunk {resume_from})" if resume_from else ""))
+        if resume_from and state.get("domains") != domains:
+            relabel_chunks(self.collection, file_name, state["children_per_parent"], domains, self.max_batch)
+            print(f"  - Updated domains of {resume_from} written chunks to {', '.join(domains)}.")
+        self.file_states[file_name] = {
+            "content_hash": ctx["content_hash"], "size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns,
+            "chunker": chunker_config(), "embedding_model": EMBEDDING_MODEL,
+            "children_per_parent": list(state["children_per_parent"]) if resume_from else [],
+            "total_chunks": None, "next_chunk": resume_from, "domains": domains, "embedding_tokens": 0,
+            "ingest_seconds": state.get("ingest_seconds", 0.0) if resume_from else 0.0,
+        }
+        save_manifest(self.manifest_file, self.manifest)
+        return True
+
+    def finish_book(self, file_name: str, total: int, tokens: int, chunk_seconds: float):
+        """Close the book's manifest entry once every window is written."""
+        state = self.file_states[file_name]
+        if not total:
+            print(f"  - No chunks generated for {file_name}.")
+            self.file_states.pop(file_name)
         else:
-             print(f"    - Failed batch {i} after retries.")
-             # Fill with empty or raise error? For now, raise to stop inconsistent state
-             raise Exception("Embedding generation failed.")
-             
-    print(f"    - Embeddings complete.             ")
-    return all_embeddings
+            state["total_chunks"] = total
+            state["embedding_tokens"] = tokens
+            state["ingest_seconds"] += chunk_seconds
+        save_manifest(self.manifest_file, self.manifest)
+
+    def monitor(self):
+        """Sample queue depths for the metrics table and print a progress line every `metrics_interval`."""
+        start = last_report = time.perf_counter()
+        while not self.finished.wait(0.2):
+            self.metrics["embed"].sample_depth(self.chunk_q)
+            self.metrics["write"].sample_depth(self.write_q)
+            now = time.perf_counter()
+            if self.metrics_interval and now - last_report >= self.metrics_interval:
+                last_report = now
+                chunk, embed, write = (self.metrics[n] for n in ("chunk", "embed", "write"))
+                print(f"[pipeline {now - start:.0f}s] chunked {chunk.books} books ({chunk.chunks:,} chunks) | "
+                      f"embedded {embed.chunks:,} | written {write.chunks:,} | queues: "
+                      f"chunk->embed {self.chunk_q.qsize()}/{self.chunk_q.maxsize}, "
+                      f"embed->write {self.write_q.qsize()}/{self.write_q.maxsize}")
+
+    def print_metrics(self):
+        print(f"\n--- Pipeline metrics ({self.wall:.1f}s wall) ---")
+        print(f"{'stage':<7} {'workers':>7} {'books':>6} {'chunks':>8} {'busy s':>8} {'util':>5} {'chunks/s':>9} "
+              f"{'wait in s':>10} {'blocked out s':>14} {'in-queue avg/max':>17}")
+        for metrics in self.metrics.values():
+            if metrics.name == "extract" and not metrics.books:
+                continue
+            print(metrics.row(self.wall))
+        if self.metrics["extract"].books:
+            print("(extract counts PDF pages in the chunks columns)")
+        chunk_seconds = self.metrics["chunk"].busy
+        if self.chunked_tokens and chunk_seconds:
+            print(f"Chunking: {self.chunked_tokens:,} tokens in {chunk_seconds:.1f}s of worker time "
+                  f"({self.chunked_tokens / chunk_seconds:,.0f} tokens/s).")
+        if any(m.busy for m in self.metrics.values()):
+            bottleneck = max(self.metrics.values(), key=lambda m: m.utilization(self.wall))
+            print(f"Bottleneck: {bottleneck.name} ({bottleneck.utilization(self.wall):.0%} busy per worker).")
 
 def main():
-    parser = argparse.ArgumentParser(description="Ingest books into ChromaDB.")
-    parser.add_argument("--domain", choices=DOMAIN_MAP.keys(), required=True, help="Domain to ingest (healthcare, code, military)")
-    parser.add_argument("--reset", action="store_true", help="Delete existing collection and re-ingest")
+    parser = argparse.ArgumentParser(description="Ingest books from every domain folder into one ChromaDB corpus.")
+    parser.add_argument("--domain", choices=DOMAIN_MAP.keys(), help="Only (re)ingest books from this domain's folder")
+    parser.add_argument("--reset", action="store_true", help="Delete the corpus collection and re-ingest")
+    parser.add_argument("--concurrency", type=int, default=EMBEDDING_CONCURRENCY, help="Embedding requests in flight")
+    parser.add_argument("--batch-chunks", type=int, default=INGEST_BATCH_CHUNKS, help="Chunks embedded and written per manifest save")
+    parser.add_argument("--no-embedding-cache", action="store_true", help="Always call the API, ignoring cached chunk embeddings")
+    parser.add_argument("--chunk-workers", type=int, default=CHUNK_WORKERS, help="Tokenizer processes (0 = chunk in-process)")
+    parser.add_argument("--queue-size", type=int, default=PIPELINE_QUEUE_SIZE, help="Capacity of each queue between pipeline stages")
+    parser.add_argument("--metrics-interval", type=float, default=METRICS_INTERVAL, help="Seconds between pipeline progress lines (0 disables)")
+    parser.add_argument("--report", action="store_true", help="Only print the savings report for the existing corpus")
     args = parser.parse_args()
 
-    domain_config = DOMAIN_MAP[args.domain]
-    folder_name = domain_config["folder"]
-    collection_name = domain_config["collection"]
-    
-    books_dir = os.path.join(BASE_DIR, folder_name)
-
-    load_environment()
-    
-    # 1. Initialize Clients
-    client = OpenAI()
-    splitter = ParentChildSplitter()
+    collection_name = CORPUS_COLLECTION
     
     print(f"Initializing ChromaDB at {CHROMA_DIR}...")
     if not os.path.exists(CHROMA_DIR):
         os.makedirs(CHROMA_DIR)
         
     chroma_client = chromadb.PersistentClient(path=CHROMA_DIR)
+    manifest_file = manifest_path()
+    manifest = load_manifest(manifest_file)
+    if args.report:
+        report_corpus_savings(chroma_client, manifest.get(collection_name, {}))
+        return
+
+    load_environment()
+    
+    # 1. Initialize Clients
+    client = OpenAI()
+    # Parent texts live here, not in child metadata
+    parent_store = ParentStore(os.path.join(CHROMA_DIR, PARENT_DB_FILE))
+    max_batch = chroma_max_batch_size(chroma_client)
+    # Survives --reset
+    embedding_cache = None if args.no_embedding_cache else ContentEmbeddingCache()
     
     # Check if collection exists options
     if args.reset:
         try:
-            print(f"[{args.domain.upper()}] Resetting collection '{collection_name}'...")
+            print(f"Resetting collection '{collection_name}'...")
             chroma_client.delete_collection(collection_name)
         except Exception as e:
             print(f"Collection delete skipped: {e}")
+        # Their parents too: re-ingest reuses the same parent ids
+        for file_name in manifest.get(collection_name, {}):
+            parent_store.delete_source(file_name)
+        manifest.pop(collection_name, None)
+        save_manifest(manifest_file, manifest)
+    file_states = manifest.setdefault(collection_name, {})
             
     try:
         collection = chroma_client.get_collection(name=collection_name)
-        print(f"[{args.domain.upper()}] Found existing collection '{collection_name}' with {collection.count()} items.")
+        print(f"Found existing collection '{collection_name}' with {collection.count()} items.")
     except:
-        print(f"[{args.domain.upper()}] Creating new collection '{collection_name}'...")
+        print(f"Creating new collection '{collection_name}'...")
         collection = chroma_client.create_collection(name=collection_name)
+        if file_states:
+            # The manifest outlived the database (e.g. CHROMA_DIR was deleted)
+            print(f"Ignoring {len(file_states)} manifest entries for the missing collection.")
+            for file_name in file_states:
+                parent_store.delete_source(file_name)
+            file_states.clear()
+            save_manifest(manifest_file, manifest)
 
-    # 2. Read Files
-    if not os.path.exists(books_dir):
-        print(f"Error: Directory not found: {books_dir}")
-        return
+    # 2. Find books and the domains each belongs to (always across every folder)
+    books = scan_domain_books()
+    for file_name in [f for f, s in file_states.items() if f not in books]:
+        print(f"Removing {file_name} (no longer in any domain folder).")
+        delete_book(collection, parent_store, file_name, file_states.pop(file_name), max_batch)
+        save_manifest(manifest_file, manifest)
 
-    txt_files = glob.glob(os.path.join(books_dir, "*.txt"))
-    if not txt_files:
-        print(f"No .txt files found in {folder_name}/.")
+    if args.domain:
+        # Also revisit books that just left this domain's folder, to clear their flag
+        books = {f: b for f, b in books.items()
+                 if args.domain in b["domains"] or args.domain in file_states.get(f, {}).get("domains", [])}
+    if not books:
+        print("No supported documents (.txt, .md, .csv, .pdf) found in the domain folders.")
         return
 
-    # 3. Process Each File
-    for file_path in txt_files:
-        file_name = os.path.basename(file_path)
-        
-        # Check if file already ingested (naive check by source metadata)
-        # Ideally we query specific metadata, but Chroma simple query is by embeddings or get by ids.
-        # We can do a get with where filter.
-        existing_count = collection.count()
-        if existing_count > 0:
-            results = collection.get(where={"source": file_name}, limit=1)
-            if results["ids"]:
-                print(f"Skipping {file_name} (already indexed).")
-                continue
-        
-        print(f"Processing {file_name}...")
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 4. Generate Chunks
-            chunks = splitter.create_parent_child_chunks(content, file_name, args.domain)
-            if not chunks:
-                print(f"  - No chunks generated for {file_name}.")
-                continue
-                
-            # 5. Generate Embeddings & Add to DB
-            texts = [c["text"] for c in chunks]
-            ids = [c["id"] for c in chunks]
-            metadatas = [c["metadata"] for c in chunks]
-            
-            embeddings = get_embeddings_batched(client, texts)
-            
-            # Add to Chroma in batches to be safe? Chroma handles it, but 40k max size usually.
-            # We are doing per book, usually < 5000 chunks.
-            
-            collection.add(
-                documents=texts,
-                embeddings=embeddings,
-                metadatas=metadatas,
-                ids=ids
-            )
-            print(f"  - Added {len(chunks)} chunks to ChromaDB.")
-            
-        except Exception as e:
-            print(f"Error processing {file_name}: {e}")
+    # 3. Read, chunk, embed and write as overlapping pipeline stages
+    pipeline = IngestPipeline(collection, parent_store, manifest, manifest_file, client,
+                              embedding_cache, max_batch, args)
+    pipeline.run(books)
 
     print("\nIngestion Complete.")
+    pipeline.print_metrics()
+    if embedding_cache is not None:
+        print(f"Embedding cache: {embedding_cache.stats()}")
     print(f"Total Collection Size: {collection.count()} chunks.")
+    report_corpus_savings(chroma_client, file_states)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,27 @@
+import os
+import sys
+import argparse
+
+# Add root dir to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from app.rag_core.index_store import migrate_pickle
+from app.rag_core.rag_engine import CACHE_DIR
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate the legacy rag_cache.pkl to the memory-mapped columnar index.")
+    parser.add_argument("--pkl", default=os.path.join(CACHE_DIR, "rag_cache.pkl"), help="Path to the legacy pickle cache")
+    parser.add_argument("--out", default=None, help="Output index directory (default: next to the pickle)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.pkl):
+        print(f"Error: Pickle cache not found: {args.pkl}")
+        return
+
+    out_dir = args.out or os.path.splitext(args.pkl)[0]
+    store = migrate_pickle(args.pkl, out_dir)
+    store.load()
+    print(f"Index ready at {out_dir} ({len(store)} rows, dim {store.dim}).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import argparse
+
+# Add root dir to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from tools.admin.ingest_books import (
+    ParentChildSplitter, PARENT_CHUNK_SIZE, CHILD_CHUNK_SIZE, CHILD_OVERLAP, PARENT_OVERLAP
+)
+
+PAGE = (
+    "220.12 Lighting Load for Non-Dwelling Occupancies. A unit load of not less than that specified in "
+    "Table 220.12 for non-dwelling occupancies shall constitute the minimum lighting load. The floor area "
+    "for each floor shall be calculated from the outside dimensions of the building. The demand factor "
+    "shall be applied per 220.42.\n| Type of Occupancy | VA per m2 | VA per ft2 |\n| Office | 14 | 1.3 |\n"
+) * 6
+
+def legacy_chunks(splitter, text: str):
+    """The previous algorithm: decode each parent, re-encode it to cut children, scan every span twice."""
+    chunks = []
+    for p_idx, parent_text in enumerate(splitter.split_text(text, PARENT_CHUNK_SIZE, overlap=PARENT_OVERLAP)):
+        splitter.extract_metadata(parent_text, "bench.txt")
+        for c_idx, child_text in enumerate(splitter.split_text(parent_text, CHILD_CHUNK_SIZE, overlap=CHILD_OVERLAP)):
+            splitter.extract_metadata(child_text, "bench.txt")
+            chunks.append(child_text)
+    return chunks
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description="ParentChildSplitter throughput on a synthetic code book.")
+    parser.add_argument("--pages", type=int, default=1000)
+    args = parser.parse_args()
+
+    text = "\n".join(f"Page {i}\n{PAGE}" for i in range(args.pages))
+    splitter = ParentChildSplitter(align_sections=False)
+    n_tokens = splitter.count_tokens(text)
+    print(f"--- Chunking Benchmark: {args.pages} pages, {len(text):,} chars, {n_tokens:,} tokens ---")
+
+    start = time.perf_counter()
+    old = legacy_chunks(splitter, text)
+    old_seconds = time.perf_counter() - start
+
+    # Same fixed-size parents as the legacy algorithm, then parents aligned to section breaks
+    start = time.perf_counter()
+    _, new = splitter.create_parent_child_chunks(text, "bench.txt", "code")
+    new_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, aligned = ParentChildSplitter(align_sections=True).create_parent_child_chunks(text, "bench.txt", "code")
+    aligned_seconds = time.perf_counter() - start
+
+    print(f"Legacy (encode, decode, re-encode): {old_seconds:.2f}s ({n_tokens / old_seconds:,.0f} tokens/s), {len(old)} children")
+    print(f"Single pass, fixed-size parents:    {new_seconds:.2f}s ({n_tokens / new_seconds:,.0f} tokens/s), {len(new)} children")
+    print(f"Single pass, section-aligned:       {aligned_seconds:.2f}s ({n_tokens / aligned_seconds:,.0f} tokens/s), {len(aligned)} children")
+
+if __name__ == "__main__":
+    run_benchmark()
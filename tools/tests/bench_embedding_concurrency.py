@@ -0,0 +1,43 @@
+import os
+import sys
+import time
+import argparse
+
+# Add root dir to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from app.rag_core.embedding_providers import HashingEmbeddingProvider
+
+class SimulatedLatencyProvider(HashingEmbeddingProvider):
+    """Offline provider with a fixed per-request latency, mimicking a remote API round trip."""
+    def __init__(self, latency: float, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+
+    def _embed_batch(self, texts):
+        time.sleep(self.latency)
+        return super()._embed_batch(texts)
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description="Embedding throughput vs request concurrency (offline).")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--batch-items", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated seconds per request")
+    args = parser.parse_args()
+
+    texts = [f"chunk {i}: grounding conductor sizing per article {i % 900} " * 30 for i in range(args.chunks)]
+    print(f"--- Embedding Concurrency Benchmark: {args.chunks} chunks, "
+          f"{args.batch_items} per request, {args.latency}s latency ---")
+    print(f"{'concurrency':>12} {'seconds':>9} {'chunks/s':>10}")
+    baseline = None
+    for concurrency in (1, 2, 4, 8):
+        provider = SimulatedLatencyProvider(args.latency, max_concurrency=concurrency, max_batch_items=args.batch_items)
+        start = time.perf_counter()
+        embeddings = provider.embed(texts)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or embeddings
+        assert embeddings == baseline, "Output must not depend on concurrency"
+        print(f"{concurrency:>12} {elapsed:>9.2f} {args.chunks / elapsed:>10.0f}")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import tracemalloc
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+# Add root dir to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from app.rag_core.index_store import IndexStore, normalize_rows
+
+def make_corpus(n_rows: int, dim: int, n_topics: int, seed: int = 0):
+    """Clustered synthetic embeddings, so nearest neighbours are meaningful (like real chunks)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_topics, dim)).astype('float32')
+    labels = rng.integers(0, n_topics, n_rows)
+    corpus = centers[labels] + 0.8 * rng.standard_normal((n_rows, dim)).astype('float32')
+    return normalize_rows(corpus), rng
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+def peak_query_bytes(store: IndexStore, query: np.ndarray, k: int, **kwargs) -> int:
+    """Peak Python/NumPy allocation of one single-query search (the quantized matrix itself excluded)."""
+    tracemalloc.start()
+    try:
+        store.top_k(query[None, :], k, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description="Recall vs memory for float32 / float16 / int8 RAGEngine scoring.")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"--- Quantization Benchmark: {args.rows} rows x {args.dim} dims, {args.queries} queries, k={args.k} ---")
+    corpus, rng = make_corpus(args.rows, args.dim, n_topics=max(10, args.rows // 200))
+    queries = normalize_rows(corpus[rng.integers(0, args.rows, args.queries)]
+                             + 0.5 * rng.standard_normal((args.queries, args.dim)).astype('float32'))
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        store = IndexStore(os.path.join(tmp_dir, "bench"), dim=args.dim)
+        store.append(corpus, [{"text": "", "source": "bench", "path": "bench"}] * args.rows)
+        store.compact()
+        del corpus
+
+        start = time.perf_counter()
+        truth, _ = store.top_k(queries, args.k)
+        base_ms = (time.perf_counter() - start) * 1000 / args.queries
+        float32_bytes = args.rows * args.dim * 4
+        base_peak = peak_query_bytes(store, queries[0], args.k)
+
+        print(f"{'mode':<10}{'rescore':>9}{'RAM (MB)':>11}{'vs f32':>9}{'peak/query (MB)':>17}{'recall@k':>11}{'ms/query':>11}")
+        print(f"{'float32':<10}{'-':>9}{float32_bytes / 1e6:>11.1f}{1.0:>9.2f}{base_peak / 1e6:>17.1f}{1.0:>11.3f}{base_ms:>11.2f}")
+        for mode in ("float16", "int8"):
+            store.enable_quantization(mode)
+            for factor in (1, 4):
+                start = time.perf_counter()
+                found, _ = store.top_k(queries, args.k, rescore_factor=factor)
+                ms = (time.perf_counter() - start) * 1000 / args.queries
+                ram = store.quantized.nbytes
+                peak = peak_query_bytes(store, queries[0], args.k, rescore_factor=factor)
+                print(f"{mode:<10}{factor:>8}x{ram / 1e6:>11.1f}{ram / float32_bytes:>9.2f}{peak / 1e6:>17.1f}"
+                      f"{recall_at_k(found, truth):>11.3f}{ms:>11.2f}")
+        print("\nRAM = resident scoring matrix. float32 rows for rescoring are read lazily from the mmap.")
+        print("peak/query = extra memory allocated while answering one query (tracemalloc).")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+# Add root dir to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from app.rag_core.rag_chat import ChatIndex, top_k_chunks
+
+def loop_retrieve(query_vec, items, k):
+    """The previous rag_chat.retrieve: per-item array + cosine, then a full sort."""
+    scored = []
+    for item in items:
+        item_vec = np.array(item["embedding"])
+        score = np.dot(query_vec, item_vec) / (np.linalg.norm(query_vec) * np.linalg.norm(item_vec))
+        scored.append((score, item))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return scored[:k]
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description="Per-query latency of rag_chat retrieval: Python loop vs matrix.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 10000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=5)
+    parser.add_argument("--k", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"--- rag_chat Retrieval Benchmark: dim={args.dim}, k={args.k}, {args.queries} queries per size ---")
+    print(f"{'chunks':>8} {'loop ms':>10} {'matrix ms':>10} {'speedup':>9} {'load s':>8}")
+    for n in args.sizes:
+        # Pickled cache format: embeddings are plain lists of floats
+        items = [{"text": f"chunk {i}", "source": "bench.txt", "embedding": row.tolist()}
+                 for i, row in enumerate(rng.standard_normal((n, args.dim)).astype('float32'))]
+        queries = rng.standard_normal((args.queries, args.dim)).astype('float32')
+
+        start = time.perf_counter()
+        index = ChatIndex(items)
+        load_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = [loop_retrieve(q, items, args.k) for q in queries]
+        loop_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+        start = time.perf_counter()
+        found = [top_k_chunks(q, index, args.k) for q in queries]
+        matrix_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+        for old, new in zip(expected, found):
+            assert [c["text"] for _, c in old] == [c["text"] for _, c in new], "Rankings differ"
+        print(f"{n:>8} {loop_ms:>10.2f} {matrix_ms:>10.2f} {loop_ms / matrix_ms:>8.0f}x {load_seconds:>8.2f}")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,64 @@
+import unittest
+import os
+import sys
+import time
+import tempfile
+import shutil
+
+# Ensure imports work (Add root)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from app.rag_core.answer_cache import AnswerCache, answer_key
+
+CHUNKS = [
+    {"text": "Receptacles shall be installed...", "source": "NEC.pdf", "path": "/books/NEC.pdf"},
+    {"text": "Pump curves for...", "source": "Pumps.pdf", "path": "/books/Pumps.pdf"},
+]
+
+class TestAnswerCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "answers.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_key_depends_on_context(self):
+        key = answer_key("gpt", 1, "How many receptacles?", CHUNKS)
+        self.assertEqual(key, answer_key("gpt", 1, "  how many RECEPTACLES? ", CHUNKS))
+        self.assertNotEqual(key, answer_key("gpt", 1, "How many receptacles?", CHUNKS[::-1]))
+        self.assertNotEqual(key, answer_key("gpt", 2, "How many receptacles?", CHUNKS))
+        self.assertNotEqual(key, answer_key("other", 1, "How many receptacles?", CHUNKS))
+        edited = [dict(CHUNKS[0], text="Receptacles shall not be installed..."), CHUNKS[1]]
+        self.assertNotEqual(key, answer_key("gpt", 1, "How many receptacles?", edited))
+
+    def test_persist_invalidate_and_stats(self):
+        cache = AnswerCache(self.db_path)
+        key = answer_key("gpt", 1, "q", CHUNKS)
+        self.assertIsNone(cache.get(key))
+        cache.put(key, "6 receptacles", CHUNKS)
+
+        reopened = AnswerCache(self.db_path)
+        self.assertEqual(reopened.get(key), "6 receptacles")
+        self.assertEqual(reopened.stats()["hit_rate"], 1.0)
+
+        self.assertEqual(reopened.invalidate_paths(["/books/Other.pdf"]), 0)
+        self.assertEqual(reopened.invalidate_paths(["/books/Pumps.pdf"]), 1)
+        self.assertIsNone(reopened.get(key))
+        self.assertEqual(reopened.stats()["items"], 0)
+
+    def test_ttl_and_lru(self):
+        cache = AnswerCache(self.db_path, ttl_seconds=0.05, max_items=10)
+        cache.put("old", "a", CHUNKS)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("old"))
+        self.assertEqual(cache.stats()["expired"], 1)
+
+        cache.ttl_seconds = None
+        for i in range(20):
+            cache.put(f"k{i}", "a", CHUNKS)
+        self.assertLessEqual(cache.stats()["items"], 10)
+        self.assertEqual(cache.get("k19"), "a")
+
+if __name__ == '__main__':
+    unittest.main()
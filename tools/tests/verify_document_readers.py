@@ -0,0 +1,91 @@
+import unittest
+import os
+import sys
+import tempfile
+import shutil
+
+# Ensure imports work (Add root)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from app.rag_core.document_readers import (
+    read_text_blocks, read_segments, read_pdf_pages, pdf_page_count, PdfReader, SAFE_SPLIT, SAFE_SPLIT_WINDOW
+)
+
+def write_pdf(path, pages):
+    """Minimal uncompressed PDF with one Helvetica text line per page."""
+    objs = ["<< /Type /Catalog /Pages 2 0 R >>",
+            "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages))), len(pages)),
+            "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for i, text in enumerate(pages):
+        body = f"BT /F1 10 Tf 20 780 Td ({text}) Tj ET"
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                    f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>")
+        objs.append(f"<< /Length {len(body)} >>\nstream\n{body}\nendstream")
+    out, offsets = "%PDF-1.4\n", []
+    for num, obj in enumerate(objs, start=1):
+        offsets.append(len(out))
+        out += f"{num} 0 obj\n{obj}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n" + "".join(f"{o:010d} 00000 n \n" for o in offsets)
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    with open(path, 'wb') as f:
+        f.write(out.encode('latin-1'))
+
+class TestDocumentReaders(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_text_blocks_split_at_safe_boundaries(self):
+        path = os.path.join(self.tmp_dir, "nfpa70.md")
+        text = "# Article 210\n\n" + "Receptacle outlets shall be installed 6 ft apart.\n\n" * 200 + "1234567890" * 50
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+        blocks = list(read_text_blocks(path, block_size=97))
+        self.assertEqual("".join(blocks), text)
+        self.assertGreater(len(blocks), 10)
+        # Every block but the last ends on a letter that is followed by " <letter>"
+        for block, following in zip(blocks, blocks[1:]):
+            self.assertTrue(SAFE_SPLIT.match(block[-1] + following[:2]), (block[-5:], following[:5]))
+        segments = list(read_segments(path))
+        self.assertEqual("".join(t for t, _ in segments), text)
+        self.assertTrue(all(loc == {} for _, loc in segments))
+
+    def test_text_blocks_without_safe_boundaries_stay_bounded(self):
+        path = os.path.join(self.tmp_dir, "table_dump.txt")
+        text = "1234567890\n" * 5000
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+        blocks = list(read_text_blocks(path, block_size=97))
+        self.assertEqual("".join(blocks), text)
+        self.assertLessEqual(max(len(b) for b in blocks), SAFE_SPLIT_WINDOW + 97)
+        self.assertGreaterEqual(len(blocks), len(text) // (SAFE_SPLIT_WINDOW + 97))
+
+    def test_csv_row_groups(self):
+        path = os.path.join(self.tmp_dir, "table_310_16.csv")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("size,amps\n" + "".join(f"{i} AWG,{i * 5}\n" for i in range(1200)))
+
+        locations = [loc for _, loc in read_segments(path)]
+        self.assertEqual(locations, [{"row_start": 1, "row_end": 500}, {"row_start": 501, "row_end": 1000},
+                                     {"row_start": 1001, "row_end": 1200}])
+
+    @unittest.skipIf(PdfReader is None, "pypdf not installed")
+    def test_pdf_page_ranges(self):
+        path = os.path.join(self.tmp_dir, "ufc.pdf")
+        write_pdf(path, [f"UFC 3-520-01 page {i}" for i in range(1, 8)])
+
+        self.assertEqual(pdf_page_count(path), 7)
+        whole = list(read_segments(path))
+        self.assertEqual([loc["page"] for _, loc in whole], list(range(1, 8)))
+        self.assertIn("page 3", whole[2][0])
+        # Page ranges (as extracted by worker tasks) concatenate to the whole document
+        ranges = [list(read_pdf_pages(path, start, start + 3)) for start in range(0, 7, 3)]
+        self.assertEqual([segment for part in ranges for segment in part], whole)
+
+if __name__ == '__main__':
+    unittest.main()
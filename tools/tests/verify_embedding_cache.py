@@ -0,0 +1,97 @@
+import unittest
+import os
+import sys
+import types
+import tempfile
+import shutil
+
+# Ensure imports work (Add root)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from app.rag_core.embedding_cache import QueryEmbeddingCache, ContentEmbeddingCache
+
+class FakeEmbeddingsClient:
+    """Stands in for OpenAI(); counts round trips."""
+    def __init__(self):
+        self.calls = 0
+        self.embeddings = self
+
+    def create(self, input, model):
+        self.calls += 1
+        return types.SimpleNamespace(data=[types.SimpleNamespace(embedding=[float(len(t)), 1.0]) for t in input])
+
+class TestQueryEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "query_embeddings.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_hits_skip_network(self):
+        client = FakeEmbeddingsClient()
+        cache = QueryEmbeddingCache(self.db_path)
+        first = cache.get_or_embed(client, "m", "What is Article 517?")
+        second = cache.get_or_embed(client, "m", "  what is   ARTICLE 517? ")
+        self.assertEqual(first, second)
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(cache.stats()["memory_hits"], 1)
+
+        # Different model is a different key
+        cache.get_or_embed(client, "other-model", "What is Article 517?")
+        self.assertEqual(client.calls, 2)
+
+        # Disk tier survives a new process-level cache
+        reopened = QueryEmbeddingCache(self.db_path)
+        self.assertEqual(reopened.get_or_embed(client, "m", "what is article 517?"), first)
+        self.assertEqual(client.calls, 2)
+        self.assertEqual(reopened.stats()["disk_hits"], 1)
+
+    def test_batch_dedup_and_eviction(self):
+        client = FakeEmbeddingsClient()
+        cache = QueryEmbeddingCache(self.db_path, max_memory_items=2, max_disk_items=10)
+        embs = cache.get_or_embed_many(client, "m", ["a", "A", "bb"])
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(embs[0], embs[1])
+        self.assertEqual(len(cache.memory), 2)
+
+        for i in range(20):
+            cache.put("m", f"q{i}", [1.0, 2.0])
+        count = cache.conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+        self.assertLessEqual(count, 10)
+        self.assertEqual(len(cache.memory), 2)
+
+class TestContentEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "chunk_embeddings.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_exact_text_dedup_across_runs(self):
+        sent = []
+        def embed_fn(texts):
+            sent.append(list(texts))
+            return [[float(len(t)), 0.5] for t in texts]
+
+        cache = ContentEmbeddingCache(self.db_path)
+        texts = ["Table 220.12", "Article 517", "Table 220.12", "table 220.12"]
+        embs = cache.embed(embed_fn, "m", texts)
+        self.assertEqual(sent, [["Table 220.12", "Article 517", "table 220.12"]])
+        self.assertEqual(embs[0], embs[2])
+        self.assertEqual(cache.stats()["duplicates"], 1)
+
+        # Another run / another collection: only new text reaches the API
+        reopened = ContentEmbeddingCache(self.db_path)
+        again = reopened.embed(embed_fn, "m", ["Article 517", "Article 700"])
+        self.assertEqual(sent[1], ["Article 700"])
+        self.assertEqual(again[0], embs[1])
+        self.assertEqual(reopened.stats()["hits"], 1)
+
+        # A different model never shares vectors
+        reopened.embed(embed_fn, "other-model", ["Article 517"])
+        self.assertEqual(sent[2], ["Article 517"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import os
+import sys
+import time
+import types
+import threading
+
+# Ensure imports work (Add root)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+import app.rag_core.embedding_providers as providers
+from app.rag_core.embedding_providers import EmbeddingProvider, HashingEmbeddingProvider, OpenAIEmbeddingProvider
+
+class RateLimitError(Exception):
+    pass
+
+class FlakyEmbeddingsClient:
+    """Stands in for OpenAI(); fails the first `failures` requests with a rate limit."""
+    def __init__(self, failures=0, delay=0.0):
+        self.failures = failures
+        self.delay = delay
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.embeddings = self
+
+    def create(self, input, model):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self.calls <= self.failures
+        try:
+            time.sleep(self.delay)
+            if fail:
+                raise RateLimitError("429")
+            return types.SimpleNamespace(data=[types.SimpleNamespace(embedding=[float(len(t))]) for t in input])
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+class TestEmbeddingProviders(unittest.TestCase):
+    def test_batches_respect_limits(self):
+        provider = HashingEmbeddingProvider(dim=8, max_batch_tokens=10, max_batch_items=3)
+        texts = ["x" * 16] * 7  # ~5 tokens each by the offline estimate
+        provider.encoder = None
+        batches = provider.plan_batches(texts)
+        self.assertEqual(sorted(i for idxs, _ in batches for i in idxs), list(range(7)))
+        for idxs, tokens in batches:
+            self.assertLessEqual(len(idxs), 3)
+            self.assertLessEqual(tokens, 10)
+
+    def test_concurrent_order_and_retry(self):
+        original_base = providers.BACKOFF_BASE
+        providers.BACKOFF_BASE = 0.01
+        try:
+            client = FlakyEmbeddingsClient(failures=2, delay=0.02)
+            provider = OpenAIEmbeddingProvider(client, "m", max_concurrency=4, max_batch_items=2)
+            texts = ["a" * (i + 1) for i in range(10)]
+            embeddings = provider.embed(texts)
+        finally:
+            providers.BACKOFF_BASE = original_base
+        self.assertEqual([e[0] for e in embeddings], [float(len(t)) for t in texts])
+        self.assertEqual(client.calls, 7)  # 5 batches + 2 retried failures
+        self.assertGreater(client.max_in_flight, 1)
+
+    def test_non_retryable_error_raises(self):
+        class Broken(EmbeddingProvider):
+            def _embed_batch(self, texts):
+                raise ValueError("bad input")
+        with self.assertRaises(ValueError):
+            Broken("m", 4).embed(["a"])
+
+    def test_hashing_provider_deterministic(self):
+        provider = HashingEmbeddingProvider(dim=64)
+        a, b, c = provider.embed(["Grounding conductors", "grounding conductors", "pump curves"])
+        self.assertEqual(a, b)
+        self.assertEqual(len(a), 64)
+        self.assertAlmostEqual(sum(x * x for x in a), 1.0, places=5)
+        self.assertEqual(a, HashingEmbeddingProvider(dim=64).embed(["Grounding conductors"])[0])
+        self.assertNotEqual(a, c)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,330 @@
+import unittest
+import os
+import glob
+import sys
+import pickle
+import tempfile
+import shutil
+import tracemalloc
+import numpy as np
+
+# Ensure imports work (Add root)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from app.rag_core import index_store
+from app.rag_core.index_store import IndexStore, migrate_pickle, normalize_rows
+
+class TestIndexStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.index_dir = os.path.join(self.tmp_dir, "rag_cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_append_and_mmap_reload(self):
+        store = IndexStore(self.index_dir, dim=8)
+        vecs = normalize_rows(np.random.rand(5, 8))
+        records = [{"text": f"chunk {i}", "source": "a.txt", "path": "/books/a.txt", "page": i} for i in range(5)]
+        self.assertEqual(store.append(vecs, records), [0, 1, 2, 3, 4])
+
+        reopened = IndexStore(self.index_dir, dim=8)
+        reopened.load()
+        self.assertEqual(len(reopened), 5)
+        _, matrix = reopened.blocks()[0]
+        self.assertIsInstance(matrix, np.memmap)
+        np.testing.assert_allclose(matrix, vecs, rtol=1e-6)
+
+        recs = reopened.get_records([3, 1])
+        self.assertEqual([r["text"] for r in recs], ["chunk 3", "chunk 1"])
+        self.assertEqual(recs[0]["page"], 3)
+        self.assertEqual(reopened.paths(), {"/books/a.txt"})
+
+    def test_delta_segments_and_compaction(self):
+        store = IndexStore(self.index_dir, dim=8)
+        batches = [normalize_rows(np.random.rand(n, 8)) for n in (3, 700, 900)]
+        for b_idx, vecs in enumerate(batches):
+            store.append(vecs, [{"text": f"b{b_idx}", "source": "a.txt", "path": "/a"}] * len(vecs))
+        self.assertEqual(len(store), 1603)
+        self.assertEqual(len(glob.glob(os.path.join(self.index_dir, "delta_*.npy"))), 3)
+
+        query = normalize_rows(np.random.rand(1, 8))
+        expected = np.argsort(-(np.concatenate(batches) @ query[0]))[:10]
+        ids, _ = store.top_k(query, 10)
+        np.testing.assert_array_equal(ids[0], expected)
+
+        reopened = IndexStore(self.index_dir, dim=8)
+        reopened.load()
+        self.assertEqual(len(reopened.segments), 3)
+        reopened.compact()
+        self.assertEqual(len(reopened.segments), 1)
+        self.assertEqual(glob.glob(os.path.join(self.index_dir, "delta_*.npy")), [])
+        ids, _ = reopened.top_k(query, 10)
+        np.testing.assert_array_equal(ids[0], expected)
+        self.assertEqual(reopened.get_records([1602])[0]["text"], "b2")
+
+    def test_appends_stay_on_disk_and_compaction_streams(self):
+        store = IndexStore(self.index_dir, dim=128)
+        corpus = normalize_rows(np.random.rand(40000, 128))
+        for start in range(0, 40000, 10000):
+            store.append(corpus[start:start + 10000], [{"text": "", "source": "a", "path": f"/p{start}"}] * 10000)
+        # Session appends are mapped from their committed delta files, not kept in RAM
+        self.assertEqual(len(store.blocks()), 4)
+        self.assertTrue(all(isinstance(matrix, np.memmap) for _, matrix in store.blocks()))
+        store.delete_file("/p10000")
+
+        original = index_store.VECTOR_BLOCK_BYTES
+        index_store.VECTOR_BLOCK_BYTES = 256 * 1024
+        tracemalloc.start()
+        try:
+            store.compact()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            index_store.VECTOR_BLOCK_BYTES = original
+        self.assertLess(peak, corpus.nbytes / 4)  # ~20 MB if merged in memory
+        self.assertEqual(len(store), 30000)
+        np.testing.assert_array_equal(store.take(range(30000)), np.concatenate([corpus[:10000], corpus[20000:]]))
+
+    def test_top_k_many_queries_in_blocks(self):
+        store = IndexStore(self.index_dir, dim=16)
+        corpus = normalize_rows(np.random.rand(5000, 16))
+        store.append(corpus[:2000], [{"text": "", "source": "a", "path": "/a"}] * 2000)
+        store.append(corpus[2000:], [{"text": "", "source": "a", "path": "/a"}] * 3000)
+        queries = normalize_rows(np.random.rand(7, 16))
+
+        # Tiny blocks force many partial merges across and within segments
+        ids, scores = store.top_k(queries, 5, max_block_elements=7 * 1024)
+        full = queries @ corpus.T
+        for q in range(7):
+            np.testing.assert_array_equal(ids[q], np.argsort(-full[q])[:5])
+            self.assertTrue(np.all(np.diff(scores[q]) <= 0))
+
+        ids, _ = store.top_k(queries, 10000)
+        self.assertEqual(ids.shape, (7, 5000))
+
+    def test_tombstones_and_compaction_renumbering(self):
+        store = IndexStore(self.index_dir, dim=4)
+        vecs = np.eye(4, dtype='float32')
+        store.append(vecs, [{"text": f"t{i}", "source": "a", "path": f"/p{i % 2}"} for i in range(4)])
+        store.set_file_state("/p0", 10, 1.0, "abc")
+        store.delete_file("/p0")  # rows 0 and 2
+
+        ids, _ = store.top_k(vecs, 4)
+        self.assertEqual(ids.shape, (4, 2))
+        self.assertNotIn(0, ids)
+        self.assertNotIn(2, ids)
+        self.assertIsNone(store.file_state("/p0"))
+
+        store.compact()
+        self.assertEqual(len(store), 2)
+        self.assertEqual([r["text"] for r in store.get_records([0, 1])], ["t1", "t3"])
+        np.testing.assert_array_equal(store.take([1, 0]), vecs[[3, 1]])
+
+    def test_quantized_first_pass_with_exact_rescore(self):
+        corpus = normalize_rows(np.random.rand(3000, 32) - 0.5)
+        queries = normalize_rows(np.random.rand(5, 32) - 0.5)
+        expected = np.argsort(-(queries @ corpus.T), axis=1)[:, :5]
+        for mode in ("float16", "int8"):
+            store = IndexStore(os.path.join(self.tmp_dir, mode), dim=32, quantization=mode)
+            store.append(corpus, [{"text": "", "source": "a", "path": "/a"}] * 3000)
+            ids, scores = store.top_k(queries, 5, rescore_factor=8)
+            np.testing.assert_array_equal(ids, expected)
+            # Returned scores are the exact float32 cosine, not the quantized estimate
+            np.testing.assert_allclose(scores[:, 0], np.max(queries @ corpus.T, axis=1), rtol=1e-5)
+
+            store.load()
+            self.assertEqual(len(store.quantized.codes.view), 3000)
+
+    def test_quantized_pass_widens_rows_in_a_bounded_buffer(self):
+        corpus = normalize_rows(np.random.rand(20000, 128) - 0.5)
+        query = normalize_rows(np.random.rand(1, 128) - 0.5)
+        expected = np.argsort(-(corpus @ query[0]))[:10]
+        original = index_store.WIDEN_BLOCK_BYTES
+        index_store.WIDEN_BLOCK_BYTES = 256 * 1024
+        try:
+            for mode in ("float16", "int8"):
+                store = IndexStore(os.path.join(self.tmp_dir, mode), dim=128, quantization=mode)
+                store.append(corpus, [{"text": "", "source": "a", "path": "/a"}] * 20000)
+                tracemalloc.start()
+                try:
+                    ids, _ = store.top_k(query, 10, rescore_factor=8)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+                np.testing.assert_array_equal(ids[0], expected)
+                self.assertLess(peak, corpus.nbytes / 8)  # ~10 MB if a whole block were converted
+        finally:
+            index_store.WIDEN_BLOCK_BYTES = original
+
+    def test_ivf_search_tracks_appends_and_compaction(self):
+        rng = np.random.default_rng(1)
+        centers = normalize_rows(rng.standard_normal((20, 16)))
+        corpus = normalize_rows(centers[rng.integers(0, 20, 4000)] + 0.1 * rng.standard_normal((4000, 16)))
+        store = IndexStore(self.index_dir, dim=16)
+        store.append(corpus[:3000], [{"text": "", "source": "a", "path": "/a"}] * 3000)
+        store.build_ivf(n_lists=20, nprobe=4)
+
+        # Rows appended after the build are assigned and searchable; only their assignments are written
+        ivf_path = os.path.join(self.index_dir, "ivf.npz")
+        ivf_stat = os.stat(ivf_path)
+        store.append(corpus[3000:3500], [{"text": "", "source": "b", "path": "/b"}] * 500)
+        store.append(corpus[3500:], [{"text": "", "source": "b", "path": "/b"}] * 500)
+        self.assertEqual(len(store.ivf.assignments), 4000)
+        self.assertEqual(os.stat(ivf_path).st_mtime_ns, ivf_stat.st_mtime_ns)
+        self.assertEqual(len(glob.glob(os.path.join(self.index_dir, "ivf_delta_*.npy"))), 2)
+        reopened = IndexStore(self.index_dir, dim=16)
+        reopened.load()
+        np.testing.assert_array_equal(reopened.ivf.assignments, store.ivf.assignments)
+        queries = corpus[[10, 3500]]
+        ids, _ = store.top_k(queries, 5)
+        exact_ids, _ = store.top_k(queries, 5, exact=True)
+        self.assertEqual(ids[0, 0], 10)
+        self.assertEqual(ids[1, 0], 3500)
+        recall = np.mean([len(set(a) & set(b)) / 5 for a, b in zip(ids, exact_ids)])
+        self.assertGreaterEqual(recall, 0.8)
+
+        store.delete_file("/a")
+        store.compact()
+        reopened = IndexStore(self.index_dir, dim=16)
+        reopened.load()
+        self.assertEqual(len(reopened.ivf.assignments), 1000)
+        ids, _ = reopened.top_k(corpus[[3500]], 1)
+        self.assertEqual(ids[0, 0], 500)
+
+    def test_filtered_search_scores_only_matching_rows(self):
+        corpus = normalize_rows(np.random.rand(600, 8))
+        records = [{"text": str(i), "source": ["nfpa99.pdf", "nfpa70.pdf", "fgi.pdf"][i // 200],
+                    "path": f"/b/{i // 200}", "page_start": i % 3} for i in range(600)]
+        store = IndexStore(self.index_dir, dim=8)
+        store.append(corpus, records)
+
+        query = normalize_rows(np.random.rand(1, 8))
+        ids, _ = store.top_k(query, 5, filters={"source": "nfpa70.pdf"})
+        self.assertTrue(all(200 <= i < 400 for i in ids[0]))
+        np.testing.assert_array_equal(ids[0], 200 + np.argsort(-(corpus[200:400] @ query[0]))[:5])
+
+        ids, _ = store.top_k(query, 500, filters={"source": ["nfpa99.pdf", "fgi.pdf"], "page_start": 0})
+        self.assertEqual(ids.shape[1], 133)
+        self.assertTrue(all(i % 3 == 0 and not 200 <= i < 400 for i in ids[0]))
+
+        # Postings are extended on append and respect deletions
+        store.append(corpus[:10], [{"text": "x", "source": "nfpa70.pdf", "path": "/b/new"}] * 10)
+        self.assertEqual(len(store.filter_rows({"source": "nfpa70.pdf"})), 210)
+        store.delete_file("/b/1")
+        ids, _ = store.top_k(query, 50, filters={"source": "nfpa70.pdf"})
+        self.assertEqual(sorted(ids[0]), list(range(600, 610)))
+        self.assertEqual(store.top_k(query, 5, filters={"source": "missing.pdf"})[0].shape, (1, 0))
+
+    def test_wide_filter_over_quantized_store_gathers_in_bounded_blocks(self):
+        corpus = normalize_rows(np.random.rand(20000, 64))
+        records = [{"text": "", "source": "nfpa70.pdf" if i % 10 else "ufc.pdf", "path": "/b"} for i in range(20000)]
+        store = IndexStore(self.index_dir, dim=64, quantization="int8")
+        store.append(corpus, records)
+        store.compact()
+
+        query = normalize_rows(np.random.rand(1, 64))
+        matching = np.flatnonzero(np.arange(20000) % 10)
+        subset_bytes = len(matching) * 64 * 4  # ~4.6 MB if gathered at once
+        original = index_store.VECTOR_BLOCK_BYTES
+        index_store.VECTOR_BLOCK_BYTES = 256 * 1024
+        tracemalloc.start()
+        try:
+            ids, scores = store.top_k(query, 10, filters={"source": "nfpa70.pdf"})
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            index_store.VECTOR_BLOCK_BYTES = original
+        expected = matching[np.argsort(-(corpus[matching] @ query[0]))[:10]]
+        np.testing.assert_array_equal(ids[0], expected)
+        self.assertLess(peak, subset_bytes / 4)
+
+    def test_damaged_segment_is_skipped_alone(self):
+        store = IndexStore(self.index_dir, dim=8)
+        batches = [normalize_rows(np.random.rand(n, 8)) for n in (4, 5, 6)]
+        for b_idx, vecs in enumerate(batches):
+            store.append(vecs, [{"text": f"b{b_idx}", "source": f"{b_idx}.txt", "path": f"/b/{b_idx}"}] * len(vecs))
+            store.set_file_state(f"/b/{b_idx}", 1, 1.0, "hash")
+
+        # Flip bytes in the middle segment's data; its header still parses
+        damaged = os.path.join(self.index_dir, "delta_0000000004.npy")
+        with open(damaged, 'r+b') as f:
+            f.seek(-8, os.SEEK_END)
+            f.write(b"\xff" * 8)
+        # A segment written but never committed (crash before the manifest update)
+        np.save(os.path.join(self.index_dir, "delta_0000000015.npy"), np.ones((3, 8), dtype='float32'))
+
+        reopened = IndexStore(self.index_dir, dim=8)
+        reopened.load()
+        self.assertEqual(len(reopened), 15)
+        self.assertEqual(reopened.live_count(), 10)
+        ids, _ = reopened.top_k(normalize_rows(np.random.rand(1, 8)), 15)
+        self.assertEqual(sorted(ids[0]), list(range(4)) + list(range(9, 15)))
+        self.assertIsNone(reopened.file_state("/b/1"))
+        self.assertIsNotNone(reopened.file_state("/b/2"))
+
+        reopened.compact()
+        self.assertEqual(len(reopened), 10)
+        self.assertEqual([os.path.basename(p) for p in glob.glob(os.path.join(self.index_dir, "*.npy"))],
+                         [name for name, _, _, _ in reopened._manifest()])
+        np.testing.assert_allclose(reopened.blocks()[0][1][4:], batches[2], rtol=1e-6)
+
+    def test_unchanged_segments_are_not_rechecksummed_on_load(self):
+        store = IndexStore(self.index_dir, dim=8)
+        for b_idx in range(3):
+            store.append(normalize_rows(np.random.rand(4, 8)), [{"text": "", "source": "s", "path": f"/b/{b_idx}"}] * 4)
+
+        checksummed = []
+        original = index_store.file_crc32
+        index_store.file_crc32 = lambda path: checksummed.append(os.path.basename(path)) or original(path)
+        try:
+            IndexStore(self.index_dir, dim=8).load()
+            self.assertEqual(checksummed, [])
+
+            # Damage that keeps size and mtime is only found by an explicit integrity check
+            damaged = os.path.join(self.index_dir, "delta_0000000004.npy")
+            stat = os.stat(damaged)
+            with open(damaged, 'r+b') as f:
+                f.seek(-8, os.SEEK_END)
+                f.write(b"\xff" * 8)
+            os.utime(damaged, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            IndexStore(self.index_dir, dim=8).load()
+            self.assertEqual(checksummed, [])
+            verified = IndexStore(self.index_dir, dim=8)
+            verified.load(verify=True)
+            self.assertEqual(len(checksummed), 3)
+            self.assertEqual(verified.live_count(), 8)
+        finally:
+            index_store.file_crc32 = original
+
+    def test_legacy_segments_are_adopted(self):
+        store = IndexStore(self.index_dir, dim=8)
+        vecs = normalize_rows(np.random.rand(6, 8))
+        store.append(vecs[:2], [{"text": "a", "source": "a.txt", "path": "/a"}] * 2)
+        store.append(vecs[2:], [{"text": "b", "source": "b.txt", "path": "/b"}] * 4)
+        store.conn.execute("DELETE FROM segments")
+        store.conn.commit()
+
+        reopened = IndexStore(self.index_dir, dim=8)
+        reopened.load()
+        self.assertEqual(len(reopened), 6)
+        self.assertEqual(len(reopened._manifest()), 2)
+        np.testing.assert_allclose(reopened.take(range(6)), vecs, rtol=1e-6)
+
+    def test_migrate_pickle(self):
+        pkl_path = os.path.join(self.tmp_dir, "rag_cache.pkl")
+        items = [
+            {"text": "good", "source": "b.txt", "path": "/books/b.txt", "embedding": [3.0, 4.0, 0, 0]},
+            {"text": "malformed", "source": "b.txt", "path": "/books/b.txt", "embedding": [1.0]},
+        ]
+        with open(pkl_path, 'wb') as f:
+            pickle.dump(items, f)
+
+        store = migrate_pickle(pkl_path, self.index_dir, dim=4)
+        store.load()
+        self.assertEqual(len(store), 1)
+        np.testing.assert_allclose(store.blocks()[0][1][0], [0.6, 0.8, 0, 0], rtol=1e-6)
+        self.assertEqual(store.get_records([0])[0]["text"], "good")
+
+if __name__ == '__main__':
+    unittest.main()
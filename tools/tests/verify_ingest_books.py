@@ -0,0 +1,382 @@
+import unittest
+import io
+import os
+import sys
+import tempfile
+import shutil
+import threading
+import time
+import zlib
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+
+# Ensure imports work (Add root)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from app.rag_core import embedding_providers
+from app.rag_core.embedding_cache import ContentEmbeddingCache
+from app.rag_core.parent_store import ParentStore
+from app.rag_core.corpus import domain_flag
+from tools.admin import ingest_books
+from tools.admin.ingest_books import IngestPipeline, ParentChildSplitter, entry_complete, layout_chunk_ids, load_manifest
+from tools.tests.bench_chunking import PAGE, legacy_chunks
+
+class ByteEncoder:
+    """Offline stand-in for the tiktoken encoding: one token per byte of ASCII text."""
+    def encode_ordinary(self, text):
+        return list(text.encode('ascii'))
+
+    def decode(self, tokens):
+        return bytes(tokens).decode('ascii')
+
+class RateLimitError(Exception):
+    pass
+
+class FakeEmbeddings:
+    """
+    `client.embeddings`: deterministic 4-d vectors; raises on any text containing `poison`.
+    The first `rate_limited` requests fail with a (retryable) rate limit; each takes `delay` seconds.
+    """
+    def __init__(self, events, poison=None, rate_limited=0, delay=0.0):
+        self.events = events
+        self.poison = poison
+        self.rate_limited = rate_limited
+        self.delay = delay
+        self.texts = []
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def create(self, input, model):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            limited = self.rate_limited > 0
+            self.rate_limited -= limited
+        try:
+            time.sleep(self.delay)
+            if limited:
+                raise RateLimitError("429")
+            if self.poison and any(self.poison in text for text in input):
+                raise ValueError("invalid input")
+            with self.lock:
+                self.texts.extend(input)
+                self.requests.append(list(input))
+                self.events.append(("embed", len(input)))
+            return SimpleNamespace(data=[SimpleNamespace(embedding=embedding(t)) for t in input])
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+def embedding(text):
+    return [float(zlib.crc32(text.encode())), float(len(text)), 0.0, 1.0]
+
+class FakeCollection:
+    """In-memory stand-in for the Chroma collection calls the writer makes."""
+    def __init__(self, events):
+        self.name = "corpus"
+        self.events = events
+        self.rows = {}
+
+    def upsert(self, documents, embeddings, metadatas, ids):
+        self.events.append(("upsert", len(ids)))
+        for row_id, doc, emb, meta in zip(ids, documents, embeddings, metadatas):
+            self.rows[row_id] = {"document": doc, "embedding": emb, "metadata": dict(meta)}
+
+    def get(self, ids, include):
+        found = [i for i in ids if i in self.rows]
+        return {"ids": found, "metadatas": [dict(self.rows[i]["metadata"]) for i in found]}
+
+    def update(self, ids, metadatas):
+        for row_id, meta in zip(ids, metadatas):
+            self.rows[row_id]["metadata"] = dict(meta)
+
+    def delete(self, ids=None, where=None):
+        for row_id in ids or [i for i, r in self.rows.items() if r["metadata"]["source"] == where["source"]]:
+            self.rows.pop(row_id, None)
+
+    def count(self):
+        return len(self.rows)
+
+def book_text(name, sections=12, marker=""):
+    return "".join(f"ARTICLE {100 + s}\n{name} article {s}. {marker}"
+                   + f"The {name} installation shall comply with rule {s}. " * 60 + "\n"
+                   for s in range(sections))
+
+def line_segments(path):
+    with open(path, encoding='ascii') as f:
+        for line in f:
+            yield line, {}
+
+class PipelineTestCase(unittest.TestCase):
+    """Runs IngestPipeline in-process against a fake encoder, embeddings client and collection."""
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.saved = {name: getattr(ingest_books, name)
+                      for name in ("get_encoder", "SEGMENT_BATCH_CHARS", "chunk_segments", "read_segments")}
+        ingest_books.get_encoder = lambda model_name: ByteEncoder()
+        ingest_books.get_splitter.cache_clear()
+        self.events = []
+        self.collection = FakeCollection(self.events)
+        self.parent_store = ParentStore(os.path.join(self.tmp_dir, "parents.sqlite"))
+        self.manifest = {"corpus": {}}
+        self.manifest_file = os.path.join(self.tmp_dir, "manifest.json")
+        self.books = {}
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(ingest_books, name, value)
+        ingest_books.get_splitter.cache_clear()
+        self.parent_store.conn.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def add_book(self, file_name, text, domains):
+        path = os.path.join(self.tmp_dir, file_name)
+        with open(path, 'w', encoding='ascii') as f:
+            f.write(text)
+        self.books[file_name] = {"path": path, "domains": domains}
+
+    def ingest(self, poison=None, batch_chunks=8):
+        embeddings = FakeEmbeddings(self.events, poison)
+        args = SimpleNamespace(batch_chunks=batch_chunks, chunk_workers=0, metrics_interval=0, concurrency=1, queue_size=2)
+        pipeline = IngestPipeline(self.collection, self.parent_store, self.manifest, self.manifest_file,
+                                  SimpleNamespace(embeddings=embeddings), None, 1000, args)
+        pipeline.run({name: dict(book, domains=list(book["domains"])) for name, book in self.books.items()})
+        return pipeline, embeddings
+
+    def entry(self, file_name):
+        return self.manifest["corpus"][file_name]
+
+class TestIngestPipeline(PipelineTestCase):
+
+    def test_chunk_batches_are_embedded_and_written_as_they_arrive(self):
+        ingest_books.SEGMENT_BATCH_CHARS = 4000
+        # One segment per line, so the book spans many chunk batches
+        ingest_books.read_segments = line_segments
+        def recording_chunk_segments(state, segments, final):
+            self.events.append(("chunk", final))
+            return self.saved["chunk_segments"](state, segments, final)
+        ingest_books.chunk_segments = recording_chunk_segments
+        self.add_book("nec.md", book_text("nec", sections=20), ["code"])
+        self.ingest()
+
+        entry = self.entry("nec.md")
+        self.assertTrue(entry_complete(entry))
+        self.assertEqual(self.collection.count(), entry["total_chunks"])
+        self.assertEqual(sorted(self.collection.rows), sorted(layout_chunk_ids("nec.md", entry["children_per_parent"])))
+        # The first window is written while the book is still being chunked
+        chunk_calls = [i for i, e in enumerate(self.events) if e[0] == "chunk"]
+        self.assertGreater(len(chunk_calls), 3)
+        self.assertLess(self.events.index(("upsert", 8)), chunk_calls[-1])
+        self.assertTrue(all(n <= 8 for kind, n in self.events if kind == "upsert"))
+
+    def test_interrupted_book_resumes_and_changed_book_is_replaced(self):
+        self.add_book("nec.md", book_text("nec", sections=10) + book_text("tail", sections=4, marker="POISON "), ["code"])
+        pipeline, _ = self.ingest(poison="POISON")
+        self.assertEqual(pipeline.failed, {"nec.md"})
+        written = self.entry("nec.md")["next_chunk"]
+        self.assertIsNone(self.entry("nec.md")["total_chunks"])
+        self.assertGreater(written, 0)
+        self.assertEqual(self.collection.count(), written)
+
+        # Resume: only the chunks after the last written window are embedded
+        _, embeddings = self.ingest()
+        entry = self.entry("nec.md")
+        self.assertTrue(entry_complete(entry))
+        self.assertEqual(len(embeddings.texts), entry["total_chunks"] - written)
+        self.assertEqual(sorted(self.collection.rows), sorted(layout_chunk_ids("nec.md", entry["children_per_parent"])))
+
+        # A complete, untouched book is skipped without reading
+        _, embeddings = self.ingest()
+        self.assertEqual(embeddings.texts, [])
+
+        # An edited book replaces every old chunk and parent
+        self.add_book("nec.md", book_text("nec", sections=3), ["code"])
+        _, embeddings = self.ingest()
+        entry = self.entry("nec.md")
+        self.assertEqual(len(embeddings.texts), entry["total_chunks"])
+        self.assertEqual(sorted(self.collection.rows), sorted(layout_chunk_ids("nec.md", entry["children_per_parent"])))
+        parent_ids = {row["metadata"]["parent_id"] for row in self.collection.rows.values()}
+        self.assertEqual(self.parent_store.count(), len(parent_ids))
+
+    def test_progress_is_saved_per_window_and_replacements_say_if_partial(self):
+        self.add_book("nec.md", book_text("nec", sections=10) + book_text("tail", sections=4, marker="POISON "), ["code"])
+        self.ingest(poison="POISON")
+        # The manifest on disk records every window written before the failure
+        saved = load_manifest(self.manifest_file)["corpus"]["nec.md"]
+        self.assertEqual(saved, self.entry("nec.md"))
+        self.assertGreaterEqual(saved["next_chunk"], 8)
+        self.assertIsNone(saved["total_chunks"])
+        self.assertEqual(sum(saved["children_per_parent"]), saved["next_chunk"])
+
+        output = io.StringIO()
+        self.add_book("nec.md", book_text("nec", sections=6), ["code"])
+        with redirect_stdout(output):
+            self.ingest()
+        self.assertIn("nec.md changed since its last (partial) ingest; replacing its chunks.", output.getvalue())
+        self.assertTrue(entry_complete(load_manifest(self.manifest_file)["corpus"]["nec.md"]))
+
+        output = io.StringIO()
+        self.add_book("nec.md", book_text("nec", sections=5), ["code"])
+        with redirect_stdout(output):
+            self.ingest()
+        self.assertIn("nec.md changed since its last ingest; replacing its chunks.", output.getvalue())
+
+    def test_domain_change_relabels_without_re_embedding(self):
+        self.add_book("nec.md", book_text("nec"), ["code"])
+        self.ingest()
+        self.assertTrue(all(r["metadata"][domain_flag("code")] and not r["metadata"][domain_flag("healthcare")]
+                            for r in self.collection.rows.values()))
+        before = {row_id: row["embedding"] for row_id, row in self.collection.rows.items()}
+
+        self.books["nec.md"]["domains"] = ["code", "healthcare"]
+        _, embeddings = self.ingest()
+        self.assertEqual(embeddings.texts, [])
+        self.assertEqual({row_id: row["embedding"] for row_id, row in self.collection.rows.items()}, before)
+        for row in self.collection.rows.values():
+            self.assertEqual(row["metadata"]["domain"], "code,healthcare")
+            self.assertTrue(row["metadata"][domain_flag("healthcare")])
+        self.assertEqual(self.entry("nec.md")["domains"], ["code", "healthcare"])
+
+        # Touched but identical content: the hash matches, so again nothing is embedded
+        os.utime(self.books["nec.md"]["path"], ns=(1, 1))
+        _, embeddings = self.ingest()
+        self.assertEqual(embeddings.texts, [])
+        self.assertEqual(self.entry("nec.md")["mtime_ns"], 1)
+
+    def test_a_failing_book_does_not_stop_the_others(self):
+        self.add_book("a.md", book_text("alpha"), ["code"])
+        self.add_book("b.md", book_text("bravo", marker="POISON "), ["code"])
+        self.add_book("c.md", book_text("charlie"), ["military"])
+        self.add_book("d.md", "", ["code"])
+        pipeline, _ = self.ingest(poison="POISON")
+
+        self.assertEqual(pipeline.failed, {"b.md"})
+        for name in ("a.md", "c.md"):
+            self.assertTrue(entry_complete(self.entry(name)))
+        self.assertNotIn("d.md", self.manifest["corpus"])
+        self.assertEqual(self.collection.count(), sum(self.entry(n)["total_chunks"] for n in ("a.md", "c.md")))
+        self.assertFalse(any(row_id.startswith("b.md") for row_id in self.collection.rows))
+
+class TestSharedBooks(PipelineTestCase):
+    def setUp(self):
+        super().setUp()
+        self.base_dir = ingest_books.BASE_DIR
+        ingest_books.BASE_DIR = self.tmp_dir
+
+    def tearDown(self):
+        ingest_books.BASE_DIR = self.base_dir
+        super().tearDown()
+
+    def put(self, domain, file_name, text):
+        folder = os.path.join(self.tmp_dir, ingest_books.DOMAIN_MAP[domain]["folder"])
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, file_name)
+        with open(path, 'w', encoding='ascii') as f:
+            f.write(text)
+        return path
+
+    def test_a_shared_book_is_ingested_once_with_every_domain_flag(self):
+        nec = self.put("healthcare", "nec.md", book_text("nec"))
+        self.put("code", "nec.md", book_text("nec"))
+        self.put("military", "ufc.md", book_text("ufc"))
+        self.books = ingest_books.scan_domain_books()
+        self.assertEqual(self.books["nec.md"], {"path": nec, "domains": ["healthcare", "code"]})
+        self.assertEqual(self.books["ufc.md"]["domains"], ["military"])
+
+        _, embeddings = self.ingest()
+        nec_rows = [r["metadata"] for i, r in self.collection.rows.items() if i.startswith("nec.md")]
+        self.assertEqual(len(nec_rows), self.entry("nec.md")["total_chunks"])
+        self.assertEqual(len(embeddings.texts), self.collection.count())
+        for meta in nec_rows:
+            self.assertEqual(meta["domain"], "healthcare,code")
+            self.assertEqual([meta[domain_flag(d)] for d in ("healthcare", "code", "military")], [True, True, False])
+
+        # Leaving a folder clears just that flag
+        os.remove(os.path.join(self.tmp_dir, ingest_books.DOMAIN_MAP["code"]["folder"], "nec.md"))
+        self.books = ingest_books.scan_domain_books()
+        self.ingest()
+        for i, row in self.collection.rows.items():
+            if i.startswith("nec.md"):
+                self.assertEqual(row["metadata"]["domain"], "healthcare")
+                self.assertFalse(row["metadata"][domain_flag("code")])
+
+    def test_differing_copies_name_both_paths_and_the_kept_one(self):
+        kept = self.put("healthcare", "nec.md", book_text("nec"))
+        other = self.put("code", "nec.md", book_text("nec", sections=3))
+        output = io.StringIO()
+        with redirect_stdout(output):
+            books = ingest_books.scan_domain_books()
+        self.assertEqual(books["nec.md"], {"path": kept, "domains": ["healthcare", "code"]})
+        self.assertIn(f"Warning: {other} and {kept} are different copies of nec.md; only {kept} is ingested",
+                      output.getvalue())
+
+class TestEmbeddingRequests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.batch_tokens = ingest_books.EMBEDDING_BATCH_TOKENS
+        self.backoff = embedding_providers.BACKOFF_BASE
+        ingest_books.EMBEDDING_BATCH_TOKENS = 200
+        embedding_providers.BACKOFF_BASE = 0.01
+
+    def tearDown(self):
+        ingest_books.EMBEDDING_BATCH_TOKENS = self.batch_tokens
+        embedding_providers.BACKOFF_BASE = self.backoff
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_requests_are_token_sized_concurrent_and_in_order(self):
+        embeddings = FakeEmbeddings([], rate_limited=2, delay=0.02)
+        provider = ingest_books.make_embedding_provider(SimpleNamespace(embeddings=embeddings), max_concurrency=4)
+        provider.encoder = None  # Offline token estimate: len // 4 + 1
+        texts = [f"chunk {i} " + "x" * (40 * (i % 5)) for i in range(60)]
+        result = ingest_books.get_embeddings_batched(None, texts, provider=provider)
+
+        self.assertEqual(result, [embedding(t) for t in texts])
+        self.assertEqual(sorted(embeddings.texts), sorted(texts))
+        for request in embeddings.requests:
+            self.assertLessEqual(sum(provider.count_tokens(t) for t in request), 200)
+        self.assertGreater(len(embeddings.requests), 5)
+        self.assertTrue(1 < embeddings.max_in_flight <= 4)
+
+    def test_cached_and_repeated_chunks_skip_the_api(self):
+        cache = ContentEmbeddingCache(os.path.join(self.tmp_dir, "content.sqlite"))
+        embeddings = FakeEmbeddings([])
+        provider = ingest_books.make_embedding_provider(SimpleNamespace(embeddings=embeddings), max_concurrency=2)
+        texts = [f"rule {i % 10}" for i in range(30)]
+        self.assertEqual(ingest_books.get_embeddings_batched(None, texts, cache=cache, provider=provider),
+                         [embedding(t) for t in texts])
+        self.assertEqual(sorted(embeddings.texts), sorted(set(texts)))
+
+        result = ingest_books.get_embeddings_batched(None, texts + ["rule 10"], cache=cache, provider=provider)
+        self.assertEqual(result[-1], embedding("rule 10"))
+        self.assertEqual(len(embeddings.texts), 11)
+        cache.conn.close()
+
+class TestSinglePassChunking(unittest.TestCase):
+    def setUp(self):
+        self.get_encoder = ingest_books.get_encoder
+        ingest_books.get_encoder = lambda model_name: ByteEncoder()
+
+    def tearDown(self):
+        ingest_books.get_encoder = self.get_encoder
+
+    def test_single_pass_matches_the_legacy_chunks(self):
+        text = "\n".join(f"Page {i}\n{PAGE}" for i in range(40))
+        splitter = ParentChildSplitter(align_sections=False)
+        _, chunks = splitter.create_parent_child_chunks(text, "bench.txt", "code")
+        self.assertGreater(len(chunks), 20)
+        self.assertEqual([c["text"] for c in chunks], legacy_chunks(splitter, text))
+        for chunk in chunks:
+            meta = splitter.extract_metadata(chunk["text"], "bench.txt")
+            self.assertEqual((chunk["metadata"]["chunk_role"], chunk["metadata"]["contains_formula"]),
+                             (meta["chunk_role"], meta["contains_formula"]))
+            self.assertEqual(chunk["tokens"], splitter.count_tokens(chunk["text"]))
+
+        # Streaming the same text in pieces gives the same chunks
+        pieces = [(text[i:i + 5000], {}) for i in range(0, len(text), 5000)]
+        _, streamed = splitter.create_parent_child_chunks_from_segments(pieces, "bench.txt", "code")
+        self.assertEqual([(c["id"], c["text"]) for c in streamed], [(c["id"], c["text"]) for c in chunks])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+import os
+import sys
+import tempfile
+import shutil
+
+# Ensure imports work (Add root)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from app.rag_core.parent_store import ParentStore
+
+class TestParentStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "parents.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_round_trip_and_lru(self):
+        store = ParentStore(self.db_path, cache_items=2)
+        texts = {f"nfpa70.txt_p{i}": f"Article 210.{i} " * 500 for i in range(4)}
+        store.put_many((pid, "nfpa70.txt", text) for pid, text in texts.items())
+        self.assertEqual(store.count(), 4)
+
+        found = store.get_many(["nfpa70.txt_p0", "nfpa70.txt_p1", "nfpa70.txt_p0", "missing"])
+        self.assertEqual(found, {pid: texts[pid] for pid in ["nfpa70.txt_p0", "nfpa70.txt_p1"]})
+        self.assertEqual(store.stats()["disk_reads"], 2)
+        self.assertEqual(store.stats()["missing"], 1)
+
+        store.get_many(["nfpa70.txt_p1"])
+        self.assertEqual(store.stats()["memory_hits"], 1)
+        store.get_many(["nfpa70.txt_p2", "nfpa70.txt_p3"])
+        self.assertEqual(len(store.memory), 2)
+
+        # Compressed on disk
+        size = os.path.getsize(self.db_path)
+        self.assertLess(size, sum(len(t) for t in texts.values()))
+
+    def test_replace_and_delete_source(self):
+        store = ParentStore(self.db_path)
+        store.put_many([("a_p0", "a.txt", "old"), ("b_p0", "b.txt", "keep")])
+        store.get_many(["a_p0"])
+        store.put_many([("a_p0", "a.txt", "new")])
+        self.assertEqual(ParentStore(self.db_path).get_many(["a_p0"]), {"a_p0": "new"})
+        self.assertEqual(store.get_many(["a_p0"]), {"a_p0": "new"})
+
+        store.delete_source("a.txt")
+        self.assertEqual(store.get_many(["a_p0", "b_p0"]), {"b_p0": "keep"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import os
+import sys
+import types
+
+# Ensure imports work (Add root)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from app.rag_core import rag_chat
+from app.rag_core.rag_chat import trim_history, summarize_turns, build_history, message_tokens
+
+class FakeSummaryClient:
+    """Stands in for OpenAI(); the "summary" lists every user question it has been shown."""
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.calls = 0
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, model, messages, **kwargs):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("rate limited")
+        prompt = messages[0]["content"]
+        current = prompt.split("Current summary:\n", 1)[1].split("\n\nNew turns:\n", 1)[0]
+        questions = [line[len("user: "):] for line in prompt.split("\n") if line.startswith("user: ")]
+        summary = "; ".join(([] if current == "(none)" else [current]) + questions)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=summary))])
+
+def turn(i, words=40):
+    return [{"role": "user", "content": f"Question {i} about Article {200 + i}? " + "detail " * words},
+            {"role": "assistant", "content": f"Answer {i}: see {200 + i}.12. " + "because " * words}]
+
+class TestChatHistory(unittest.TestCase):
+    def setUp(self):
+        # Deterministic ~4 chars/token estimate instead of a tiktoken download
+        self.encoder = rag_chat._encoder
+        rag_chat._encoder = False
+
+    def tearDown(self):
+        rag_chat._encoder = self.encoder
+
+    def test_history_stays_under_budget_and_summary_replaces_evicted_turns(self):
+        budget = 400
+        client = FakeSummaryClient()
+        turns, summary, all_evicted = [], "", []
+        for i in range(12):
+            turns.extend(turn(i))
+            evicted, turns = trim_history(turns, budget=budget)
+            if evicted:
+                summary = summarize_turns(client, summary, evicted)
+                all_evicted.extend(evicted)
+
+            self.assertLessEqual(message_tokens(turns), budget)
+            # Newest turns are kept verbatim, oldest first
+            self.assertEqual(turns[-2:], turn(i))
+            self.assertEqual(all_evicted + turns, [m for j in range(i + 1) for m in turn(j)])
+
+        self.assertGreater(len(all_evicted), 0)
+        self.assertEqual(client.calls, len(all_evicted) // 2)
+        history = build_history(summary, turns)
+        self.assertEqual(history[0]["content"], rag_chat.SYSTEM_PROMPT)
+        self.assertTrue(history[1]["content"].startswith("Summary of the earlier conversation:"))
+        self.assertEqual(history[2:], turns)
+        # Every dropped question lives on in the summary and nowhere else
+        for message in all_evicted:
+            if message["role"] == "user":
+                self.assertIn(message["content"].strip(), summary)
+                self.assertNotIn(message, history)
+
+    def test_latest_turn_is_kept_even_over_budget(self):
+        turns = turn(0) + turn(1, words=500)
+        evicted, kept = trim_history(turns, budget=100)
+        self.assertEqual(evicted, turn(0))
+        self.assertEqual(kept, turn(1, words=500))
+
+    def test_failed_summary_call_keeps_excerpts(self):
+        summary = summarize_turns(FakeSummaryClient(fail=True), "Earlier: Article 517.", turn(3))
+        self.assertTrue(summary.startswith("Earlier: Article 517."))
+        self.assertIn("user: Question 3 about Article 203?", summary)
+        self.assertLessEqual(len(summary), rag_chat.SUMMARY_MAX_TOKENS * 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+import unittest
+import os
+import sys
+import io
+import tempfile
+import shutil
+import time
+from contextlib import redirect_stdout
+
+# Ensure imports work (Add root)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from app.rag_core import rag_engine
+from app.rag_core.rag_engine import RAGEngine, ExtractionError
+from app.rag_core.embedding_providers import HashingEmbeddingProvider
+from app.rag_core.embedding_cache import QueryEmbeddingCache
+from app.rag_core.document_readers import PdfReader
+from tools.tests.verify_document_readers import write_pdf
+
+read_pdf_pages = rag_engine.read_pdf_pages
+
+def slow_or_crashing_pdf_pages(path, start, stop):
+    """read_pdf_pages that kills its worker process on crash*.pdf; each window takes at least 50ms."""
+    if os.path.basename(path).startswith("crash"):
+        os._exit(1)
+    time.sleep(0.05)
+    yield from read_pdf_pages(path, start, stop)
+
+class RecordingProvider(HashingEmbeddingProvider):
+    """Offline embeddings that log each embed call into a shared event list."""
+    def __init__(self, events, **kwargs):
+        super().__init__(dim=32, **kwargs)
+        self.events = events
+
+    def embed(self, texts):
+        self.events.append(("embed", len(texts)))
+        return super().embed(texts)
+
+def pages(n, events=None, fail_at=None):
+    """n page segments of distinct text, logging each read; raises ExtractionError at page `fail_at`."""
+    for page in range(1, n + 1):
+        if page == fail_at:
+            raise ExtractionError("truncated PDF")
+        if events is not None:
+            events.append(("read", page))
+        yield f"Page {page}. " + f"Receptacle spacing rule {page} applies to dwelling units. " * 40 + "\n", {"page": page}
+
+class TestRAGEngine(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = rag_engine.CACHE_DIR
+        self.window = rag_engine.INDEX_WINDOW_CHUNKS
+        self.get_query_cache = rag_engine.get_query_cache
+        rag_engine.CACHE_DIR = self.tmp_dir
+        rag_engine.get_query_cache = lambda: QueryEmbeddingCache(os.path.join(self.tmp_dir, "queries.sqlite"))
+        self.events = []
+        self.engine = RAGEngine(embedding_provider=RecordingProvider(self.events))
+
+    def tearDown(self):
+        self.engine.store.conn.close()
+        rag_engine.CACHE_DIR = self.cache_dir
+        rag_engine.get_query_cache = self.get_query_cache
+        rag_engine.INDEX_WINDOW_CHUNKS = self.window
+        rag_engine.read_pdf_pages = read_pdf_pages
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_chunk_text_streams_and_keeps_page_metadata(self):
+        consumed = []
+        def segments():
+            for text, location in pages(40):
+                consumed.append(location["page"])
+                yield text, location
+
+        stream = RAGEngine.chunk_text(segments())
+        first, meta = next(stream)
+        # Only the pages under the first window have been read
+        self.assertLessEqual(len(consumed), 3)
+        self.assertEqual(meta["page_start"], 1)
+        chunks = [(first, meta)] + list(stream)
+
+        whole = "".join(text for text, _ in pages(40))
+        self.assertEqual([c for c, _ in chunks], [c for c, _ in RAGEngine.chunk_text(whole)])
+        starts = [0]
+        for text, _ in pages(40):
+            starts.append(starts[-1] + len(text))
+        offset = 0
+        for chunk, meta in chunks:
+            covered = [p for p in range(1, 41) if starts[p - 1] < offset + len(chunk) and starts[p] > offset]
+            self.assertEqual((meta["page_start"], meta["page_end"]), (covered[0], covered[-1]))
+            offset += 1200  # chunk_size - overlap
+
+    def test_chunk_text_keeps_row_ranges(self):
+        groups = [("| size | amps |\n" + "| 12 AWG | 20 |\n" * 100, {"row_start": r, "row_end": r + 99})
+                  for r in range(1, 1001, 100)]
+        chunks = list(RAGEngine.chunk_text(iter(groups)))
+        self.assertEqual(chunks[0][1], {"row_start": 1, "row_end": 100})
+        self.assertEqual(chunks[-1][1]["row_end"], 1000)
+        for _, meta in chunks:
+            self.assertLessEqual(meta["row_start"], meta["row_end"])
+            self.assertLessEqual(meta["row_end"] - meta["row_start"], 199)
+
+    def test_documents_are_embedded_and_appended_window_by_window(self):
+        rag_engine.INDEX_WINDOW_CHUNKS = 8
+        info = {"path": os.path.join(self.tmp_dir, "nec.pdf"), "size": 1, "mtime": 1.0, "content_hash": "v1"}
+        indexed = self.engine._index_document(info, pages(60, self.events))
+
+        self.assertEqual(indexed, self.engine.store.live_count())
+        self.assertGreater(indexed, 24)
+        embeds = [n for kind, n in self.events if kind == "embed"]
+        self.assertTrue(all(n <= 8 for n in embeds))
+        self.assertEqual(sum(embeds), indexed)
+        # The first window is embedded long before the document has been read
+        first_embed = self.events.index(("embed", 8))
+        self.assertLess(first_embed, 10)
+        self.assertEqual(self.engine.store.file_state(info["path"])["content_hash"], "v1")
+        records = self.engine.retrieve("Receptacle spacing rule 59", k=1)
+        self.assertEqual(records[0]["source"], "nec.pdf")
+
+    def test_failed_read_keeps_the_previous_version(self):
+        rag_engine.INDEX_WINDOW_CHUNKS = 8
+        info = {"path": os.path.join(self.tmp_dir, "nec.pdf"), "size": 1, "mtime": 1.0, "content_hash": "v1"}
+        self.engine._index_document(info, pages(30))
+        before = sorted(row for row, _ in self.engine.store.rows_for_path(info["path"]))
+
+        edited = dict(info, content_hash="v2")
+        with self.assertRaises(ExtractionError):
+            self.engine._index_document(edited, pages(30, fail_at=20))
+        # Windows written before the failure are dropped; the old rows stay live
+        self.assertEqual(sorted(row for row, _ in self.engine.store.rows_for_path(info["path"])), before)
+        self.assertEqual(self.engine.store.live_count(), len(before))
+        self.assertEqual(self.engine.store.file_state(info["path"])["content_hash"], "v1")
+
+        # Re-indexing the same text reuses every vector and replaces the old rows
+        self.events.clear()
+        self.assertEqual(self.engine._index_document(edited, pages(30)), len(before))
+        self.assertEqual(sum(n for kind, n in self.events if kind == "embed"), 0)
+        self.assertEqual(self.engine.store.live_count(), len(before))
+
+    def write_library(self):
+        """good.pdf (60 pages), crash.pdf (kills its worker), bad.pdf (not a PDF), late.pdf (30 pages), notes.txt."""
+        paths = {}
+        for name, n_pages in (("good.pdf", 60), ("crash.pdf", 5), ("late.pdf", 30)):
+            paths[name] = os.path.join(self.tmp_dir, name)
+            write_pdf(paths[name], [f"{name} page {i} receptacle spacing rule {i} applies" for i in range(1, n_pages + 1)])
+        paths["bad.pdf"] = os.path.join(self.tmp_dir, "bad.pdf")
+        with open(paths["bad.pdf"], 'w') as f:
+            f.write("not a pdf")
+        paths["notes.txt"] = os.path.join(self.tmp_dir, "notes.txt")
+        with open(paths["notes.txt"], 'w') as f:
+            f.write("Grounding electrode conductor notes. " * 200)
+        # Worker processes are forked after this, so they inherit the patched reader
+        rag_engine.read_pdf_pages = slow_or_crashing_pdf_pages
+        return paths
+
+    @unittest.skipIf(PdfReader is None, "pypdf not installed")
+    def test_extract_stream_isolates_failing_and_crashing_pdfs(self):
+        paths = self.write_library()
+        order = ["good.pdf", "crash.pdf", "bad.pdf", "late.pdf", "notes.txt"]
+        results = {}
+        for file_info, document in self.engine._extract_stream([{"path": paths[n]} for n in order], workers=2):
+            name = os.path.basename(file_info["path"])
+            try:
+                results[name] = (len(list(document)), None, document.seconds)
+            except ExtractionError as e:
+                results[name] = (None, str(e), document.seconds)
+
+        self.assertEqual(list(results), order)
+        self.assertEqual(results["good.pdf"][:2], (60, None))
+        self.assertEqual(results["late.pdf"][:2], (30, None))
+        self.assertIn("worker process died", results["crash.pdf"][1])
+        self.assertIsNotNone(results["bad.pdf"][1])
+        self.assertGreater(results["notes.txt"][0], 0)
+        # Extraction time is the workers' time per window, not the time spent waiting on them
+        self.assertGreaterEqual(results["good.pdf"][2], 3 * 0.05)
+        self.assertLess(results["good.pdf"][2], 3 * 0.05 + 2.0)
+        self.assertGreaterEqual(results["late.pdf"][2], 2 * 0.05)
+        self.assertEqual(results["crash.pdf"][2], 0.0)
+
+    @unittest.skipIf(PdfReader is None, "pypdf not installed")
+    def test_ingest_reports_failures_and_indexes_the_rest(self):
+        paths = self.write_library()
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.engine.ingest_files(list(paths.values()), workers=2)
+        log = output.getvalue()
+
+        self.assertIn("Failed crash.pdf after 0.00s: worker process died", log)
+        self.assertIn("Failed bad.pdf after", log)
+        self.assertRegex(log, r"Indexed good\.pdf: \d+ chunks, \d+\.\d\ds extracting")
+        self.assertIn("Saved progress after 5/5 files.", log)
+        self.assertRegex(log, r"Extraction: 5 files, .* with 2 workers\. Slowest: good\.pdf")
+        self.assertEqual(self.engine.store.tracked_files(), {paths["good.pdf"], paths["late.pdf"], paths["notes.txt"]})
+
+    def test_missing_key_without_a_provider_fails_clearly(self):
+        saved = os.environ.pop("OPENAI_API_KEY", None)
+        load_dotenv = rag_engine.load_dotenv
+        rag_engine.load_dotenv = lambda path: None
+        try:
+            with self.assertRaisesRegex(RuntimeError, "OPENAI_API_KEY"):
+                RAGEngine()
+        finally:
+            rag_engine.load_dotenv = load_dotenv
+            if saved is not None:
+                os.environ["OPENAI_API_KEY"] = saved
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import unittest
+import os
+import sys
+
+# Ensure imports work (Add root)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+
+from app.rag_core.sections import HEADING_PATTERN, SectionTracker, query_section_filter, MAJOR, MINOR, TABLE
+from tools.admin import ingest_books
+from tools.admin.ingest_books import ParentChildSplitter, ChunkState, MIN_PARENT_TOKENS, PARENT_CHUNK_SIZE
+
+def track(text):
+    """(kind, metadata) after each heading of `text`."""
+    tracker = SectionTracker()
+    updates = [(tracker.update(m), tracker.metadata()) for m in HEADING_PATTERN.finditer(text)]
+    return [(kind, meta) for kind, meta in updates if kind]
+
+class ByteEncoder:
+    """Offline stand-in for the tiktoken encoding: one token per byte of ASCII text."""
+    def encode_ordinary(self, text):
+        return list(text.encode('ascii'))
+
+    def decode(self, tokens):
+        return bytes(tokens).decode('ascii')
+
+FILLER = "The installation shall comply with the listing and labeling of the equipment. "
+# Wrapped PDF lines: cross-references land at the start of lines inside Article 517
+ARTICLE_517 = ("ARTICLE 517\nHealth Care Facilities\n"
+               "517.13 Grounding of Receptacles. " + FILLER * 3 + "Wiring shall comply with\n"
+               "Article 250, Part VI, and the equipment grounding conductor shall be sized per\n"
+               "Table 250.122 for sizing and protected where required by\n"
+               "210.8 Ground-Fault Circuit-Interrupter Protection for Personnel.\n" + FILLER * 2 + "\n"
+               "Table 517.13 Grounding Conductors\nA | B\n1 | 2\n"
+               "517.14 Panelboard Bonding. " + FILLER * 4 + "\n")
+ARTICLE_518 = "ARTICLE 518\nAssembly Occupancies\n518.2 Definitions. " + FILLER * 40 + "\n"
+
+class TestSections(unittest.TestCase):
+    def test_nec_articles_sections_and_tables(self):
+        text = ("ARTICLE 517\nHealth Care Facilities\n"
+                "517.13 Grounding of Receptacles and Fixed Electrical Equipment in Patient Care Spaces.\n"
+                "Wiring shall comply with 517.13(A) and (B).\n"
+                "Table 517.13 Grounding Conductors\n"
+                "517.14 Panelboard Bonding.\n"
+                "ARTICLE 518\nAssembly Occupancies\n"
+                "518.2 Definitions.\n")
+        kinds, metas = zip(*track(text))
+        self.assertEqual(kinds, (MAJOR, MINOR, TABLE, MINOR, MAJOR, MINOR))
+        self.assertEqual(metas[1], {"section_path": "Article 517 > 517.13", "article": "517", "table_number": ""})
+        self.assertEqual(metas[2]["table_number"], "517.13")
+        self.assertEqual(metas[3]["section_path"], "Article 517 > 517.14")
+        self.assertEqual(metas[5], {"section_path": "Article 518 > 518.2", "article": "518", "table_number": ""})
+
+    def test_cross_references_keep_the_article(self):
+        text = ("ARTICLE 220\nBranch-Circuit, Feeder, and Service Load Calculations\n"
+                "220.12 Lighting Load. Receptacles shall have GFCI protection, see 210.8 and\n"
+                "210.8 Ground-Fault Circuit-Interrupter Protection for Personnel where required.\n"
+                "220.14 Other Loads.\n")
+        tracker = SectionTracker()
+        kinds = []
+        for match in HEADING_PATTERN.finditer(text):
+            kinds.append(tracker.update(match))
+            self.assertEqual(tracker.metadata()["article"], "220")
+        # The line-start "210.8" is not a heading of Article 220: no break, no state change
+        self.assertEqual(kinds, [MAJOR, MINOR, None, MINOR])
+        self.assertEqual(tracker.metadata()["section_path"], "Article 220 > 220.14")
+
+    def test_nec_section_without_article_heading(self):
+        _, meta = track("220.12 Lighting Load for Non-Dwelling Occupancies.\n")[0]
+        self.assertEqual((meta["article"], meta["section_path"]), ("220", "Article 220 > 220.12"))
+
+    def test_nested_decimal_ufc_and_fgi_numbering(self):
+        metas = [m for _, m in track("CHAPTER 4 Fundamentals\n4.3 Risk\n4.3.2 Category 2\n4.4 Gas\n")]
+        self.assertEqual(metas[2]["section_path"], "Chapter 4 > 4.3 > 4.3.2")
+        self.assertEqual(metas[3]["section_path"], "Chapter 4 > 4.4")
+        self.assertEqual(metas[3]["article"], "")
+
+        metas = [m for _, m in track("3-2 GENERAL\n3-2.1 Voltage Drop\nTable 3-1 Demand Factors\n")]
+        self.assertEqual(metas[1]["section_path"], "3-2 > 3-2.1")
+        self.assertEqual(metas[2]["table_number"], "3-1")
+
+        metas = [m for _, m in track("2.1-8 Building Systems\n2.1-8.3.2 Electrical\nTable 2.1-2 Lighting\n")]
+        self.assertEqual(metas[1]["section_path"], "2.1-8 > 2.1-8.3.2")
+        self.assertEqual(metas[2]["table_number"], "2.1-2")
+
+    def test_headings_only_at_line_start(self):
+        self.assertEqual(track("See Table 220.12 and Article 517 for 517.13 Rules.\n"), [])
+        self.assertEqual(track("The 3.5 kVA load\n"), [])
+
+    def test_wrapped_cross_references_are_not_headings(self):
+        metas = track("Article 250, Part VI\nChapter 4 of NFPA 99\nTable 250.122 for sizing\n")
+        self.assertEqual(metas, [])
+        kinds, metas = zip(*track("Table 220.12\nTABLE 220.12 GENERAL LIGHTING LOADS\nTable 3-1 Demand Factors\n"))
+        self.assertEqual(kinds, (TABLE, TABLE, TABLE))
+        self.assertEqual(metas[2]["table_number"], "3-1")
+
+        kinds, metas = zip(*track(ARTICLE_517))
+        self.assertEqual(kinds, (MAJOR, MINOR, TABLE, MINOR))
+        self.assertEqual(metas[-1], {"section_path": "Article 517 > 517.14", "article": "517", "table_number": ""})
+
+    def test_splitter_tags_and_aligns_around_cross_references(self):
+        get_encoder = ingest_books.get_encoder
+        ingest_books.get_encoder = lambda model_name: ByteEncoder()
+        try:
+            splitter = ParentChildSplitter(align_sections=True)
+        finally:
+            ingest_books.get_encoder = get_encoder
+        self.assertTrue(MIN_PARENT_TOKENS < len(ARTICLE_517) < PARENT_CHUNK_SIZE)
+
+        # ChunkState after Article 517: only its real headings are kept, nothing is cut yet
+        state = ChunkState("nfpa70.pdf", "code")
+        parents, chunks = splitter.feed_segments(state, [(ARTICLE_517, {"page": 1})])
+        self.assertEqual((parents, chunks), ([], []))
+        self.assertEqual([kind for kind, _ in state.headings], [MAJOR, MINOR, TABLE, MINOR])
+        self.assertEqual(state.section_metadata(0, state.total)["article"], "517")
+        caption = ARTICLE_517.index("Table 517.13")
+        self.assertEqual(state.section_metadata(caption - 50, caption + 50)["table_number"], "517.13")
+        self.assertEqual(state.section_metadata(0, caption - 1)["table_number"], "")
+
+        parents, chunks = splitter.feed_segments(state, [(ARTICLE_518, {"page": 2})])
+        last_parents, last_chunks = splitter.finish_chunking(state)
+        parents, chunks = parents + last_parents, chunks + last_chunks
+        self.assertEqual((parents, chunks), splitter.create_parent_child_chunks_from_segments(
+            [(ARTICLE_517, {"page": 1}), (ARTICLE_518, {"page": 2})], "nfpa70.pdf", "code"))
+
+        # The first parent is all of Article 517: cut at the ARTICLE heading, not at a cross-reference
+        self.assertEqual(parents[0]["text"], ARTICLE_517)
+        self.assertTrue(parents[1]["text"].startswith("ARTICLE 518"))
+        for chunk in chunks:
+            meta = chunk["metadata"]
+            self.assertEqual(meta["article"], "517" if meta["parent_index"] == 0 else "518", meta)
+            self.assertNotEqual(meta["table_number"], "250.122")
+            self.assertEqual(meta["page_start"], 1 if meta["parent_index"] == 0 else 2)
+            if "Table 517.13 Grounding" in chunk["text"]:
+                self.assertEqual(meta["table_number"], "517.13")
+        self.assertTrue(any(c["metadata"]["section_path"] == "Article 517 > 517.14" for c in chunks))
+
+    def test_query_filters(self):
+        self.assertEqual(query_section_filter("What does Table 220.12 say about offices?"), {"table_number": "220.12"})
+        self.assertEqual(query_section_filter("table 310.15(b)(16) ampacity"), {"table_number": "310.15(B)(16)"})
+        self.assertEqual(query_section_filter("Explain Article 517 grounding"), {"article": "517"})
+        self.assertEqual(query_section_filter("What does section 210.8 require?"), {"article": "210"})
+        self.assertIsNone(query_section_filter("How do I size a 120.5 A feeder?"))
+
+if __name__ == '__main__':
+    unittest.main()